@@ -27,9 +27,21 @@ def create_app() -> Flask:
     db.init_app(app)
     migrate.init_app(app, db)
 
+    from models import sqlite_pragmas
+
+    sqlite_pragmas.init_app(app)
+
     login_manager.init_app(app)
     login_manager.login_view = "auth.login_get"
 
+    from services import sessions
+
+    sessions.init_app(app)
+
+    from models import tenancy
+
+    tenancy.init_app(app)
+
     # -------------------------
     # Importar modelos (Alembic)
     # -------------------------
@@ -42,8 +54,11 @@ def create_app() -> Flask:
     from models.system_role import SystemUserRole  # noqa: F401
 
     from models.inventory import Inventory  # noqa: F401
-    from models.kardex import KardexMovement  # noqa: F401
+    from models.kardex import KardexArchivePeriod, KardexMovement, KardexMovementArchive  # noqa: F401
+    from models.inventory_analytics import InventoryAnalyticsSnapshot  # noqa: F401
+    from models.valuation import InventoryValuation, InventoryValuationSnapshot  # noqa: F401
     from models.sale import Sale, SaleItem  # noqa: F401
+    from models.sale_rollup import SaleProductDaily  # noqa: F401
 
     # Offline-first sync
     from models.sync_event import SyncEvent  # noqa: F401
@@ -55,6 +70,7 @@ def create_app() -> Flask:
 
     # Inventario avanzado
     from models.stock_transfer import StockTransfer, StockTransferItem  # noqa: F401
+    from models.stock_count import StockCount, StockCountLine  # noqa: F401
 
     # -------------------------
     # Blueprints
@@ -110,6 +126,13 @@ def create_app() -> Flask:
     for bp in blueprints:
         app.register_blueprint(bp)
 
+    # -------------------------
+    # Comandos CLI (flask ...)
+    # -------------------------
+    from commands import register_commands
+
+    register_commands(app)
+
     # -------------------------
     # Logging + manejo global de errores
     # -------------------------
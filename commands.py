@@ -0,0 +1,234 @@
+import click
+from flask import Flask
+
+from models import db, tenancy
+
+
+def register_commands(app: Flask) -> None:
+    """Comandos de mantenimiento: `flask <comando>`."""
+
+    @app.cli.command("rollups-rebuild")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    def rollups_rebuild(company_id):
+        """Reconstruye sale_product_daily desde sale_items."""
+        from models.company import Company
+        from services.rollups import rebuild_product_daily
+
+        if not tenancy.enabled():
+            n = rebuild_product_daily(db.session, company_id=company_id)
+            db.session.commit()
+            click.echo(f"✅ Rollup reconstruido: {n} filas.")
+            return
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = rebuild_product_daily(db.session, company_id=cid)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} filas.")
+
+    @app.cli.command("inventory-analytics")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas las activas).")
+    @click.option("--window-days", type=click.IntRange(min=1), default=90, show_default=True, help="Ventana de ventas para ABC/cobertura.")
+    @click.option("--dead-days", type=click.IntRange(min=1), default=60, show_default=True, help="Días sin SALE_OUT para marcar stock muerto.")
+    def inventory_analytics(company_id, window_days, dead_days):
+        """Recalcula la foto ABC / stock muerto / cobertura por ubicación."""
+        from models.company import Company
+        from services.inventory_analytics import compute_snapshot
+
+        if company_id:
+            company_ids = [company_id]
+        else:
+            company_ids = [c.id for c in db.session.query(Company.id).filter(Company.is_active == True)]
+
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = compute_snapshot(db.session, company_id=cid, window_days=window_days, dead_days=dead_days)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} filas.")
+
+    @app.cli.command("valuation-snapshot")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas las activas).")
+    @click.option("--label", default=None, help="Etiqueta (default: YYYY-MM del día anterior, útil para cierre de mes).")
+    def valuation_snapshot(company_id, label):
+        """Guarda una foto del inventario valorizado (programar a fin de mes)."""
+        from datetime import date, timedelta
+
+        from models.company import Company
+        from services.valuation import take_snapshot
+
+        label = label or (date.today() - timedelta(days=1)).strftime("%Y-%m")
+        if company_id:
+            company_ids = [company_id]
+        else:
+            company_ids = [c.id for c in db.session.query(Company.id).filter(Company.is_active == True)]
+
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                snap = take_snapshot(db.session, company_id=cid, label=label)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: foto {snap.id} valor={snap.value_total}")
+
+    @app.cli.command("valuation-rebuild")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    def valuation_rebuild(company_id):
+        """Recalcula los totales valorizados en vivo desde inventories."""
+        from models.company import Company
+        from services.valuation import rebuild
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = rebuild(db.session, company_id=cid)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} ubicaciones.")
+
+    @app.cli.command("costing-recompute")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    def costing_recompute(company_id):
+        """Recalcula el costo promedio ponderado reproduciendo el kardex (backfill)."""
+        from models.company import Company
+        from services.costing import recompute
+        from services.valuation import rebuild
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = recompute(db.session, company_id=cid)
+                rebuild(db.session, company_id=cid)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} movimientos reprocesados.")
+
+    @app.cli.command("kardex-rebuild-balances")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    def kardex_rebuild_balances(company_id):
+        """Recalcula el saldo después de cada movimiento del kardex."""
+        from models.company import Company
+        from services.stock import rebuild_balances
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = rebuild_balances(db.session, company_id=cid)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} movimientos.")
+
+    @app.cli.command("kardex-archive")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    @click.option("--keep-months", type=int, default=12, show_default=True, help="Meses que quedan en la tabla viva (además del actual).")
+    def kardex_archive_cmd(company_id, keep_months):
+        """Mueve los meses cerrados del kardex al archivo y deja saldos iniciales (OPENING)."""
+        from datetime import date
+
+        from models.company import Company
+        from services.kardex_archive import archive_before
+
+        today = date.today()
+        months = today.year * 12 + (today.month - 1) - max(keep_months, 0)
+        cutoff = date(months // 12, months % 12 + 1, 1)
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                n = archive_before(db.session, company_id=cid, cutoff=cutoff)
+                db.session.commit()
+                click.echo(f"Empresa {cid}: {n} movimientos archivados (antes de {cutoff}).")
+
+    @app.cli.command("kardex-reconcile")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    @click.option("--fix", is_flag=True, default=False, help="Escribe movimientos ADJUST que cuadran el kardex con el inventario.")
+    @click.option("--show", type=int, default=20, show_default=True, help="Diferencias a listar por empresa.")
+    def kardex_reconcile(company_id, fix, show):
+        """Concilia inventories contra el neto del kardex (pensado para correr de noche)."""
+        from models.company import Company
+        from services.reconcile import find_drift, write_corrections
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id)]
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                drift = find_drift(db.session, company_id=cid)
+                click.echo(f"Empresa {cid}: {len(drift)} diferencias.")
+                for d in drift[:show]:
+                    click.echo(
+                        f"  producto={d['product_id']} ubicación={d['location_id']} "
+                        f"inventario={d['inventory_qty']} kardex={d['kardex_qty']} diff={d['diff']}"
+                    )
+                if fix and drift:
+                    n = write_corrections(db.session, company_id=cid, drift=drift)
+                    db.session.commit()
+                    click.echo(f"  {n} ajustes escritos.")
+
+    @app.cli.command("replenishment-plan")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas las activas).")
+    @click.option("--window-days", type=int, default=28, show_default=True, help="Ventana de ventas para la venta diaria.")
+    @click.option("--cover-days", type=int, default=14, show_default=True, help="Días de cobertura objetivo por sucursal.")
+    @click.option("--create", is_flag=True, default=False, help="Crea las transferencias en borrador (default: solo muestra).")
+    def replenishment_plan(company_id, window_days, cover_days, create):
+        """Propone transferencias bodega → sucursales según la venta (job batch)."""
+        from models.branch import Branch
+        from models.company import Company
+        from services.replenishment import create_drafts, plan
+
+        if company_id:
+            company_ids = [company_id]
+        else:
+            company_ids = [c.id for c in db.session.query(Company.id).filter(Company.is_active == True)]
+
+        for cid in company_ids:
+            with tenancy.scope(cid):
+                warehouses = [
+                    b.id for b in db.session.query(Branch.id).filter(
+                        Branch.company_id == cid, Branch.is_active == True, Branch.is_warehouse == True
+                    ).order_by(Branch.id.asc())
+                ]
+                if not warehouses:
+                    click.echo(f"Empresa {cid}: sin bodega activa.")
+                    continue
+                lines = plan(db.session, company_id=cid, warehouse_id=warehouses[0], window_days=window_days, cover_days=cover_days)
+                click.echo(f"Empresa {cid}: {len(lines)} líneas en {len({ln['branch_id'] for ln in lines})} sucursales.")
+                if create and lines:
+                    ids = create_drafts(db.session, company_id=cid, warehouse_id=warehouses[0], lines=lines)
+                    db.session.commit()
+                    click.echo(f"  Borradores: {', '.join(f'#{i}' for i in ids)}")
+
+    @app.cli.command("sessions-sweep")
+    def sessions_sweep():
+        """Borra las sesiones vencidas del backend del lado del servidor."""
+        from services import sessions
+
+        n = sessions.sweep(app)
+        click.echo(f"{n} sesiones vencidas borradas.")
+
+
+    @app.cli.command("tenants-migrate")
+    @click.option("--company-id", type=int, default=None, help="Solo una empresa (default: todas).")
+    def tenants_migrate(company_id):
+        """Aplica las migraciones Alembic a la base de cada empresa (TENANT_DB_MODE=per_company)."""
+        from models.company import Company
+
+        if not tenancy.enabled():
+            click.echo("TENANT_DB_MODE no es per_company: usa `flask db upgrade`.")
+            return
+
+        company_ids = [company_id] if company_id else [c.id for c in db.session.query(Company.id).order_by(Company.id)]
+        for cid in company_ids:
+            tenancy.migrate_tenant(cid, app)
+            click.echo(f"Empresa {cid}: {tenancy.tenant_path(cid, app)} al día.")
+
+
+    @app.cli.command("sqlite-bench")
+    @click.option("--profiles", default="default,production", show_default=True, help="Perfiles a comparar (coma).")
+    @click.option("--tills", type=int, default=4, show_default=True, help="Cajas cobrando a la vez.")
+    @click.option("--sales", "sales_per_till", type=int, default=100, show_default=True, help="Ventas por caja.")
+    @click.option("--readers", type=int, default=1, show_default=True, help="Hilos leyendo reportes.")
+    def sqlite_bench(profiles, tills, sales_per_till, readers):
+        """Compara perfiles de PRAGMAs de SQLite con varias cajas vendiendo a la vez (archivos temporales)."""
+        from services.sqlite_bench import run_profile
+
+        for profile in [p.strip() for p in profiles.split(",") if p.strip()]:
+            r = run_profile(profile, tills=tills, sales_per_till=sales_per_till, readers=readers)
+            click.echo(
+                f"{r['profile']:<11} ventas={r['sales']:>5} bloqueadas={r['locked']:>4} "
+                f"ventas/s={r['sales_per_sec']:>7.1f} p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms "
+                f"lecturas={r['reads']}"
+            )
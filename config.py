@@ -11,9 +11,44 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # PRAGMAs al conectar (models/sqlite_pragmas.py): "production" (WAL, busy_timeout,
+    # synchronous=NORMAL, cache/mmap, temp_store=MEMORY) o "default" (los de SQLite).
+    # Cada PRAGMA se puede pisar con SQLITE_<NOMBRE>, p.ej. SQLITE_SYNCHRONOUS=FULL.
+    SQLITE_PROFILE = os.environ.get("SQLITE_PROFILE", "production")
+    SQLITE_PRAGMAS = {
+        name: os.environ[f"SQLITE_{name.upper()}"]
+        for name in ("journal_mode", "busy_timeout", "synchronous", "cache_size", "mmap_size", "temp_store")
+        if f"SQLITE_{name.upper()}" in os.environ
+    }
+
+    # "shared": una sola base. "per_company": un SQLite por empresa en TENANT_DB_DIR
+    # y la base principal como catálogo (usuarios, empresas, sucursales, membresías).
+    TENANT_DB_MODE = os.environ.get("TENANT_DB_MODE", "shared")
+    TENANT_DB_DIR = os.environ.get("TENANT_DB_DIR", os.path.join(basedir, "tenants"))
+
     # Dashboard / Inventario
     STOCK_LOW_THRESHOLD = int(os.environ.get("STOCK_LOW_THRESHOLD", "5"))
 
+    # Hash de contraseñas (formato Werkzeug, ej: "scrypt:32768:8:1" o "pbkdf2:sha256:600000").
+    # Al cambiarlo, cada usuario se re-hashea solo en su próximo login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+
+    # Segundos que load_user reutiliza la fila del usuario sin ir a la base
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "30"))
+
+    # Segundos que la sesión reutiliza la lista de contextos (empresa/sucursal/rol)
+    # del selector; los cambios en admin la invalidan antes solo en el mismo proceso,
+    # así que el TTL acota lo desfasado entre procesos (como el cache de authz)
+    CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", "60"))
+
+    # Sesión: "sqlite" (archivo local, varios procesos), "memory" (un solo proceso)
+    # o "cookie" (cookie firmada de Flask). Con los dos primeros la cookie lleva solo el id.
+    SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+    # Sin valor: <instance_path>/sessions.db (fuera del árbol del código)
+    SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH")
+    SESSION_TTL = int(os.environ.get("SESSION_TTL", str(24 * 3600)))
+    SESSION_SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", "600"))
+
     # Cookies de sesión más seguras (ajusta en producción)
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = "Lax"
@@ -11,7 +11,9 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+# (No al migrar bases de empresa desde la app: reconfiguraría sus loggers.)
+if config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name)
 logger = logging.getLogger('alembic.env')
 
 
@@ -94,9 +96,7 @@ def run_migrations_online():
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
 
-    connectable = get_engine()
-
-    with connectable.connect() as connection:
+    def _run(connection):
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -106,6 +106,15 @@ def run_migrations_online():
         with context.begin_transaction():
             context.run_migrations()
 
+    # `flask tenants-migrate` pasa la conexión de la base de cada empresa
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+
+    with get_engine().connect() as connection:
+        _run(connection)
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,54 @@
+"""inventory analytics snapshots (ABC / dead stock / coverage)
+
+Revision ID: f0c0analytics10
+Revises: f0c0rollups09
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0analytics10"
+down_revision = "f0c0rollups09"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inventory_analytics_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("location_type", sa.String(length=20), nullable=False),
+        sa.Column("location_id", sa.Integer(), nullable=False),
+        sa.Column("abc_class", sa.String(length=1), nullable=False),
+        sa.Column("revenue", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("qty_sold", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("qty_on_hand", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("avg_daily_sales", sa.Numeric(precision=14, scale=4), nullable=False),
+        sa.Column("coverage_days", sa.Numeric(precision=14, scale=1), nullable=True),
+        sa.Column("last_sale_at", sa.DateTime(), nullable=True),
+        sa.Column("is_dead_stock", sa.Boolean(), nullable=False),
+        sa.Column("window_days", sa.Integer(), nullable=False),
+        sa.Column("dead_days", sa.Integer(), nullable=False),
+        sa.Column("computed_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"]),
+        sa.ForeignKeyConstraint(["location_id"], ["branches.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("inventory_analytics_snapshots") as batch_op:
+        batch_op.create_index(
+            "ix_inv_analytics_company_location_class", ["company_id", "location_id", "abc_class"], unique=False
+        )
+        batch_op.create_index(
+            "ix_inv_analytics_company_location_dead", ["company_id", "location_id", "is_dead_stock"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("inventory_analytics_snapshots") as batch_op:
+        batch_op.drop_index("ix_inv_analytics_company_location_dead")
+        batch_op.drop_index("ix_inv_analytics_company_location_class")
+    op.drop_table("inventory_analytics_snapshots")
@@ -0,0 +1,50 @@
+"""moving-average cost state on inventories
+
+Revision ID: f0c0costing12
+Revises: f0c0valuation11
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0costing12"
+down_revision = "f0c0valuation11"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("inventories") as batch_op:
+        batch_op.add_column(sa.Column("avg_cost", sa.Numeric(14, 4), nullable=False, server_default="0"))
+        batch_op.add_column(sa.Column("stock_value", sa.Numeric(16, 2), nullable=False, server_default="0"))
+
+    # Arranque: el stock existente queda al costo actual del producto.
+    # Para reconstruir desde el kardex: `flask costing-recompute`.
+    op.execute(
+        """
+        UPDATE inventories
+        SET avg_cost = COALESCE((SELECT p.cost_price FROM products p WHERE p.id = inventories.product_id), 0),
+            stock_value = CASE WHEN qty > 0 THEN ROUND(qty * COALESCE(
+                (SELECT p.cost_price FROM products p WHERE p.id = inventories.product_id), 0), 2) ELSE 0 END
+        """
+    )
+
+    # Totales valorizados alineados con el nuevo valor por inventario
+    op.execute(
+        """
+        UPDATE inventory_valuations
+        SET value_total = COALESCE((
+            SELECT SUM(i.stock_value) FROM inventories i
+            WHERE i.company_id = inventory_valuations.company_id
+              AND i.location_type = inventory_valuations.location_type
+              AND i.location_id = inventory_valuations.location_id
+        ), 0)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("inventories") as batch_op:
+        batch_op.drop_column("stock_value")
+        batch_op.drop_column("avg_cost")
@@ -0,0 +1,60 @@
+"""stock count sessions
+
+Revision ID: f0c0counts16
+Revises: f0c0kardexarch15
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0counts16"
+down_revision = "f0c0kardexarch15"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "stock_counts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("location_type", sa.String(length=20), nullable=False),
+        sa.Column("location_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("note", sa.String(length=255), nullable=True),
+        sa.Column("scan_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("lines_adjusted", sa.Integer(), nullable=True),
+        sa.Column("opened_by_user_id", sa.Integer(), nullable=True),
+        sa.Column("opened_at", sa.DateTime(), nullable=False),
+        sa.Column("closed_by_user_id", sa.Integer(), nullable=True),
+        sa.Column("closed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.ForeignKeyConstraint(["location_id"], ["branches.id"]),
+        sa.ForeignKeyConstraint(["opened_by_user_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["closed_by_user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("stock_counts") as batch_op:
+        batch_op.create_index("ix_stock_counts_company_status", ["company_id", "status", "location_id"], unique=False)
+
+    op.create_table(
+        "stock_count_lines",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("count_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("expected_qty", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("counted_qty", sa.Numeric(precision=14, scale=3), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["count_id"], ["stock_counts.id"]),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("count_id", "product_id", name="uq_stock_count_line_product"),
+    )
+
+
+def downgrade():
+    op.drop_table("stock_count_lines")
+    with op.batch_alter_table("stock_counts") as batch_op:
+        batch_op.drop_index("ix_stock_counts_company_status")
+    op.drop_table("stock_counts")
@@ -0,0 +1,71 @@
+"""kardex archive by period
+
+Revision ID: f0c0kardexarch15
+Revises: f0c0kardexloc14
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0kardexarch15"
+down_revision = "f0c0kardexloc14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "kardex_movements_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("period", sa.String(length=7), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("move_type", sa.String(length=20), nullable=False),
+        sa.Column("from_location_type", sa.String(length=20), nullable=True),
+        sa.Column("from_location_id", sa.Integer(), nullable=True),
+        sa.Column("to_location_type", sa.String(length=20), nullable=True),
+        sa.Column("to_location_id", sa.Integer(), nullable=True),
+        sa.Column("qty", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("unit_cost", sa.Numeric(precision=14, scale=4), nullable=True),
+        sa.Column("from_balance_after", sa.Numeric(precision=14, scale=3), nullable=True),
+        sa.Column("to_balance_after", sa.Numeric(precision=14, scale=3), nullable=True),
+        sa.Column("note", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("kardex_movements_archive") as batch_op:
+        batch_op.create_index("ix_kardex_arch_company_period", ["company_id", "period"], unique=False)
+        batch_op.create_index("ix_kardex_arch_company_product_date", ["company_id", "product_id", "created_at"], unique=False)
+        batch_op.create_index("ix_kardex_arch_company_from_date", ["company_id", "from_location_id", "created_at"], unique=False)
+        batch_op.create_index("ix_kardex_arch_company_to_date", ["company_id", "to_location_id", "created_at"], unique=False)
+        batch_op.create_index(
+            "ix_kardex_arch_product_from_date", ["company_id", "product_id", "from_location_id", "created_at"], unique=False
+        )
+        batch_op.create_index(
+            "ix_kardex_arch_product_to_date", ["company_id", "product_id", "to_location_id", "created_at"], unique=False
+        )
+
+    op.create_table(
+        "kardex_archive_periods",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.String(length=7), nullable=False),
+        sa.Column("moved_count", sa.Integer(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("company_id", "period", name="uq_kardex_archive_period"),
+    )
+
+
+def downgrade():
+    op.drop_table("kardex_archive_periods")
+    with op.batch_alter_table("kardex_movements_archive") as batch_op:
+        batch_op.drop_index("ix_kardex_arch_product_to_date")
+        batch_op.drop_index("ix_kardex_arch_product_from_date")
+        batch_op.drop_index("ix_kardex_arch_company_to_date")
+        batch_op.drop_index("ix_kardex_arch_company_from_date")
+        batch_op.drop_index("ix_kardex_arch_company_product_date")
+        batch_op.drop_index("ix_kardex_arch_company_period")
+    op.drop_table("kardex_movements_archive")
@@ -0,0 +1,67 @@
+"""kardex running balance per (product, location)
+
+Revision ID: f0c0kardexbal13
+Revises: f0c0costing12
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0kardexbal13"
+down_revision = "f0c0costing12"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("kardex_movements") as batch_op:
+        batch_op.add_column(sa.Column("from_balance_after", sa.Numeric(14, 3), nullable=True))
+        batch_op.add_column(sa.Column("to_balance_after", sa.Numeric(14, 3), nullable=True))
+        batch_op.create_index(
+            "ix_kardex_product_from_date", ["company_id", "product_id", "from_location_id", "created_at"], unique=False
+        )
+        batch_op.create_index(
+            "ix_kardex_product_to_date", ["company_id", "product_id", "to_location_id", "created_at"], unique=False
+        )
+
+    # Backfill: saldo = stock actual - movimientos posteriores (ventana por producto/ubicación).
+    # Cada movimiento aporta una "pierna" por ubicación: origen (-qty) y destino (+qty).
+    op.execute(
+        """
+        WITH legs AS (
+            SELECT id, company_id, product_id, from_location_id AS location_id, created_at, -qty AS delta, 'from' AS side
+            FROM kardex_movements WHERE from_location_id IS NOT NULL
+            UNION ALL
+            SELECT id, company_id, product_id, to_location_id, created_at, qty, 'to'
+            FROM kardex_movements WHERE to_location_id IS NOT NULL
+        ),
+        running AS (
+            SELECT l.id, l.side,
+                   COALESCE((SELECT SUM(i.qty) FROM inventories i
+                             WHERE i.company_id = l.company_id AND i.product_id = l.product_id
+                               AND i.location_id = l.location_id), 0)
+                   - SUM(l.delta) OVER (PARTITION BY l.company_id, l.product_id, l.location_id)
+                   + SUM(l.delta) OVER (
+                       PARTITION BY l.company_id, l.product_id, l.location_id
+                       ORDER BY l.created_at, l.id ROWS UNBOUNDED PRECEDING
+                   ) AS balance
+            FROM legs l
+        )
+        UPDATE kardex_movements
+        SET from_balance_after = COALESCE(
+                (SELECT r.balance FROM running r WHERE r.id = kardex_movements.id AND r.side = 'from'),
+                from_balance_after),
+            to_balance_after = COALESCE(
+                (SELECT r.balance FROM running r WHERE r.id = kardex_movements.id AND r.side = 'to'),
+                to_balance_after)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("kardex_movements") as batch_op:
+        batch_op.drop_index("ix_kardex_product_to_date")
+        batch_op.drop_index("ix_kardex_product_from_date")
+        batch_op.drop_column("to_balance_after")
+        batch_op.drop_column("from_balance_after")
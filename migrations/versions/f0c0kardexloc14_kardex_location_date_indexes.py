@@ -0,0 +1,39 @@
+"""kardex (company, location, created_at) indexes
+
+Revision ID: f0c0kardexloc14
+Revises: f0c0kardexbal13
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+
+revision = "f0c0kardexloc14"
+down_revision = "f0c0kardexbal13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Los índices por (company, tipo, ubicación) no cubren el rango de fechas;
+    # location_id ya identifica la ubicación, así que se reemplazan.
+    with op.batch_alter_table("kardex_movements") as batch_op:
+        batch_op.drop_index("ix_kardex_company_from")
+        batch_op.drop_index("ix_kardex_company_to")
+        batch_op.create_index(
+            "ix_kardex_company_from_date", ["company_id", "from_location_id", "created_at"], unique=False
+        )
+        batch_op.create_index(
+            "ix_kardex_company_to_date", ["company_id", "to_location_id", "created_at"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("kardex_movements") as batch_op:
+        batch_op.drop_index("ix_kardex_company_to_date")
+        batch_op.drop_index("ix_kardex_company_from_date")
+        batch_op.create_index(
+            "ix_kardex_company_from", ["company_id", "from_location_type", "from_location_id"], unique=False
+        )
+        batch_op.create_index(
+            "ix_kardex_company_to", ["company_id", "to_location_type", "to_location_id"], unique=False
+        )
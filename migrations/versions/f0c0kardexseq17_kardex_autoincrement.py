@@ -0,0 +1,39 @@
+"""kardex_movements AUTOINCREMENT (ids never reused after archiving)
+
+Revision ID: f0c0kardexseq17
+Revises: f0c0counts16
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0kardexseq17"
+down_revision = "f0c0counts16"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite solo admite AUTOINCREMENT al crear la tabla: batch la reconstruye
+    with op.batch_alter_table(
+        "kardex_movements", recreate="always", table_kwargs={"sqlite_autoincrement": True}
+    ) as batch_op:
+        batch_op.alter_column("id", existing_type=sa.Integer(), autoincrement=True)
+
+    # El contador arranca sobre todo id ya usado (tabla viva y archivo)
+    op.execute(
+        "DELETE FROM sqlite_sequence WHERE name = 'kardex_movements'"
+    )
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'kardex_movements', max("
+        "coalesce((SELECT max(id) FROM kardex_movements), 0), "
+        "coalesce((SELECT max(id) FROM kardex_movements_archive), 0))"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table(
+        "kardex_movements", recreate="always", table_kwargs={"sqlite_autoincrement": False}
+    ) as batch_op:
+        batch_op.alter_column("id", existing_type=sa.Integer(), autoincrement=False)
@@ -0,0 +1,55 @@
+"""sale_product_daily rollup for ranking reports
+
+Revision ID: f0c0rollups09
+Revises: f0c0clients08
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0rollups09"
+down_revision = "f0c0clients08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "sale_product_daily",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("branch_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("qty", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("amount", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("cost", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.ForeignKeyConstraint(["branch_id"], ["branches.id"]),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("company_id", "branch_id", "product_id", "day", name="uq_sale_product_daily"),
+    )
+    with op.batch_alter_table("sale_product_daily") as batch_op:
+        batch_op.create_index("ix_sale_product_daily_company_day", ["company_id", "day", "branch_id"], unique=False)
+
+    # Backfill desde ventas existentes
+    op.execute(
+        """
+        INSERT INTO sale_product_daily (company_id, branch_id, product_id, day, qty, amount, cost, updated_at)
+        SELECT s.company_id, s.branch_id, si.product_id, date(s.created_at),
+               COALESCE(SUM(si.qty), 0), COALESCE(SUM(si.subtotal), 0),
+               COALESCE(SUM(si.unit_cost * si.qty), 0), CURRENT_TIMESTAMP
+        FROM sale_items si
+        JOIN sales s ON s.id = si.sale_id
+        GROUP BY s.company_id, s.branch_id, si.product_id, date(s.created_at)
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("sale_product_daily") as batch_op:
+        batch_op.drop_index("ix_sale_product_daily_company_day")
+    op.drop_table("sale_product_daily")
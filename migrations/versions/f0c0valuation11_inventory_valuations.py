@@ -0,0 +1,89 @@
+"""inventory valuation running totals and snapshots
+
+Revision ID: f0c0valuation11
+Revises: f0c0analytics10
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "f0c0valuation11"
+down_revision = "f0c0analytics10"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "inventory_valuations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("location_type", sa.String(length=20), nullable=False),
+        sa.Column("location_id", sa.Integer(), nullable=False),
+        sa.Column("qty_total", sa.Numeric(precision=16, scale=3), nullable=False),
+        sa.Column("value_total", sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.ForeignKeyConstraint(["location_id"], ["branches.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("company_id", "location_type", "location_id", name="uq_inventory_valuation_location"),
+    )
+
+    op.create_table(
+        "inventory_valuation_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.Column("label", sa.String(length=60), nullable=True),
+        sa.Column("taken_at", sa.DateTime(), nullable=False),
+        sa.Column("qty_total", sa.Numeric(precision=16, scale=3), nullable=False),
+        sa.Column("value_total", sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column("created_by_user_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["company_id"], ["companies.id"]),
+        sa.ForeignKeyConstraint(["created_by_user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("inventory_valuation_snapshots") as batch_op:
+        batch_op.create_index("ix_inv_val_snapshots_company_taken", ["company_id", "taken_at"], unique=False)
+
+    op.create_table(
+        "inventory_valuation_snapshot_lines",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("snapshot_id", sa.Integer(), nullable=False),
+        sa.Column("location_type", sa.String(length=20), nullable=False),
+        sa.Column("location_id", sa.Integer(), nullable=False),
+        sa.Column("product_id", sa.Integer(), nullable=False),
+        sa.Column("qty", sa.Numeric(precision=14, scale=3), nullable=False),
+        sa.Column("unit_cost", sa.Numeric(precision=14, scale=4), nullable=False),
+        sa.Column("value", sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(["snapshot_id"], ["inventory_valuation_snapshots.id"]),
+        sa.ForeignKeyConstraint(["location_id"], ["branches.id"]),
+        sa.ForeignKeyConstraint(["product_id"], ["products.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("inventory_valuation_snapshot_lines") as batch_op:
+        batch_op.create_index(
+            "ix_inv_val_snapshot_lines_snapshot_location", ["snapshot_id", "location_id"], unique=False
+        )
+
+    # Backfill de totales en vivo desde inventario actual
+    op.execute(
+        """
+        INSERT INTO inventory_valuations (company_id, location_type, location_id, qty_total, value_total, updated_at)
+        SELECT i.company_id, i.location_type, i.location_id,
+               COALESCE(SUM(i.qty), 0), ROUND(COALESCE(SUM(i.qty * p.cost_price), 0), 2), CURRENT_TIMESTAMP
+        FROM inventories i
+        JOIN products p ON p.id = i.product_id
+        GROUP BY i.company_id, i.location_type, i.location_id
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("inventory_valuation_snapshot_lines") as batch_op:
+        batch_op.drop_index("ix_inv_val_snapshot_lines_snapshot_location")
+    op.drop_table("inventory_valuation_snapshot_lines")
+    with op.batch_alter_table("inventory_valuation_snapshots") as batch_op:
+        batch_op.drop_index("ix_inv_val_snapshots_company_taken")
+    op.drop_table("inventory_valuation_snapshots")
+    op.drop_table("inventory_valuations")
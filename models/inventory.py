@@ -30,6 +30,10 @@ class Inventory(db.Model):
 
     qty = db.Column(db.Numeric(14, 3), nullable=False, default=0)  # soporta unidad/peso
 
+    # Costo promedio ponderado móvil de esta ubicación (ver services/costing.py)
+    avg_cost = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    stock_value = db.Column(db.Numeric(16, 2), nullable=False, default=0)  # qty x costo acumulado
+
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
 
     __table_args__ = (
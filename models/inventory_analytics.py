@@ -0,0 +1,52 @@
+from datetime import datetime
+from . import db
+
+
+class AbcClass:
+    A = "A"
+    B = "B"
+    C = "C"
+    ALL = {A, B, C}
+
+
+class InventoryAnalyticsSnapshot(db.Model):
+    """
+    Foto por (empresa, ubicación, producto) calculada por el job batch
+    `flask inventory-analytics` (services.inventory_analytics):
+    - clase ABC por ingreso dentro de la ubicación
+    - días de cobertura = stock / venta promedio diaria
+    - stock muerto: hay stock pero no hubo SALE_OUT en N días
+    Cada corrida reemplaza las filas de la empresa.
+    """
+    __tablename__ = "inventory_analytics_snapshots"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+
+    location_type = db.Column(db.String(20), nullable=False)  # WAREHOUSE / BRANCH
+    location_id = db.Column(db.Integer, db.ForeignKey("branches.id"), nullable=False)
+
+    abc_class = db.Column(db.String(1), nullable=False)  # AbcClass.*
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    qty_sold = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    qty_on_hand = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+
+    avg_daily_sales = db.Column(db.Numeric(14, 4), nullable=False, default=0)
+    coverage_days = db.Column(db.Numeric(14, 1), nullable=True)  # NULL = sin ventas (infinito)
+
+    last_sale_at = db.Column(db.DateTime, nullable=True)
+    is_dead_stock = db.Column(db.Boolean, nullable=False, default=False)
+
+    window_days = db.Column(db.Integer, nullable=False)
+    dead_days = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_inv_analytics_company_location_class", "company_id", "location_id", "abc_class"),
+        db.Index("ix_inv_analytics_company_location_dead", "company_id", "location_id", "is_dead_stock"),
+    )
+
+    def __repr__(self):
+        return f"<InventoryAnalyticsSnapshot company={self.company_id} {self.location_type}:{self.location_id} product={self.product_id} {self.abc_class}>"
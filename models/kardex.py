@@ -22,7 +22,9 @@ class KardexMovement(db.Model):
     Kardex por producto, siempre registramos:
     - desde (from_) y hacia (to_) dependiendo del tipo
     - qty positivo (movimiento de cantidad)
-    - unit_cost opcional (para costo promedio futuro)
+    - unit_cost: costo unitario usado (costo promedio, ver services/costing.py)
+    - saldo de la ubicación después del movimiento (from_/to_balance_after),
+      para responder "stock al día D" con una sola búsqueda indexada
     """
     __tablename__ = "kardex_movements"
 
@@ -44,15 +46,89 @@ class KardexMovement(db.Model):
     qty = db.Column(db.Numeric(14, 3), nullable=False)  # siempre positivo
     unit_cost = db.Column(db.Numeric(14, 4), nullable=True)  # opcional para costos
 
+    # Saldo (qty) de cada ubicación luego del movimiento
+    from_balance_after = db.Column(db.Numeric(14, 3), nullable=True)
+    to_balance_after = db.Column(db.Numeric(14, 3), nullable=True)
+
     note = db.Column(db.String(255), nullable=True)
 
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
     __table_args__ = (
         db.Index("ix_kardex_company_product_date", "company_id", "product_id", "created_at"),
-        db.Index("ix_kardex_company_from", "company_id", "from_location_type", "from_location_id"),
-        db.Index("ix_kardex_company_to", "company_id", "to_location_type", "to_location_id"),
+        # Kardex por ubicación + rango de fechas (una rama por lado, ver routes/kardex.py)
+        db.Index("ix_kardex_company_from_date", "company_id", "from_location_id", "created_at"),
+        db.Index("ix_kardex_company_to_date", "company_id", "to_location_id", "created_at"),
+        # stock_as_of(): último movimiento de (producto, ubicación) antes de una fecha
+        db.Index("ix_kardex_product_from_date", "company_id", "product_id", "from_location_id", "created_at"),
+        db.Index("ix_kardex_product_to_date", "company_id", "product_id", "to_location_id", "created_at"),
+        # AUTOINCREMENT: los ids no se reutilizan aunque kardex_archive vacíe la tabla
+        # (el archivo conserva los ids originales)
+        {"sqlite_autoincrement": True},
     )
 
     def __repr__(self):
         return f"<KardexMovement {self.id} {self.move_type} product={self.product_id} qty={self.qty}>"
+
+
+class KardexMovementArchive(db.Model):
+    """
+    Movimientos de meses cerrados, movidos fuera de la tabla viva
+    (ver services/kardex_archive.py). Mismas columnas + `period` (YYYY-MM);
+    conserva el id original para que el orden (created_at, id) siga siendo único.
+    """
+    __tablename__ = "kardex_movements_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+
+    company_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+
+    move_type = db.Column(db.String(20), nullable=False)
+
+    from_location_type = db.Column(db.String(20), nullable=True)
+    from_location_id = db.Column(db.Integer, nullable=True)
+
+    to_location_type = db.Column(db.String(20), nullable=True)
+    to_location_id = db.Column(db.Integer, nullable=True)
+
+    qty = db.Column(db.Numeric(14, 3), nullable=False)
+    unit_cost = db.Column(db.Numeric(14, 4), nullable=True)
+
+    from_balance_after = db.Column(db.Numeric(14, 3), nullable=True)
+    to_balance_after = db.Column(db.Numeric(14, 3), nullable=True)
+
+    note = db.Column(db.String(255), nullable=True)
+
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_kardex_arch_company_period", "company_id", "period"),
+        db.Index("ix_kardex_arch_company_product_date", "company_id", "product_id", "created_at"),
+        db.Index("ix_kardex_arch_company_from_date", "company_id", "from_location_id", "created_at"),
+        db.Index("ix_kardex_arch_company_to_date", "company_id", "to_location_id", "created_at"),
+        db.Index("ix_kardex_arch_product_from_date", "company_id", "product_id", "from_location_id", "created_at"),
+        db.Index("ix_kardex_arch_product_to_date", "company_id", "product_id", "to_location_id", "created_at"),
+    )
+
+    def __repr__(self):
+        return f"<KardexMovementArchive {self.id} {self.period} {self.move_type} product={self.product_id}>"
+
+
+class KardexArchivePeriod(db.Model):
+    """Meses ya archivados por empresa. El mayor define el horizonte del kardex vivo."""
+    __tablename__ = "kardex_archive_periods"
+
+    id = db.Column(db.Integer, primary_key=True)
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    moved_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("company_id", "period", name="uq_kardex_archive_period"),
+    )
+
+    def __repr__(self):
+        return f"<KardexArchivePeriod company={self.company_id} {self.period}>"
@@ -0,0 +1,36 @@
+from datetime import datetime
+from . import db
+
+
+class SaleProductDaily(db.Model):
+    """
+    Rollup de ventas por (empresa, sucursal, producto, día).
+    Se mantiene al registrar/editar/anular ventas (services.rollups)
+    para que los reportes de ranking no recorran sale_items.
+    """
+    __tablename__ = "sale_product_daily"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+    branch_id = db.Column(db.Integer, db.ForeignKey("branches.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+
+    day = db.Column(db.Date, nullable=False)
+
+    qty = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    cost = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "company_id", "branch_id", "product_id", "day",
+            name="uq_sale_product_daily"
+        ),
+        db.Index("ix_sale_product_daily_company_day", "company_id", "day", "branch_id"),
+    )
+
+    def __repr__(self):
+        return f"<SaleProductDaily company={self.company_id} branch={self.branch_id} product={self.product_id} {self.day} qty={self.qty}>"
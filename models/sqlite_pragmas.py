@@ -0,0 +1,88 @@
+"""PRAGMAs de SQLite aplicados en cada conexión nueva (SQLITE_PROFILE).
+
+Con el modo de journal por defecto (DELETE) un escritor bloquea a todos los
+lectores y dos cajas que cobran a la vez terminan en "database is locked".
+El perfil "production" usa:
+
+- journal_mode=WAL: los lectores no bloquean al escritor ni al revés.
+- busy_timeout: el escritor que encuentra el lock espera en vez de fallar.
+- synchronous=NORMAL: con WAL no se pierde consistencia; solo las últimas
+  transacciones ante un corte de energía del equipo.
+- cache_size / mmap_size / temp_store=MEMORY: menos lecturas a disco en
+  reportes y ordenamientos.
+
+"default" no toca nada (valores de fábrica de SQLite; sirve para comparar con
+`flask sqlite-bench`). Cada PRAGMA se puede pisar con SQLITE_<NOMBRE>
+(p.ej. SQLITE_SYNCHRONOUS=FULL); ver Config.SQLITE_PRAGMAS.
+
+Se registran con el evento "connect" de SQLAlchemy sobre el engine de la app
+y sobre los engines por empresa (models.tenancy).
+"""
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event
+
+# Orden de aplicación: journal_mode primero (necesita la base sin transacción abierta)
+PRAGMA_NAMES = ("journal_mode", "busy_timeout", "synchronous", "cache_size", "mmap_size", "temp_store")
+
+PROFILES: dict[str, dict[str, str]] = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",
+        "busy_timeout": "5000",  # ms
+        "synchronous": "NORMAL",
+        "cache_size": "-20000",  # negativo = KiB (~20 MB por conexión)
+        "mmap_size": "268435456",  # 256 MB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def resolve(profile: str, overrides: Optional[dict] = None) -> dict[str, str]:
+    """PRAGMAs del perfil con los overrides encima (valor vacío = no aplicar)."""
+    try:
+        pragmas = dict(PROFILES[(profile or "default").lower()])
+    except KeyError:
+        raise ValueError(f"SQLITE_PROFILE desconocido: {profile!r} ({' | '.join(PROFILES)})") from None
+    for name, value in (overrides or {}).items():
+        if name not in PRAGMA_NAMES:
+            raise ValueError(f"PRAGMA no soportado: {name!r}")
+        if value in (None, ""):
+            pragmas.pop(name, None)
+        else:
+            pragmas[name] = str(value)
+    return {name: pragmas[name] for name in PRAGMA_NAMES if name in pragmas}
+
+
+def from_config(config) -> dict[str, str]:
+    return resolve(config.get("SQLITE_PROFILE", "default"), config.get("SQLITE_PRAGMAS"))
+
+
+def apply(dbapi_conn, pragmas: dict[str, str]) -> None:
+    cur = dbapi_conn.cursor()
+    try:
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+    finally:
+        cur.close()
+
+
+def install(engine: sa.Engine, pragmas: dict[str, str]) -> None:
+    """Aplica `pragmas` a cada conexión nueva del engine (solo SQLite)."""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, connection_record):
+        apply(dbapi_conn, pragmas)
+
+
+def init_app(app) -> None:
+    """Registra los PRAGMAs del perfil en los engines de Flask-SQLAlchemy."""
+    from models import db
+
+    pragmas = from_config(app.config)
+    with app.app_context():
+        for engine in db.engines.values():
+            install(engine, pragmas)
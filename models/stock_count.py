@@ -0,0 +1,72 @@
+from datetime import datetime
+from . import db
+
+
+class StockCountStatus:
+    OPEN = "OPEN"            # recibiendo escaneos
+    CLOSED = "CLOSED"        # diferencias aplicadas en kardex
+    CANCELLED = "CANCELLED"  # descartado, no afecta stock
+
+    ALL = {OPEN, CLOSED, CANCELLED}
+
+
+class StockCount(db.Model):
+    """
+    Sesión de conteo físico (toma de inventario / conteo cíclico) de una ubicación.
+    Al abrir se fotografía el stock esperado en las líneas; al cerrar se aplican
+    las diferencias (contado - esperado) sobre el stock actual.
+    """
+    __tablename__ = "stock_counts"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+
+    location_type = db.Column(db.String(20), nullable=False)  # WAREHOUSE / BRANCH
+    location_id = db.Column(db.Integer, db.ForeignKey("branches.id"), nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default=StockCountStatus.OPEN)
+    note = db.Column(db.String(255), nullable=True)
+
+    scan_count = db.Column(db.Integer, nullable=False, default=0)  # escaneos recibidos
+    lines_adjusted = db.Column(db.Integer, nullable=True)           # al cerrar
+
+    opened_by_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    opened_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    closed_by_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    closed_at = db.Column(db.DateTime, nullable=True)
+
+    lines = db.relationship("StockCountLine", backref="count", lazy="dynamic", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index("ix_stock_counts_company_status", "company_id", "status", "location_id"),
+    )
+
+    def __repr__(self):
+        return f"<StockCount {self.id} {self.status} location={self.location_id}>"
+
+
+class StockCountLine(db.Model):
+    """
+    Línea por producto: esperado (foto al abrir) y contado (suma de escaneos).
+    counted_qty NULL = no contado todavía.
+    """
+    __tablename__ = "stock_count_lines"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    count_id = db.Column(db.Integer, db.ForeignKey("stock_counts.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+
+    expected_qty = db.Column(db.Numeric(14, 3), nullable=False, default=0)
+    counted_qty = db.Column(db.Numeric(14, 3), nullable=True)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("count_id", "product_id", name="uq_stock_count_line_product"),
+    )
+
+    def __repr__(self):
+        return f"<StockCountLine count={self.count_id} product={self.product_id} counted={self.counted_qty}>"
@@ -0,0 +1,178 @@
+"""Ruteo opcional de base de datos por empresa (TENANT_DB_MODE).
+
+- "shared" (default): todo en SQLALCHEMY_DATABASE_URI, como siempre.
+- "per_company": cada empresa tiene su propio archivo SQLite en TENANT_DB_DIR
+  (company_<id>.db) y las escrituras de una empresa no esperan el lock de
+  las demás. La base principal queda como catálogo compartido: usuarios,
+  empresas, sucursales, membresías y roles de sistema (CATALOG_TABLES).
+
+`RoutingSession.get_bind` decide por tabla: catálogo -> base principal; el
+resto -> base de la empresa activa. La empresa activa es un contextvar que
+fija cada request desde session["company_id"] (ver `init_app`) y los
+comandos CLI con `scope(company_id)`. Una consulta que cruza tablas de
+catálogo con tablas de empresa, o sin tablas reconocibles, falla en vez de
+ir a una base al azar.
+
+Todas las bases (catálogo y empresas) tienen el mismo esquema Alembic;
+`flask tenants-migrate` aplica las migraciones a cada empresa.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import current_app, g, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.sql.util import find_tables
+
+from models import sqlite_pragmas
+
+CATALOG_TABLES = frozenset({
+    "users",
+    "companies",
+    "branches",
+    "company_users",
+    "system_user_roles",
+    "alembic_version",
+})
+
+_current: ContextVar[Optional[int]] = ContextVar("tenant_company_id", default=None)
+
+_engines_lock = threading.Lock()
+_engines: dict[str, sa.Engine] = {}
+
+
+def enabled(app=None) -> bool:
+    app = app or current_app
+    return (app.config.get("TENANT_DB_MODE") or "shared").lower() == "per_company"
+
+
+def current() -> Optional[int]:
+    return _current.get()
+
+
+def tenant_path(company_id: int, app=None) -> str:
+    app = app or current_app
+    return os.path.join(app.config["TENANT_DB_DIR"], f"company_{int(company_id)}.db")
+
+
+def engine_for(company_id: int, app=None, create: bool = False) -> sa.Engine:
+    """
+    Engine (uno por archivo, reutilizado) de la base de la empresa.
+    Sin create=True exige que el archivo exista: un company_id arbitrario en
+    la sesión no debe crear bases vacías.
+    """
+    app = app or current_app
+    path = tenant_path(company_id, app)
+    if not create and not os.path.exists(path):
+        raise LookupError(f"No existe la base de la empresa {company_id} ({path}). Ejecuta `flask tenants-migrate`.")
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            engine = sa.create_engine(f"sqlite:///{path}", **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+            sqlite_pragmas.install(engine, sqlite_pragmas.from_config(app.config))
+            _engines[path] = engine
+    return engine
+
+
+def _is_catalog(mapper, clause) -> bool:
+    """
+    True: solo tablas de catálogo; False: solo tablas de empresa. Sin tablas
+    reconocibles (text(), select de funciones) o mezclando ambas no se adivina:
+    cada base tiene el esquema completo y la equivocada respondería vacío sin error.
+    """
+    names = set()
+    if clause is not None:
+        names = {t.name for t in find_tables(clause, check_columns=True, include_crud=True) if hasattr(t, "name")}
+    if mapper is not None:
+        table = sa.inspect(mapper).local_table
+        if hasattr(table, "name"):
+            names.add(table.name)
+    if not names:
+        raise RuntimeError("No se pudo determinar a qué base va la consulta (sin tablas reconocibles).")
+    catalog = names & CATALOG_TABLES
+    if catalog and names - CATALOG_TABLES:
+        raise RuntimeError(
+            f"La consulta mezcla tablas de catálogo ({', '.join(sorted(catalog))}) "
+            f"y de empresa ({', '.join(sorted(names - CATALOG_TABLES))}); sepárala en dos."
+        )
+    return bool(catalog)
+
+
+class RoutingSession(Session):
+    """
+    Session de Flask-SQLAlchemy que manda las tablas de empresa a la base de la
+    empresa activa. Falla (RuntimeError) si no hay empresa activa o si la
+    consulta no se puede asignar a una sola base.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and enabled() and not _is_catalog(mapper, clause):
+            company_id = _current.get()
+            if company_id is None:
+                raise RuntimeError("Consulta a una tabla de empresa sin empresa activa (tenancy.scope).")
+            return engine_for(company_id)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def scope(company_id: Optional[int]):
+    """
+    Fija la empresa activa (comandos CLI / jobs). En modo per_company, al salir
+    cierra db.session: confirmar antes, y no mezclar objetos de dos empresas
+    en la misma sesión (los ids se repiten entre bases).
+    """
+    token = _current.set(int(company_id) if company_id is not None else None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        if enabled():
+            from models import db
+
+            db.session.close()
+
+
+@contextmanager
+def tenant_session(company_id: int, app=None):
+    """Session independiente ligada a la base de una empresa (p.ej. en un thread pool)."""
+    s = OrmSession(bind=engine_for(company_id, app))
+    try:
+        yield s
+    finally:
+        s.close()
+
+
+def migrate_tenant(company_id: int, app=None) -> None:
+    """Crea (si falta) la base de la empresa y le aplica las migraciones hasta head."""
+    from alembic import command
+
+    app = app or current_app
+    engine = engine_for(company_id, app, create=True)
+    cfg = app.extensions["migrate"].migrate.get_config()
+    with engine.begin() as connection:
+        cfg.attributes["connection"] = connection
+        command.upgrade(cfg, "head")
+
+
+def init_app(app) -> None:
+    """Cada request toma la empresa activa de session["company_id"]."""
+
+    @app.before_request
+    def _set_tenant():
+        company_id = session.get("company_id")
+        try:
+            company_id = int(company_id) if company_id is not None else None
+        except (TypeError, ValueError):
+            company_id = None
+        g._tenant_token = _current.set(company_id)
+
+    @app.teardown_request
+    def _reset_tenant(exc=None):
+        token = g.pop("_tenant_token", None)
+        if token is not None:
+            _current.reset(token)
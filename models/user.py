@@ -1,8 +1,32 @@
 from datetime import datetime
+from functools import lru_cache
+
+from flask import current_app
 from flask_login import UserMixin
+from sqlalchemy.orm import make_transient_to_detached
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db, login_manager
 
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+
+# Cache de filas de usuario para load_user (ver services.cache): la versión
+# es por usuario y se sube al cambiar contraseña/datos (invalidate_user).
+USER_CACHE_NS = "users"
+
+
+def _hash_method() -> str:
+    try:
+        return current_app.config.get("PASSWORD_HASH_METHOD") or DEFAULT_HASH_METHOD
+    except RuntimeError:
+        return DEFAULT_HASH_METHOD
+
+
+@lru_cache(maxsize=8)
+def _hash_prefix(method: str) -> str:
+    """Parámetros completos tal como quedan en el hash (Werkzeug completa los defaults)."""
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
 class User(db.Model, UserMixin):
     __tablename__ = "users"
 
@@ -19,14 +43,55 @@ class User(db.Model, UserMixin):
     memberships = db.relationship("CompanyUser", back_populates="user", cascade="all, delete-orphan")
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=_hash_method())
 
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self) -> bool:
+        """True si el hash guardado usa otros parámetros que PASSWORD_HASH_METHOD."""
+        stored = (self.password_hash or "").split("$", 1)[0]
+        return stored != _hash_prefix(_hash_method())
+
     def __repr__(self) -> str:
         return f"<User {self.id} {self.email}>"
 
+
+def invalidate_user(user_id: int) -> None:
+    """Llamar al cambiar contraseña, email, nombre o is_active del usuario."""
+    from services import cache
+
+    cache.invalidate(USER_CACHE_NS, int(user_id))
+
+
+def _user_row(user_id: int) -> dict | None:
+    u = db.session.get(User, user_id)
+    if not u:
+        return None
+    return {c.key: getattr(u, c.key) for c in User.__table__.columns}
+
+
 @login_manager.user_loader
 def load_user(user_id: str):
-    return db.session.get(User, int(user_id))
+    """
+    Usuario del request sin SELECT mientras la fila esté en cache (TTL corto):
+    se reconstruye desde datos planos y se adjunta a la sesión con
+    merge(load=False). Los inactivos no inician sesión.
+    """
+    from services import cache
+
+    uid = int(user_id)
+    try:
+        ttl = current_app.config.get("USER_CACHE_TTL", 30)
+    except RuntimeError:
+        ttl = 30
+    if not ttl:
+        row = _user_row(uid)
+    else:
+        row = cache.get_or_set(USER_CACHE_NS, uid, "row", lambda: _user_row(uid), ttl=ttl)
+    if not row or not row["is_active"]:
+        return None
+
+    u = User(**row)
+    make_transient_to_detached(u)
+    return db.session.merge(u, load=False)
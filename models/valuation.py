@@ -0,0 +1,77 @@
+from datetime import datetime
+from . import db
+
+
+class InventoryValuation(db.Model):
+    """
+    Totales valorizados "en vivo" por ubicación (cantidad y valor a costo).
+    Los mantiene services.valuation en cada movimiento de stock y cambio de costo,
+    así el reporte no multiplica qty x costo fila por fila.
+    """
+    __tablename__ = "inventory_valuations"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+
+    location_type = db.Column(db.String(20), nullable=False)  # WAREHOUSE / BRANCH
+    location_id = db.Column(db.Integer, db.ForeignKey("branches.id"), nullable=False)
+
+    qty_total = db.Column(db.Numeric(16, 3), nullable=False, default=0)
+    value_total = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "company_id", "location_type", "location_id",
+            name="uq_inventory_valuation_location"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<InventoryValuation company={self.company_id} {self.location_type}:{self.location_id} value={self.value_total}>"
+
+
+class InventoryValuationSnapshot(db.Model):
+    """Foto (point-in-time) del inventario valorizado, p.ej. cierre de mes."""
+    __tablename__ = "inventory_valuation_snapshots"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    company_id = db.Column(db.Integer, db.ForeignKey("companies.id"), nullable=False)
+
+    label = db.Column(db.String(60), nullable=True)  # ej: "2026-09" (cierre)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    qty_total = db.Column(db.Numeric(16, 3), nullable=False, default=0)
+    value_total = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+
+    created_by_user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_inv_val_snapshots_company_taken", "company_id", "taken_at"),
+    )
+
+    def __repr__(self):
+        return f"<InventoryValuationSnapshot {self.id} company={self.company_id} {self.label} value={self.value_total}>"
+
+
+class InventoryValuationSnapshotLine(db.Model):
+    __tablename__ = "inventory_valuation_snapshot_lines"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    snapshot_id = db.Column(db.Integer, db.ForeignKey("inventory_valuation_snapshots.id"), nullable=False)
+
+    location_type = db.Column(db.String(20), nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey("branches.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
+
+    qty = db.Column(db.Numeric(14, 3), nullable=False)
+    unit_cost = db.Column(db.Numeric(14, 4), nullable=False)
+    value = db.Column(db.Numeric(16, 2), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_inv_val_snapshot_lines_snapshot_location", "snapshot_id", "location_id"),
+    )
@@ -2,17 +2,18 @@ import os
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 
 from models import db
-from models.user import User
+from models.user import User, invalidate_user
 from models.branch import Branch
 from models.membership import CompanyUser, Role
 from models.product import Product
 from models.inventory import Inventory, LocationType
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
+from services import authz, company_meta, rankings
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
@@ -31,10 +32,6 @@ def _allowed_image(filename: str) -> bool:
     ext = filename.rsplit(".", 1)[1].lower()
     return ext in _ALLOWED_IMAGE_EXT
 
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
 def _clean_str(value: str | None) -> str:
     return (value or "").strip()
 
@@ -71,7 +68,7 @@ def _to_decimal(val: str | None) -> Decimal:
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_list():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     memberships = (
         db.session.query(CompanyUser)
@@ -88,7 +85,7 @@ def users_list():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_new_get():
-    company_id = _company_id()
+    company_id = current_context().company_id
     branches = (
         db.session.query(Branch)
         .filter(
@@ -106,7 +103,7 @@ def users_new_get():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_new_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     full_name = _clean_str(request.form.get("full_name"))
     email = _clean_str(request.form.get("email")).lower()
@@ -175,6 +172,8 @@ def users_new_post():
     )
     db.session.add(membership)
     db.session.commit()
+    authz.invalidate(company_id)
+    invalidate_user(user.id)
 
     flash("Usuario creado y permisos asignados.", "message")
     return redirect(url_for("admin.users_list"))
@@ -187,7 +186,7 @@ def users_new_post():
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_toggle_membership(membership_id: int):
     """Activa/Desactiva el acceso del usuario a la empresa (CompanyUser)."""
-    company_id = _company_id()
+    company_id = current_context().company_id
     m = (
         db.session.query(CompanyUser)
         .filter(CompanyUser.id == membership_id, CompanyUser.company_id == company_id)
@@ -199,6 +198,7 @@ def users_toggle_membership(membership_id: int):
 
     m.is_active = not bool(m.is_active)
     db.session.commit()
+    authz.invalidate(company_id)
     flash("Permiso actualizado (activo/inactivo).", "message")
     return redirect(url_for("admin.users_list"))
 
@@ -208,7 +208,7 @@ def users_toggle_membership(membership_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_edit_get(membership_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     m = (
         db.session.query(CompanyUser)
         .filter(CompanyUser.id == membership_id, CompanyUser.company_id == company_id)
@@ -235,7 +235,7 @@ def users_edit_get(membership_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def users_edit_post(membership_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     m = (
         db.session.query(CompanyUser)
         .filter(CompanyUser.id == membership_id, CompanyUser.company_id == company_id)
@@ -294,6 +294,8 @@ def users_edit_post(membership_id: int):
     m.branch_id = branch_id_int if role in (Role.SELLER, Role.SUPERVISOR) else None
 
     db.session.commit()
+    authz.invalidate(company_id)
+    invalidate_user(m.user_id)
     flash("Usuario actualizado.", "message")
     return redirect(url_for("admin.users_list"))
 
@@ -306,7 +308,7 @@ def users_edit_post(membership_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def products_list():
-    company_id = _company_id()
+    company_id = current_context().company_id
     products = (
         db.session.query(Product)
         .filter(Product.company_id == company_id)
@@ -329,7 +331,7 @@ def products_new_get():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def products_new_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     name = _clean_str(request.form.get("name"))
     sku = _clean_str(request.form.get("sku")) or None
@@ -375,7 +377,7 @@ def products_new_post():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def products_edit_get(product_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     product = (
         db.session.query(Product)
         .filter(Product.id == product_id, Product.company_id == company_id)
@@ -393,7 +395,7 @@ def products_edit_get(product_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def products_edit_post(product_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     product = (
         db.session.query(Product)
         .filter(Product.id == product_id, Product.company_id == company_id)
@@ -452,6 +454,7 @@ def products_edit_post(product_id: int):
     product.price_mayorista = p2
     product.price_especial = p3
     db.session.commit()
+    rankings.invalidate(company_id)
     flash("Producto actualizado.", "message")
     return redirect(url_for("admin.products_list"))
 
@@ -461,7 +464,7 @@ def products_edit_post(product_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def product_upload_image(product_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     product = (
         db.session.query(Product)
         .filter(Product.id == product_id, Product.company_id == company_id)
@@ -495,6 +498,7 @@ def product_upload_image(product_id: int):
     product.image_path = f"uploads/products/{final_name}"
     product.image_updated_at = datetime.utcnow()
     db.session.commit()
+    rankings.invalidate(company_id)
 
     flash("Imagen actualizada.", "message")
     return redirect(url_for("admin.products_edit_get", product_id=product_id))
@@ -506,7 +510,7 @@ def product_upload_image(product_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def products_toggle_active(product_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     product = (
         db.session.query(Product)
         .filter(Product.id == product_id, Product.company_id == company_id)
@@ -518,6 +522,7 @@ def products_toggle_active(product_id: int):
 
     product.is_active = not bool(product.is_active)
     db.session.commit()
+    rankings.invalidate(company_id)
 
     flash("Producto actualizado (activo/inactivo).", "message")
     return redirect(url_for("admin.products_list"))
@@ -531,7 +536,7 @@ def products_toggle_active(product_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def branches_list():
-    company_id = _company_id()
+    company_id = current_context().company_id
     branches = (
         db.session.query(Branch)
         .filter(Branch.company_id == company_id)
@@ -554,7 +559,7 @@ def branches_new_get():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def branches_new_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     name = _clean_str(request.form.get("name"))
     is_warehouse = (_clean_str(request.form.get("is_warehouse")) == "1")
@@ -580,6 +585,8 @@ def branches_new_post():
     b = Branch(company_id=company_id, name=name, is_warehouse=is_warehouse, is_active=True)
     db.session.add(b)
     db.session.commit()
+    authz.invalidate(company_id)
+    company_meta.invalidate(company_id)
 
     flash("Sucursal creada.", "message")
     return redirect(url_for("admin.branches_list"))
@@ -590,7 +597,7 @@ def branches_new_post():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def branches_edit_get(branch_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     branch = (
         db.session.query(Branch)
         .filter(Branch.id == branch_id, Branch.company_id == company_id)
@@ -608,7 +615,7 @@ def branches_edit_get(branch_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def branches_edit_post(branch_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     branch = (
         db.session.query(Branch)
         .filter(Branch.id == branch_id, Branch.company_id == company_id)
@@ -653,6 +660,8 @@ def branches_edit_post(branch_id: int):
     branch.name = name
     branch.is_warehouse = is_warehouse
     db.session.commit()
+    authz.invalidate(company_id)
+    company_meta.invalidate(company_id)
 
     flash("Sucursal actualizada.", "message")
     return redirect(url_for("admin.branches_list"))
@@ -667,7 +676,7 @@ def branches_toggle_active(branch_id: int):
     "Eliminar" seguro => desactivar.
     Seguridad extra: si es bodega y tiene stock, no dejar desactivar.
     """
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     branch = (
         db.session.query(Branch)
@@ -696,6 +705,8 @@ def branches_toggle_active(branch_id: int):
 
     branch.is_active = not bool(branch.is_active)
     db.session.commit()
+    authz.invalidate(company_id)
+    company_meta.invalidate(company_id)
 
     flash("Sucursal actualizada (activa/inactiva).", "message")
     return redirect(url_for("admin.branches_list"))
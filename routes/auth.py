@@ -1,8 +1,9 @@
 from flask import render_template, request, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, login_required
 from models import db
-from models.user import User
+from models.user import User, invalidate_user
 from routes import auth_bp
+from services import sessions
 
 @auth_bp.get("/login")
 def login_get():
@@ -18,11 +19,22 @@ def login_post():
         flash("Credenciales inválidas", "error")
         return redirect(url_for("auth.login_get"))
 
+    # Parámetros de hash cambiados (PASSWORD_HASH_METHOD): se re-hashea con la
+    # contraseña en claro que acabamos de validar
+    if user.needs_rehash():
+        user.set_password(password)
+        db.session.commit()
+        invalidate_user(user.id)
+
     login_user(user)
 
     # Limpiar contexto anterior
     session.pop("company_id", None)
     session.pop("branch_id", None)
+    session.pop("contexts", None)
+
+    # Id de sesión nuevo al autenticar (el previo pudo fijarlo un tercero)
+    sessions.regenerate(session)
 
     return redirect(url_for("context.select_context"))
 
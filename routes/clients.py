@@ -1,24 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 
 from models import db
 from models.client import Client, ClientType, IdentificationType
 from models.membership import Role
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
 
 clients_bp = Blueprint("clients", __name__, url_prefix="/clients")
 
 
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
 @clients_bp.get("/")
 @login_required
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def list_clients():
-    company_id = _company_id()
+    company_id = current_context().company_id
     q = (request.args.get("q") or "").strip()
 
     query = db.session.query(Client).filter(
@@ -46,7 +42,7 @@ def new_get():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def new_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     full_name = (request.form.get("full_name") or "").strip()
     phone = (request.form.get("phone") or "").strip() or None
@@ -105,7 +101,7 @@ def new_post():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def edit_get(client_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     c = db.session.query(Client).filter(Client.company_id == company_id, Client.id == client_id, Client.is_active == True).first()
     if not c:
         flash("Cliente no encontrado.", "error")
@@ -118,7 +114,7 @@ def edit_get(client_id: int):
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def edit_post(client_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     c = db.session.query(Client).filter(Client.company_id == company_id, Client.id == client_id, Client.is_active == True).first()
     if not c:
         flash("Cliente no encontrado.", "error")
@@ -173,7 +169,7 @@ def edit_post(client_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def delete_post(client_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
     c = db.session.query(Client).filter(Client.company_id == company_id, Client.id == client_id, Client.is_active == True).first()
     if not c:
         flash("Cliente no encontrado.", "error")
@@ -193,7 +189,7 @@ def search():
     Búsqueda rápida para el POS (JSON):
     /clients/search?q=...
     """
-    company_id = _company_id()
+    company_id = current_context().company_id
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
@@ -1,22 +1,11 @@
 from flask import flash, redirect, render_template, request, session, url_for
 from flask_login import current_user, login_required
-from sqlalchemy.orm import joinedload
 
 from models import db
-from models.branch import Branch
-from models.membership import CompanyUser, Role
-from models.system_role import SystemUserRole
+from models.membership import Role
 from routes import context_bp
-
-
-def _available_memberships():
-    """Trae TODAS las membresías activas del usuario cargando company y branch."""
-    return (
-        db.session.query(CompanyUser)
-        .options(joinedload(CompanyUser.company), joinedload(CompanyUser.branch))
-        .filter(CompanyUser.user_id == current_user.id, CompanyUser.is_active.is_(True))
-        .all()
-    )
+from routes.guards import session_contexts
+from services import authz
 
 
 def _set_context(company_id: int, branch_id: int, role: str | None = None):
@@ -32,36 +21,27 @@ def _clear_context():
     session.pop("role", None)
 
 
-def _set_system_role():
-    r = db.session.query(SystemUserRole).filter(SystemUserRole.user_id == current_user.id).first()
-    session["system_role"] = r.role if r else None
-
-
 @context_bp.get("/select-context")
 @login_required
 def select_context():
-    memberships = _available_memberships()
-    _set_system_role()
+    contexts = session_contexts()
 
-    if not memberships:
+    if not contexts:
         flash("Tu usuario no tiene acceso a ninguna empresa. Contacta al administrador.", "error")
         return render_template("select_context.html", companies=[])
 
     # Caso vendedor con 1 sola sucursal: entra directo
-    if (
-        len(memberships) == 1
-        and memberships[0].role in (Role.SELLER, Role.SUPERVISOR)
-        and memberships[0].branch_id is not None
-    ):
-        m = memberships[0]
-        _set_context(m.company_id, m.branch_id, role=m.role)
+    if len(contexts) == 1 and contexts[0]["role"] in (Role.SELLER, Role.SUPERVISOR):
+        c = contexts[0]
+        _set_context(c["company_id"], c["branch_id"], role=c["role"])
         return redirect(url_for("main.dashboard"))
 
-    # Agrupar para mostrar selector
+    # Agrupar por empresa para el selector (solo las sucursales permitidas)
     companies = {}
-    for m in memberships:
-        companies.setdefault(m.company_id, {"company": m.company, "memberships": []})
-        companies[m.company_id]["memberships"].append(m)
+    for c in contexts:
+        companies.setdefault(
+            c["company_id"], {"id": c["company_id"], "name": c["company_name"], "branches": []}
+        )["branches"].append(c)
 
     return render_template("select_context.html", companies=list(companies.values()))
 
@@ -80,54 +60,16 @@ def select_context_post():
         flash("Selecciona una sucursal para continuar.", "error")
         return redirect(url_for("context.select_context"))
 
-    memberships = _available_memberships()
-    _set_system_role()
-
-    # 1) Validar que la sucursal pertenece a la empresa y está activa
-    branch_ok = (
-        db.session.query(Branch.id)
-        .filter(
-            Branch.id == branch_id,
-            Branch.company_id == company_id,
-            Branch.is_active.is_(True),
-        )
-        .first()
-        is not None
-    )
-    if not branch_ok:
+    # Permiso desde authz (no desde la lista guardada en la sesión, que puede estar desfasada)
+    resolved = authz.resolve(db.session, company_id=company_id, branch_id=branch_id, user_id=current_user.id)
+    if not resolved["branch_ok"]:
         flash("Sucursal inválida o inactiva para esa empresa.", "error")
         return redirect(url_for("context.select_context"))
-
-    # 2) Validar permiso
-    allowed = False
-    role = None
-    for m in memberships:
-        if m.company_id != company_id:
-            continue
-
-        # membership global (branch NULL) => puede elegir cualquier sucursal activa de esa empresa
-        if m.branch_id is None:
-            allowed = True
-            role = m.role
-            break
-
-        # membership amarrada
-        if m.branch_id == branch_id:
-            allowed = True
-            role = m.role
-            break
-
-        # ADMIN/OWNER en empresa => acceso global (evita bloqueos)
-        if m.role in (Role.ADMIN, Role.OWNER):
-            allowed = True
-            role = m.role
-            break
-
-    if not allowed:
+    if not resolved["role"]:
         flash("No tienes permiso para ese contexto.", "error")
         return redirect(url_for("context.select_context"))
 
-    _set_context(company_id, branch_id, role=role)
+    _set_context(company_id, branch_id, role=resolved["role"])
     return redirect(url_for("main.dashboard"))
 
 
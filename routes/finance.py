@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date, datetime, timedelta
 from decimal import Decimal
 
-from flask import Blueprint, current_app, flash, redirect, render_template, request, session, url_for
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
 from flask_login import login_required
 from sqlalchemy.exc import OperationalError
 
@@ -12,14 +12,15 @@ from models.cash_movement import CashMovement, CashMoveType
 from models.cash_count import CashCount
 from models.expense import Expense, ExpenseCategory, PaymentMethod
 from models.membership import Role
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
 
 
 finance_bp = Blueprint("finance", __name__, url_prefix="/finance")
 
 
 def _ctx_ids() -> tuple[int, int]:
-    return int(session["company_id"]), int(session["branch_id"])
+    ctx = current_context()
+    return ctx.company_id, ctx.branch_id
 
 
 def _as_date(v: str | None, fallback: date) -> date:
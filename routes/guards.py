@@ -1,12 +1,14 @@
+import time
 from functools import wraps
 
-from flask import flash, redirect, session, url_for
+from flask import current_app, flash, g, redirect, session, url_for
 from flask_login import current_user
 
 from models import db
-from models.branch import Branch
-from models.membership import CompanyUser, Role
+from models.membership import Role
 from models.system_role import SystemRole, SystemUserRole
+from services import authz, company_meta
+from services.company_meta import BranchInfo, CompanyInfo
 
 
 def get_context_ids():
@@ -20,54 +22,116 @@ def get_context_ids():
         return None, None
 
 
-def _branch_belongs_and_active(company_id: int, branch_id: int) -> bool:
-    return (
-        db.session.query(Branch.id)
-        .filter(
-            Branch.id == branch_id,
-            Branch.company_id == company_id,
-            Branch.is_active.is_(True),
-        )
-        .first()
-        is not None
-    )
+def _set_system_role():
+    r = db.session.query(SystemUserRole).filter(SystemUserRole.user_id == current_user.id).first()
+    session["system_role"] = r.role if r else None
 
 
-def _get_membership_for_context(user_id: int, company_id: int, branch_id: int):
-    """Regla corregida:
-
-    - Si el usuario es ADMIN u OWNER en la empresa, puede entrar a cualquier sucursal,
-      incluso si su membership tiene branch_id.
-    - Si es SELLER, debe coincidir con la sucursal seleccionada.
-    - Si existe una membership global (branch_id NULL), también sirve.
+def session_contexts() -> list[dict]:
+    """
+    Contextos permitidos del usuario (authz.allowed_contexts, una consulta),
+    guardados en la sesión para armar el selector sin volver a la base.
+    Se recalculan si cambió el usuario, si admin invalidó (authz.contexts_version)
+    o si venció CONTEXT_CACHE_TTL (corto: el stamp es por proceso). El rol de
+    sistema se refresca junto con ellos. Solo para mostrar: los permisos se
+    deciden con authz.resolve / authz.report_branches.
+    """
+    now = int(time.time())
+    cached = session.get("contexts")
+    if (
+        cached
+        and cached.get("user_id") == current_user.id
+        and cached.get("version") == authz.contexts_version()
+        and cached.get("expires", 0) > now
+    ):
+        return cached["items"]
+
+    items = authz.allowed_contexts(db.session, user_id=current_user.id)
+    _set_system_role()
+    session["contexts"] = {
+        "user_id": current_user.id,
+        "version": authz.contexts_version(),
+        "expires": now + current_app.config.get("CONTEXT_CACHE_TTL", 60),
+        "items": items,
+    }
+    return items
+
+
+class RequestContext:
+    """
+    Contexto del request actual (en flask.g): empresa, sucursal y rol efectivo,
+    resuelto una sola vez. Los blueprints leen de aquí en vez de la sesión.
+    `company` / `branch` salen de los metadatos cacheados de la empresa
+    (services.company_meta), sin consulta por request.
     """
 
-    memberships = (
-        db.session.query(CompanyUser)
-        .filter(
-            CompanyUser.user_id == user_id,
-            CompanyUser.company_id == company_id,
-            CompanyUser.is_active.is_(True),
-        )
-        .all()
-    )
-
-    # 1) ADMIN/OWNER => acceso global a cualquier branch (evita bloqueos)
-    for m in memberships:
-        if m.role in (Role.ADMIN, Role.OWNER):
-            return m
-
-    # 2) SELLER => debe coincidir la sucursal
-    for m in memberships:
-        if m.branch_id == branch_id:
-            return m
-
-    # 3) Global legacy: branch_id NULL
-    for m in memberships:
-        if m.branch_id is None:
-            return m
-
-    return None
+    __slots__ = ("company_id", "branch_id", "role", "branch_ok", "_company", "_branch", "_scope")
+
+    def __init__(self, company_id: int, branch_id: int, role: str | None, branch_ok: bool):
+        self.company_id = company_id
+        self.branch_id = branch_id
+        self.role = role
+        self.branch_ok = branch_ok
+        self._company = None
+        self._branch = None
+        self._scope = False
+
+    @property
+    def company(self) -> CompanyInfo | None:
+        if self._company is None:
+            self._company = company_meta.company(db.session, company_id=self.company_id)
+        return self._company
+
+    @property
+    def branch(self) -> BranchInfo | None:
+        if self._branch is None:
+            self._branch = company_meta.get_branch(
+                db.session, company_id=self.company_id, branch_id=self.branch_id, active_only=False
+            )
+        return self._branch
+
+    @property
+    def branch_scope(self) -> frozenset[int] | None:
+        """
+        Sucursales cuyos datos puede ver el usuario en reportes (filtro IN):
+        - ADMIN/OWNER: None = toda la empresa (sin filtro).
+        - SUPERVISOR: las sucursales de esta empresa donde su rol es SUPERVISOR
+          o superior (authz.report_branches, cacheado). Donde solo es SELLER
+          no ve reportes.
+        - SELLER (u otro): solo la sucursal actual.
+        """
+        if self._scope is False:
+            if self.role in (Role.ADMIN, Role.OWNER):
+                self._scope = None
+            elif self.role == Role.SUPERVISOR:
+                self._scope = authz.report_branches(
+                    db.session, company_id=self.company_id, user_id=current_user.id
+                ) | {self.branch_id}
+            else:
+                self._scope = frozenset((self.branch_id,))
+        return self._scope
+
+
+def current_context() -> RequestContext | None:
+    """Contexto del request (memoizado en g). None si no hay empresa/sucursal en sesión."""
+    if "ctx" in g:
+        return g.ctx
+
+    ctx = None
+    company_id, branch_id = get_context_ids()
+    if company_id and branch_id:
+        resolved = {"branch_ok": False, "role": None}
+        if current_user.is_authenticated:
+            resolved = authz.resolve(db.session, company_id=company_id, branch_id=branch_id, user_id=current_user.id)
+        ctx = RequestContext(company_id, branch_id, resolved["role"], resolved["branch_ok"])
+    g.ctx = ctx
+    return ctx
+
+
+def _reset_context() -> None:
+    session.pop("company_id", None)
+    session.pop("branch_id", None)
+    g.pop("ctx", None)
 
 
 def require_context():
@@ -76,16 +140,15 @@ def require_context():
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            company_id, branch_id = get_context_ids()
-            if not company_id or not branch_id:
+            ctx = current_context()
+            if ctx is None:
                 flash("Selecciona Empresa y Sucursal para continuar.", "error")
                 return redirect(url_for("context.select_context"))
 
             # Validación extra: branch debe existir y pertenecer a la empresa
-            if not _branch_belongs_and_active(company_id, branch_id):
+            if not ctx.branch_ok:
                 flash("Sucursal inválida o inactiva. Selecciona contexto nuevamente.", "error")
-                session.pop("company_id", None)
-                session.pop("branch_id", None)
+                _reset_context()
                 return redirect(url_for("context.select_context"))
 
             return fn(*args, **kwargs)
@@ -101,31 +164,33 @@ def require_roles(*allowed_roles):
     - Contexto seleccionado (company_id, branch_id)
     - La sucursal pertenece a la empresa y está activa
     - Usuario tiene membership activo para esa empresa
+      - ADMIN/OWNER: cualquier branch de la empresa
       - Si está amarrado a branch: debe coincidir
       - Si es global: válido para cualquier branch de esa empresa
     - Rol permitido
+
+    Branch + rol salen de current_context() (una resolución por request,
+    cacheada entre requests por services.authz).
     """
 
     def decorator(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            company_id, branch_id = get_context_ids()
-            if not company_id or not branch_id:
+            ctx = current_context()
+            if ctx is None:
                 flash("Selecciona Empresa y Sucursal para continuar.", "error")
                 return redirect(url_for("context.select_context"))
 
-            if not _branch_belongs_and_active(company_id, branch_id):
+            if not ctx.branch_ok:
                 flash("Sucursal inválida o inactiva. Selecciona contexto nuevamente.", "error")
-                session.pop("company_id", None)
-                session.pop("branch_id", None)
+                _reset_context()
                 return redirect(url_for("context.select_context"))
 
-            membership = _get_membership_for_context(current_user.id, company_id, branch_id)
-            if not membership:
+            if not ctx.role:
                 flash("No tienes acceso a esta empresa o sucursal.", "error")
                 return redirect(url_for("context.select_context"))
 
-            if membership.role not in allowed_roles:
+            if ctx.role not in allowed_roles:
                 flash("No tienes permisos para acceder a esta sección.", "error")
                 return redirect(url_for("pos.sale"))
 
@@ -1,28 +1,27 @@
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.orm import selectinload
 
 from models import db
-from models.branch import Branch
 from models.product import Product
 from models.membership import Role
 from models.inventory import LocationType
 from models.kardex import KardexMoveType
 from models.stock_transfer import StockTransfer, StockTransferItem
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
+from routes.pagination import decode_cursor, encode_cursor
 
-from services.stock import add_stock, transfer_stock
+from services import company_meta, replenishment
+from services.company_meta import BranchInfo
+from services.stock import add_stock, transfer_lines
 
 inventory_bp = Blueprint("inventory", __name__, url_prefix="/inventory")
 
-
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
-def _branch_id() -> int:
-    return int(session["branch_id"])
+TRANSFER_PAGE_SIZE = 50
 
 
 @inventory_bp.get("/in")
@@ -33,17 +32,9 @@ def stock_in_get():
     """
     Entrada a Bodega Central (compra/ingreso).
     """
-    company_id = _company_id()
-
-    warehouse = (
-        db.session.query(Branch)
-        .filter(
-            Branch.company_id == company_id,
-            Branch.is_warehouse == True,
-            Branch.is_active == True
-        )
-        .first()
-    )
+    company_id = current_context().company_id
+
+    warehouse = company_meta.warehouse(db.session, company_id=company_id)
     if not warehouse:
         flash("No existe Bodega Central activa para esta empresa.", "error")
         return redirect(url_for("main.dashboard"))
@@ -63,14 +54,15 @@ def stock_in_get():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def stock_in_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
     warehouse_id = int(request.form.get("warehouse_id") or 0)
     product_id = int(request.form.get("product_id") or 0)
     qty = request.form.get("qty") or "0"
+    unit_cost = (request.form.get("unit_cost") or "").strip()
     note = (request.form.get("note") or "").strip()
 
-    wh = db.session.query(Branch).filter_by(id=warehouse_id, company_id=company_id, is_warehouse=True).first()
-    if not wh:
+    wh = company_meta.get_branch(db.session, company_id=company_id, branch_id=warehouse_id, active_only=False)
+    if not wh or not wh.is_warehouse:
         flash("Bodega inválida.", "error")
         return redirect(url_for("inventory.stock_in_get"))
 
@@ -89,6 +81,7 @@ def stock_in_post():
             qty=qty,
             move_type=KardexMoveType.PURCHASE_IN,
             note=note or "Ingreso a bodega",
+            unit_cost=unit_cost or product.cost_price,  # costo de compra (default: costo del producto)
         )
         db.session.commit()
         flash("Ingreso registrado en bodega.", "message")
@@ -104,14 +97,9 @@ def stock_in_post():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def transfer_get():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
-    branches = (
-        db.session.query(Branch)
-        .filter(Branch.company_id == company_id, Branch.is_active == True)
-        .order_by(Branch.is_warehouse.desc(), Branch.name.asc())
-        .all()
-    )
+    branches = company_meta.branches(db.session, company_id=company_id)
     products = (
         db.session.query(Product)
         .filter(Product.company_id == company_id, Product.is_active == True)
@@ -135,25 +123,23 @@ def transfer_get():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def transfer_post():
-    company_id = _company_id()
+    company_id = current_context().company_id
     from_branch_id = int(request.form.get("from_branch_id") or 0)
     to_branch_id = int(request.form.get("to_branch_id") or 0)
     note = (request.form.get("note") or "").strip()
     action = (request.form.get("action") or "confirm").strip().lower()
 
-    product_ids = request.form.getlist("product_id[]")
-    qtys = request.form.getlist("qty[]")
-
-    # Normaliza items
-    items: list[tuple[int, str]] = []
-    for pid, q in zip(product_ids, qtys):
+    # Normaliza items (productos repetidos se suman)
+    items: dict[int, Decimal] = {}
+    for pid, q in zip(request.form.getlist("product_id[]"), request.form.getlist("qty[]")):
         try:
             pid_i = int(pid or 0)
-        except ValueError:
-            pid_i = 0
-        q_s = (q or "0").strip()
-        if pid_i and q_s and q_s not in ("0", "0.0", "0.00"):
-            items.append((pid_i, q_s))
+            qty = Decimal((q or "0").strip().replace(",", ".")).quantize(Decimal("0.001"))
+        except (InvalidOperation, ValueError):
+            flash("Cantidad inválida.", "error")
+            return redirect(url_for("inventory.transfer_get"))
+        if pid_i and qty > 0:
+            items[pid_i] = items.get(pid_i, Decimal("0.000")) + qty
 
     if not items:
         flash("Agrega al menos un producto con cantidad.", "error")
@@ -163,20 +149,23 @@ def transfer_post():
         flash("Origen y destino no pueden ser iguales.", "error")
         return redirect(url_for("inventory.transfer_get"))
 
-    # Validación de productos
-    products_map = {
-        p.id: p
-        for p in db.session.query(Product)
-        .filter(Product.company_id == company_id, Product.is_active == True)
-        .all()
-    }
-    for pid, _ in items:
-        if pid not in products_map:
-            flash("Uno o más productos son inválidos.", "error")
-            return redirect(url_for("inventory.transfer_get"))
+    # Validación de productos: solo los ids del documento (IN por bloques)
+    pids = list(items.keys())
+    valid = set()
+    for i in range(0, len(pids), 500):
+        valid.update(
+            pid for (pid,) in db.session.query(Product.id).filter(
+                Product.company_id == company_id,
+                Product.is_active == True,
+                Product.id.in_(pids[i:i + 500]),
+            )
+        )
+    if len(valid) != len(pids):
+        flash("Uno o más productos son inválidos.", "error")
+        return redirect(url_for("inventory.transfer_get"))
 
-    b_from = db.session.query(Branch).filter_by(id=from_branch_id, company_id=company_id, is_active=True).first()
-    b_to = db.session.query(Branch).filter_by(id=to_branch_id, company_id=company_id, is_active=True).first()
+    b_from = company_meta.get_branch(db.session, company_id=company_id, branch_id=from_branch_id)
+    b_to = company_meta.get_branch(db.session, company_id=company_id, branch_id=to_branch_id)
     if not b_from or not b_to:
         flash("Sucursal/Bodega inválida.", "error")
         return redirect(url_for("inventory.transfer_get"))
@@ -198,30 +187,24 @@ def transfer_post():
         db.session.add(t)
         db.session.flush()
 
-        # Agregar items
-        for pid, q in items:
-            db.session.add(
-                StockTransferItem(
-                    transfer_id=t.id,
-                    product_id=pid,
-                    qty=str(q).replace(",", "."),
-                )
-            )
+        # Agregar items (un solo INSERT executemany)
+        db.session.execute(insert(StockTransferItem), [
+            {"transfer_id": t.id, "product_id": pid, "qty": qty}
+            for pid, qty in items.items()
+        ])
 
-        # Si confirma: afectar stock por cada item
+        # Si confirma: todo el documento en un solo movimiento por conjuntos
         if action == "confirm":
-            for pid, q in items:
-                transfer_stock(
-                    db.session,
-                    company_id=company_id,
-                    product_id=pid,
-                    from_location_type=from_type,
-                    from_location_id=b_from.id,
-                    to_location_type=to_type,
-                    to_location_id=b_to.id,
-                    qty=q,
-                    note=(note or f"Transferencia #{t.id}"),
-                )
+            transfer_lines(
+                db.session,
+                company_id=company_id,
+                from_location_type=from_type,
+                from_location_id=b_from.id,
+                to_location_type=to_type,
+                to_location_id=b_to.id,
+                lines=items,
+                note=(note or f"Transferencia #{t.id}"),
+            )
 
         db.session.commit()
         if action == "confirm":
@@ -240,35 +223,168 @@ def transfer_post():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def transfer_history():
-    company_id = _company_id()
+    """
+    Historial por páginas con keyset (created_at, id): los items vienen con un
+    selectinload (una consulta por página) y los nombres solo de las
+    sucursales/productos que aparecen en la página.
+    """
+    company_id = current_context().company_id
+    cursor = decode_cursor(request.args.get("cursor"))
 
-    transfers = (
+    q = (
         db.session.query(StockTransfer)
+        .options(selectinload(StockTransfer.items))
         .filter(StockTransfer.company_id == company_id)
-        .order_by(StockTransfer.created_at.desc())
-        .limit(200)
+    )
+    if cursor:
+        ts, tid = cursor
+        q = q.filter(or_(
+            StockTransfer.created_at < ts,
+            and_(StockTransfer.created_at == ts, StockTransfer.id < tid),
+        ))
+    rows = (
+        q.order_by(StockTransfer.created_at.desc(), StockTransfer.id.desc())
+        .limit(TRANSFER_PAGE_SIZE + 1)
         .all()
     )
-
-    # preload branches and products for rendering
-    branch_map = {b.id: b for b in db.session.query(Branch).filter(Branch.company_id == company_id).all()}
-    product_map = {p.id: p for p in db.session.query(Product).filter(Product.company_id == company_id).all()}
+    transfers = rows[:TRANSFER_PAGE_SIZE]
+    next_cursor = encode_cursor(transfers[-1]) if len(rows) > TRANSFER_PAGE_SIZE else None
+
+    product_ids = {it.product_id for t in transfers for it in t.items}
+
+    branch_map = company_meta.branch_map(db.session, company_id=company_id)
+    product_map = {}
+    pids = list(product_ids)
+    for i in range(0, len(pids), 500):
+        product_map.update({
+            p.id: p for p in db.session.query(Product.id, Product.name).filter(
+                Product.company_id == company_id, Product.id.in_(pids[i:i + 500])
+            )
+        })
 
     return render_template(
         "inventory_transfer_history.html",
         transfers=transfers,
         branch_map=branch_map,
         product_map=product_map,
+        is_first_page=cursor is None,
+        next_cursor=next_cursor,
+    )
+
+
+def _replenish_params(company_id: int, src) -> tuple[list[BranchInfo], BranchInfo | None, int, int]:
+    """Bodegas activas + (bodega elegida, ventana, cobertura) desde args/form."""
+    warehouses = company_meta.branches(db.session, company_id=company_id, warehouse=True)
+    try:
+        wh_id = int(src.get("warehouse_id") or 0)
+    except ValueError:
+        wh_id = 0
+    warehouse = next((w for w in warehouses if w.id == wh_id), warehouses[0] if warehouses else None)
+
+    def _days(name: str, default: int) -> int:
+        try:
+            return max(1, min(int(src.get(name) or default), 365))
+        except ValueError:
+            return default
+
+    return (
+        warehouses,
+        warehouse,
+        _days("window_days", replenishment.DEFAULT_WINDOW_DAYS),
+        _days("cover_days", replenishment.DEFAULT_COVER_DAYS),
+    )
+
+
+@inventory_bp.get("/replenish")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def replenish_get():
+    """Vista previa de la reposición sugerida (no crea nada)."""
+    company_id = current_context().company_id
+    warehouses, warehouse, window_days, cover_days = _replenish_params(company_id, request.args)
+
+    lines = []
+    if warehouse:
+        lines = replenishment.plan(
+            db.session,
+            company_id=company_id,
+            warehouse_id=warehouse.id,
+            window_days=window_days,
+            cover_days=cover_days,
+        )
+
+    branch_map = company_meta.branch_map(db.session, company_id=company_id)
+    pids = list({ln["product_id"] for ln in lines})
+    product_map = {}
+    for i in range(0, len(pids), 500):
+        product_map.update({
+            p.id: p for p in db.session.query(Product.id, Product.name, Product.sku).filter(
+                Product.company_id == company_id, Product.id.in_(pids[i:i + 500])
+            )
+        })
+
+    return render_template(
+        "inventory_replenish.html",
+        warehouses=warehouses,
+        warehouse=warehouse,
+        window_days=window_days,
+        cover_days=cover_days,
+        lines=lines,
+        branch_map=branch_map,
+        product_map=product_map,
+        branch_count=len({ln["branch_id"] for ln in lines}),
     )
 
 
+@inventory_bp.post("/replenish")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def replenish_post():
+    """Recalcula con los mismos parámetros y crea los borradores (uno por sucursal)."""
+    company_id = current_context().company_id
+    _, warehouse, window_days, cover_days = _replenish_params(company_id, request.form)
+    if not warehouse:
+        flash("No hay bodega activa.", "error")
+        return redirect(url_for("inventory.replenish_get"))
+
+    try:
+        lines = replenishment.plan(
+            db.session,
+            company_id=company_id,
+            warehouse_id=warehouse.id,
+            window_days=window_days,
+            cover_days=cover_days,
+        )
+        ids = replenishment.create_drafts(
+            db.session,
+            company_id=company_id,
+            warehouse_id=warehouse.id,
+            lines=lines,
+            user_id=getattr(current_user, "id", None),
+            note=(request.form.get("note") or "").strip() or None,
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory.replenish_get"))
+
+    if not ids:
+        flash("No hay nada que reponer con estos parámetros.", "message")
+        return redirect(url_for("inventory.replenish_get"))
+    flash(f"{len(ids)} transferencias en borrador ({len(lines)} líneas). Revísalas y confírmalas.", "message")
+    return redirect(url_for("inventory.transfer_history"))
+
+
 @inventory_bp.post("/transfer/<int:transfer_id>/confirm")
 @login_required
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def transfer_confirm(transfer_id: int):
     """Confirma un borrador y aplica la transferencia a inventario."""
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     t = (
         db.session.query(StockTransfer)
@@ -283,8 +399,8 @@ def transfer_confirm(transfer_id: int):
         flash("La transferencia ya está confirmada.", "message")
         return redirect(url_for("inventory.transfer_history"))
 
-    b_from = db.session.query(Branch).filter_by(id=t.from_branch_id, company_id=company_id, is_active=True).first()
-    b_to = db.session.query(Branch).filter_by(id=t.to_branch_id, company_id=company_id, is_active=True).first()
+    b_from = company_meta.get_branch(db.session, company_id=company_id, branch_id=t.from_branch_id)
+    b_to = company_meta.get_branch(db.session, company_id=company_id, branch_id=t.to_branch_id)
     if not b_from or not b_to:
         flash("Origen/destino inválido.", "error")
         return redirect(url_for("inventory.transfer_history"))
@@ -293,18 +409,19 @@ def transfer_confirm(transfer_id: int):
     to_type = LocationType.WAREHOUSE if b_to.is_warehouse else LocationType.BRANCH
 
     try:
+        lines: dict[int, Decimal] = {}
         for it in t.items:
-            transfer_stock(
-                db.session,
-                company_id=company_id,
-                product_id=it.product_id,
-                from_location_type=from_type,
-                from_location_id=b_from.id,
-                to_location_type=to_type,
-                to_location_id=b_to.id,
-                qty=str(it.qty),
-                note=(t.note or f"Transferencia #{t.id}"),
-            )
+            lines[it.product_id] = lines.get(it.product_id, Decimal("0.000")) + Decimal(str(it.qty))
+        transfer_lines(
+            db.session,
+            company_id=company_id,
+            from_location_type=from_type,
+            from_location_id=b_from.id,
+            to_location_type=to_type,
+            to_location_id=b_to.id,
+            lines=lines,
+            note=(t.note or f"Transferencia #{t.id}"),
+        )
         t.status = "CONFIRMED"
         t.confirmed_at = datetime.utcnow()
         db.session.commit()
@@ -1,17 +1,23 @@
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from flask_login import login_required
-from sqlalchemy import func
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import current_user, login_required
+from sqlalchemy import case, func
 
 from models import db
-from models.branch import Branch
 from models.product import Product
 from models.inventory import Inventory, LocationType
 from models.membership import Role
-from routes.guards import require_context, require_roles
-from models.kardex import KardexMovement, KardexMoveType
+from routes.guards import current_context, require_context, require_roles
+from models.kardex import KardexMoveType
+from models.inventory_analytics import AbcClass, InventoryAnalyticsSnapshot
+from models.stock_count import StockCount, StockCountLine, StockCountStatus
+from models.valuation import InventoryValuationSnapshot, InventoryValuationSnapshotLine
+from services import company_meta, stock_counts, valuation
+from services.company_meta import BranchInfo
+from services.products import resolve_codes
+from services.stock import add_stock, apply_counts, remove_stock
 
 inventory_admin_bp = Blueprint("inventory_admin", __name__, url_prefix="/inventory-admin")
 
@@ -19,14 +25,6 @@ inventory_admin_bp = Blueprint("inventory_admin", __name__, url_prefix="/invento
 # -------------------------
 # Helpers
 # -------------------------
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
-def _branch_id() -> int:
-    return int(session["branch_id"])
-
-
 def _clean_str(v: str | None) -> str:
     return (v or "").strip()
 
@@ -51,17 +49,13 @@ def _to_decimal_qty(v: str | None) -> Decimal:
     return d.quantize(Decimal("0.001"))
 
 
-def _role() -> str:
-    return (_clean_str(session.get("role"))).upper()
-
-
 def _allowed_branch_id(requested_branch_id: int) -> int:
     """
     Si es SELLER, fuerza su sucursal.
     Si es ADMIN/OWNER, permite elegir.
     """
-    current = _branch_id()
-    if _role() == Role.SELLER:
+    current = current_context().branch_id
+    if current_context().role == Role.SELLER:
         return current
     return requested_branch_id or current
 
@@ -74,7 +68,7 @@ def _allowed_branch_id(requested_branch_id: int) -> int:
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def stock_list():
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     branch_id_raw = _to_int(request.args.get("branch_id"), 0)
     branch_id = _allowed_branch_id(branch_id_raw)
@@ -83,16 +77,7 @@ def stock_list():
     only_low = _clean_str(request.args.get("low")) == "1"
 
     # sucursales (solo no bodega para vista retail)
-    branches = (
-        db.session.query(Branch)
-        .filter(
-            Branch.company_id == company_id,
-            Branch.is_active == True,
-            Branch.is_warehouse == False,
-        )
-        .order_by(Branch.name.asc())
-        .all()
-    )
+    branches = company_meta.branches(db.session, company_id=company_id, warehouse=False)
 
     # Query: productos + inventario en esa sucursal
     # LEFT JOIN para que aparezca producto aunque no exista fila en inventory todavía.
@@ -131,7 +116,7 @@ def stock_list():
     rows = base.order_by(Product.name.asc()).limit(500).all()
 
     # branch seleccionado
-    selected_branch = db.session.get(Branch, branch_id)
+    selected_branch = company_meta.get_branch(db.session, company_id=company_id, branch_id=branch_id, active_only=False)
 
     return render_template(
         "inventory_stock.html",
@@ -141,7 +126,7 @@ def stock_list():
         rows=rows,
         q=q,
         only_low=only_low,
-        role=_role(),
+        role=current_context().role,
     )
 
 
@@ -156,12 +141,12 @@ def stock_adjust_post():
     """
     Ajusta stock a mano:
     - puede sumar (+) o restar (-)
-    - registra Kardex ADJUST
-    - actualiza Inventory
+    - registra Kardex ADJUST / SHRINKAGE / DAMAGE
+    - actualiza Inventory (vía services.stock)
     """
-    company_id = _company_id()
+    company_id = current_context().company_id
 
-    branch_id = _allowed_branch_id(_to_int(request.form.get("branch_id"), _branch_id()))
+    branch_id = _allowed_branch_id(_to_int(request.form.get("branch_id"), current_context().branch_id))
     product_id = _to_int(request.form.get("product_id"), 0)
 
     qty_delta = _to_decimal_qty(request.form.get("qty_delta"))
@@ -185,34 +170,20 @@ def stock_adjust_post():
         flash("Producto no encontrado.", "error")
         return redirect(url_for("inventory_admin.stock_list", branch_id=branch_id))
 
-    inv = (
-        db.session.query(Inventory)
+    current = (
+        db.session.query(Inventory.qty)
         .filter(
             Inventory.company_id == company_id,
             Inventory.product_id == product_id,
             Inventory.location_type == LocationType.BRANCH,
             Inventory.location_id == branch_id,
         )
-        .first()
+        .scalar()
     )
-    if not inv:
-        inv = Inventory(
-            company_id=company_id,
-            product_id=product_id,
-            location_type=LocationType.BRANCH,
-            location_id=branch_id,
-            qty=Decimal("0.000"),
-        )
-        db.session.add(inv)
-        db.session.flush()
-
-    new_qty = Decimal(str(inv.qty)) + qty_delta
-    if new_qty < 0:
+    if Decimal(str(current or 0)) + qty_delta < 0:
         flash("No puedes dejar stock negativo.", "error")
         return redirect(url_for("inventory_admin.stock_list", branch_id=branch_id))
 
-    inv.qty = new_qty
-
     # Determinar tipo de movimiento en Kardex
     move_type = KardexMoveType.ADJUST
     if qty_delta < 0:
@@ -223,21 +194,23 @@ def stock_adjust_post():
         else:
             move_type = KardexMoveType.ADJUST
 
-    # Kardex
-    km = KardexMovement(
-        company_id=company_id,
-        product_id=product_id,
-        move_type=move_type,
-        from_location_type=None if qty_delta > 0 else LocationType.BRANCH,
-        from_location_id=None if qty_delta > 0 else branch_id,
-        to_location_type=LocationType.BRANCH if qty_delta > 0 else None,
-        to_location_id=branch_id if qty_delta > 0 else None,
-        qty=abs(qty_delta),
-        unit_cost=None,
-        note=note,
-        created_at=datetime.utcnow(),
-    )
-    db.session.add(km)
+    # Inventario + kardex + costo + valorización en una sola vía (services.stock)
+    stock_fn = add_stock if qty_delta > 0 else remove_stock
+    try:
+        stock_fn(
+            db.session,
+            company_id=company_id,
+            product_id=product_id,
+            location_type=LocationType.BRANCH,
+            location_id=branch_id,
+            qty=abs(qty_delta),
+            move_type=move_type,
+            note=note,
+        )
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.stock_list", branch_id=branch_id))
 
     db.session.commit()
     flash("Stock ajustado correctamente.", "message")
@@ -245,76 +218,586 @@ def stock_adjust_post():
 
 
 # -------------------------
-# Reporte de inventario valorizado (ADMIN/OWNER)
+# Hoja de conteo (ajuste masivo) (ADMIN/OWNER)
 # -------------------------
-@inventory_admin_bp.get("/valuation")
+def _count_location(company_id: int, branch_id: int) -> BranchInfo | None:
+    return company_meta.get_branch(db.session, company_id=company_id, branch_id=branch_id)
+
+
+def _parse_count_paste(raw: str) -> tuple[dict[str, Decimal], list[str]]:
+    """
+    Líneas "código cantidad" (tab, ; o espacio). Sin cantidad cuenta 1
+    (un escaneo por unidad). Los códigos repetidos se suman.
+    """
+    totals: dict[str, Decimal] = {}
+    bad: list[str] = []
+    for line in (raw or "").splitlines():
+        parts = line.replace("\t", " ").replace(";", " ").split()
+        if not parts:
+            continue
+        qty = Decimal("1.000")
+        if len(parts) > 1:
+            try:
+                qty = Decimal(parts[-1].replace(",", ".")).quantize(Decimal("0.001"))
+            except (InvalidOperation, ValueError):
+                qty = Decimal("-1")
+        if qty < 0:
+            bad.append(line.strip())
+            continue
+        totals[parts[0]] = totals.get(parts[0], Decimal("0.000")) + qty
+    return totals, bad
+
+
+@inventory_admin_bp.get("/stock/count")
 @login_required
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
-def valuation_get():
-    company_id = _company_id()
+def stock_count_get():
+    """Hoja de conteo: stock actual de la ubicación + columna para lo contado."""
+    company_id = current_context().company_id
+    branch_id = _to_int(request.args.get("branch_id"), current_context().branch_id)
+    q = _clean_str(request.args.get("q"))
 
-    # Selección de sucursal (o todas)
-    branch_id = _to_int(request.args.get("branch_id"), 0)
+    branches = company_meta.branches(db.session, company_id=company_id)
+    location = next((b for b in branches if b.id == branch_id), None)
+    if not location:
+        flash("Ubicación inválida.", "error")
+        return redirect(url_for("inventory_admin.stock_list"))
+    loc_type = LocationType.WAREHOUSE if location.is_warehouse else LocationType.BRANCH
 
-    branches = (
-        db.session.query(Branch)
-        .filter(Branch.company_id == company_id, Branch.is_active == True)
-        .order_by(Branch.name.asc())
-        .all()
-    )
-
-    # Query base de inventario
-    q = (
+    base = (
         db.session.query(
             Product.id.label("product_id"),
             Product.name.label("name"),
             Product.sku.label("sku"),
             Product.barcode.label("barcode"),
-            Product.image_path.label("image_path"),
-            Product.cost_price.label("cost_price"),
-            func.coalesce(func.sum(Inventory.qty), 0).label("qty"),
+            func.coalesce(Inventory.qty, 0).label("qty"),
+        )
+        .outerjoin(
+            Inventory,
+            (Inventory.company_id == Product.company_id)
+            & (Inventory.product_id == Product.id)
+            & (Inventory.location_type == loc_type)
+            & (Inventory.location_id == location.id)
         )
-        .join(Inventory, (Inventory.product_id == Product.id) & (Inventory.company_id == company_id))
         .filter(Product.company_id == company_id, Product.is_active == True)
     )
+    if q:
+        like = f"%{q}%"
+        base = base.filter((Product.name.ilike(like)) | (Product.sku.ilike(like)) | (Product.barcode.ilike(like)))
+
+    rows = base.order_by(Product.name.asc()).all()
 
-    if branch_id and branch_id > 0:
-        q = q.filter(Inventory.location_id == branch_id)
+    return render_template(
+        "inventory_count.html",
+        branches=branches,
+        location=location,
+        rows=rows,
+        q=q,
+    )
+
+
+@inventory_admin_bp.post("/stock/count")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def stock_count_post():
+    """
+    Aplica la hoja de conteo en UNA transacción vía services.stock.apply_counts:
+    una lectura de inventario y todos los movimientos (entradas ADJUST, salidas
+    ADJUST/SHRINKAGE/DAMAGE) juntos.
+    """
+    company_id = current_context().company_id
+    branch_id = _to_int(request.form.get("branch_id"), 0)
+    location = _count_location(company_id, branch_id)
+    if not location:
+        flash("Ubicación inválida.", "error")
+        return redirect(url_for("inventory_admin.stock_list"))
+
+    reason = _clean_str(request.form.get("reason")).upper() or KardexMoveType.ADJUST
+    if reason not in (KardexMoveType.ADJUST, KardexMoveType.SHRINKAGE, KardexMoveType.DAMAGE):
+        reason = KardexMoveType.ADJUST
+    note = _clean_str(request.form.get("note")) or f"Conteo físico {datetime.utcnow():%Y-%m-%d}"
+
+    # 1) Columnas de la hoja: count_<product_id> (vacío = no contado)
+    counts: dict[int, Decimal] = {}
+    for key, raw in request.form.items():
+        if not key.startswith("count_") or _clean_str(raw) == "":
+            continue
+        pid = _to_int(key[len("count_"):], 0)
+        qty = _to_decimal_qty(raw)
+        if pid > 0 and qty >= 0:
+            counts[pid] = qty
+
+    # 2) Pegado/escaneo: reemplaza lo escrito en la hoja para esos productos
+    pasted, bad_lines = _parse_count_paste(request.form.get("paste"))
+    if pasted:
+        codes = resolve_codes(db.session, company_id=company_id, codes=pasted.keys())
+        by_product: dict[int, Decimal] = {}
+        for code, qty in pasted.items():
+            pid = codes.get(code)
+            if pid is None:
+                bad_lines.append(code)
+                continue
+            by_product[pid] = by_product.get(pid, Decimal("0.000")) + qty
+        counts.update(by_product)
+
+    # Solo productos de la empresa (un IN)
+    if counts:
+        valid = {
+            pid for (pid,) in db.session.query(Product.id).filter(
+                Product.company_id == company_id, Product.id.in_(list(counts.keys()))
+            )
+        }
+        counts = {pid: qty for pid, qty in counts.items() if pid in valid}
+
+    if not counts:
+        flash("No hay cantidades contadas.", "error")
+        return redirect(url_for("inventory_admin.stock_count_get", branch_id=location.id))
+
+    try:
+        lines = apply_counts(
+            db.session,
+            company_id=company_id,
+            location_type=LocationType.WAREHOUSE if location.is_warehouse else LocationType.BRANCH,
+            location_id=location.id,
+            counts=counts,
+            out_move_type=reason,
+            note=note[:255],
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.stock_count_get", branch_id=location.id))
+
+    flash(f"Conteo aplicado: {len(counts)} productos contados, {len(lines)} con diferencia.", "message")
+    if bad_lines:
+        flash(f"Líneas no reconocidas ({len(bad_lines)}): {', '.join(bad_lines[:10])}", "error")
+    return redirect(url_for("inventory_admin.stock_count_get", branch_id=location.id))
+
+
+# -------------------------
+# Sesiones de conteo físico con escaneo por lotes (ADMIN/OWNER)
+# -------------------------
+def _get_count(company_id: int, count_id: int) -> StockCount | None:
+    return (
+        db.session.query(StockCount)
+        .filter(StockCount.id == count_id, StockCount.company_id == company_id)
+        .first()
+    )
+
+
+@inventory_admin_bp.get("/counts")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_list():
+    company_id = current_context().company_id
+    status = _clean_str(request.args.get("status")).upper()
+
+    branches = company_meta.branches(db.session, company_id=company_id, include_inactive=True)
+
+    q = db.session.query(StockCount).filter(StockCount.company_id == company_id)
+    if status in StockCountStatus.ALL:
+        q = q.filter(StockCount.status == status)
+    counts = q.order_by(StockCount.id.desc()).limit(100).all()
+
+    return render_template(
+        "stock_counts.html",
+        counts=counts,
+        branches=[b for b in branches if b.is_active],
+        branch_map={b.id: b for b in branches},
+        selected_branch_id=current_context().branch_id,
+        statuses=sorted(StockCountStatus.ALL),
+        selected_status=status,
+    )
+
+
+@inventory_admin_bp.post("/counts/open")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_open():
+    company_id = current_context().company_id
+    location = _count_location(company_id, _to_int(request.form.get("branch_id"), 0))
+    if not location:
+        flash("Ubicación inválida.", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    try:
+        sc = stock_counts.open_count(
+            db.session,
+            company_id=company_id,
+            location_type=LocationType.WAREHOUSE if location.is_warehouse else LocationType.BRANCH,
+            location_id=location.id,
+            user_id=current_user.id,
+            note=_clean_str(request.form.get("note"))[:255] or None,
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    flash(f"Conteo #{sc.id} abierto.", "message")
+    return redirect(url_for("inventory_admin.counts_detail", count_id=sc.id))
+
+
+@inventory_admin_bp.get("/counts/<int:count_id>")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_detail(count_id: int):
+    """Esperado vs contado. only=diff|pending filtra las líneas."""
+    company_id = current_context().company_id
+    sc = _get_count(company_id, count_id)
+    if not sc:
+        flash("Conteo no encontrado.", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    only = _clean_str(request.args.get("only")).lower()
+    L = StockCountLine
+    q = (
+        db.session.query(
+            L.product_id, L.expected_qty, L.counted_qty,
+            Product.name, Product.sku, Product.barcode,
+        )
+        .join(Product, Product.id == L.product_id)
+        .filter(L.count_id == sc.id)
+    )
+    if only == "diff":
+        q = q.filter(L.counted_qty.isnot(None), L.counted_qty != L.expected_qty)
+    elif only == "pending":
+        q = q.filter(L.counted_qty.is_(None))
+
+    total, counted = (
+        db.session.query(func.count(L.id), func.count(L.counted_qty))
+        .filter(L.count_id == sc.id)
+        .first()
+    )
+
+    return render_template(
+        "stock_count_detail.html",
+        sc=sc,
+        location=company_meta.get_branch(db.session, company_id=sc.company_id, branch_id=sc.location_id, active_only=False),
+        rows=q.order_by(Product.name.asc()).all(),
+        total_lines=int(total or 0),
+        counted_lines=int(counted or 0),
+        only=only,
+        is_open=sc.status == StockCountStatus.OPEN,
+    )
+
+
+@inventory_admin_bp.post("/counts/<int:count_id>/scans")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_scans(count_id: int):
+    """
+    Ingesta para handhelds: JSON {"scans": ["750...", {"code": "750...", "qty": 6}, ...]}.
+    Cada lote se agrega en memoria y se aplica con pocas sentencias.
+    """
+    sc = _get_count(current_context().company_id, count_id)
+    if not sc:
+        return jsonify({"error": "Conteo no encontrado."}), 404
+
+    payload = request.get_json(silent=True) or {}
+    scans = payload.get("scans") if isinstance(payload, dict) else payload
+    if not isinstance(scans, list):
+        return jsonify({"error": "Se espera {\"scans\": [...]}."}), 400
+
+    try:
+        result = stock_counts.ingest_scans(db.session, count=sc, scans=scans)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 409
+
+    result["scan_count"] = sc.scan_count
+    return jsonify(result)
+
+
+@inventory_admin_bp.post("/counts/<int:count_id>/scans-form")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_scans_form(count_id: int):
+    """Alternativa sin JS: pegar líneas "código cantidad" (mismo formato que la hoja)."""
+    sc = _get_count(current_context().company_id, count_id)
+    if not sc:
+        flash("Conteo no encontrado.", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    pasted, bad_lines = _parse_count_paste(request.form.get("paste"))
+    try:
+        result = stock_counts.ingest_scans(
+            db.session,
+            count=sc,
+            scans=[{"code": code, "qty": qty} for code, qty in pasted.items()],
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.counts_detail", count_id=sc.id))
+
+    flash(f"Escaneos registrados: {result['products']} productos.", "message")
+    bad_lines += result["unknown"]
+    if bad_lines:
+        flash(f"Líneas no reconocidas ({len(bad_lines)}): {', '.join(bad_lines[:10])}", "error")
+    return redirect(url_for("inventory_admin.counts_detail", count_id=sc.id))
+
+
+@inventory_admin_bp.post("/counts/<int:count_id>/close")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_close(count_id: int):
+    sc = _get_count(current_context().company_id, count_id)
+    if not sc:
+        flash("Conteo no encontrado.", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    reason = _clean_str(request.form.get("reason")).upper() or KardexMoveType.ADJUST
+    if reason not in (KardexMoveType.ADJUST, KardexMoveType.SHRINKAGE, KardexMoveType.DAMAGE):
+        reason = KardexMoveType.ADJUST
+
+    try:
+        n = stock_counts.close_count(
+            db.session,
+            count=sc,
+            user_id=current_user.id,
+            out_move_type=reason,
+            zero_missing=request.form.get("zero_missing") == "1",
+        )
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.counts_detail", count_id=count_id))
+
+    flash(f"Conteo #{sc.id} cerrado: {n} productos ajustados.", "message")
+    return redirect(url_for("inventory_admin.counts_detail", count_id=sc.id))
+
+
+@inventory_admin_bp.post("/counts/<int:count_id>/cancel")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def counts_cancel(count_id: int):
+    sc = _get_count(current_context().company_id, count_id)
+    if not sc:
+        flash("Conteo no encontrado.", "error")
+        return redirect(url_for("inventory_admin.counts_list"))
+
+    try:
+        stock_counts.cancel_count(db.session, count=sc, user_id=current_user.id)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        flash(f"Error: {e}", "error")
+        return redirect(url_for("inventory_admin.counts_detail", count_id=count_id))
+
+    flash(f"Conteo #{sc.id} cancelado.", "message")
+    return redirect(url_for("inventory_admin.counts_list"))
+
+
+# -------------------------
+# Reporte de inventario valorizado (ADMIN/OWNER)
+# -------------------------
+@inventory_admin_bp.get("/valuation")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def valuation_get():
+    """
+    Inventario valorizado.
+    - En vivo: totales desde inventory_valuations (mantenidos por services.stock),
+      detalle por producto con el valor a costo promedio (Inventory.stock_value).
+      Incluye productos inactivos con stock: su valor también está en el total.
+    - Histórico (snapshot_id): lee solo las líneas de la foto.
+    """
+    company_id = current_context().company_id
+
+    # Selección de sucursal (o todas)
+    branch_id = _to_int(request.args.get("branch_id"), 0)
+    snapshot_id = _to_int(request.args.get("snapshot_id"), 0)
+
+    branches = sorted(company_meta.branches(db.session, company_id=company_id), key=lambda b: b.name)
+
+    snapshots = (
+        db.session.query(InventoryValuationSnapshot)
+        .filter(InventoryValuationSnapshot.company_id == company_id)
+        .order_by(InventoryValuationSnapshot.taken_at.desc())
+        .limit(36)
+        .all()
+    )
+    snapshot = next((sn for sn in snapshots if sn.id == snapshot_id), None)
+    if snapshot_id and not snapshot:
+        snapshot = (
+            db.session.query(InventoryValuationSnapshot)
+            .filter(
+                InventoryValuationSnapshot.id == snapshot_id,
+                InventoryValuationSnapshot.company_id == company_id,
+            )
+            .first()
+        )
+
+    if snapshot:
+        L = InventoryValuationSnapshotLine
+        q = (
+            db.session.query(
+                Product.id.label("product_id"),
+                Product.name.label("name"),
+                Product.sku.label("sku"),
+                Product.barcode.label("barcode"),
+                Product.image_path.label("image_path"),
+                Product.is_active.label("is_active"),
+                func.max(L.unit_cost).label("cost"),
+                func.coalesce(func.sum(L.qty), 0).label("qty"),
+                func.coalesce(func.sum(L.value), 0).label("value"),
+            )
+            .join(L, L.product_id == Product.id)
+            .filter(L.snapshot_id == snapshot.id)
+        )
+        if branch_id > 0:
+            q = q.filter(L.location_id == branch_id)
+    else:
+        q = (
+            db.session.query(
+                Product.id.label("product_id"),
+                Product.name.label("name"),
+                Product.sku.label("sku"),
+                Product.barcode.label("barcode"),
+                Product.image_path.label("image_path"),
+                Product.is_active.label("is_active"),
+                # Costo promedio ponderado de las ubicaciones seleccionadas
+                func.coalesce(
+                    func.sum(Inventory.stock_value) / func.nullif(func.sum(Inventory.qty), 0),
+                    Product.cost_price,
+                ).label("cost"),
+                func.coalesce(func.sum(Inventory.qty), 0).label("qty"),
+                func.coalesce(func.sum(Inventory.stock_value), 0).label("value"),
+            )
+            .join(Inventory, (Inventory.product_id == Product.id) & (Inventory.company_id == company_id))
+            .filter(Product.company_id == company_id)
+        )
+        if branch_id > 0:
+            q = q.filter(Inventory.location_id == branch_id)
+
+    rows = q.group_by(Product.id).order_by(Product.name.asc()).all()
+
+    # Totales: foto o totales en vivo (sin recorrer filas)
+    if snapshot and branch_id <= 0:
+        total_qty = Decimal(str(snapshot.qty_total or 0))
+        total_value = Decimal(str(snapshot.value_total or 0)).quantize(Decimal("0.01"))
+    elif snapshot:
+        total_qty = sum((Decimal(str(r.qty or 0)) for r in rows), Decimal("0.000"))
+        total_value = sum((Decimal(str(r.value or 0)) for r in rows), Decimal("0.00")).quantize(Decimal("0.01"))
     else:
-        # todas las ubicaciones de la empresa
-        q = q.filter(Inventory.company_id == company_id)
-
-    q = q.group_by(Product.id).order_by(Product.name.asc())
-
-    rows = q.all()
-
-    # Totales valorizados
-    total_qty = Decimal("0.000")
-    total_value = Decimal("0.00")
-    out = []
-    for r in rows:
-        qty = Decimal(str(r.qty or 0))
-        cost = Decimal(str(r.cost_price or 0)).quantize(Decimal("0.01"))
-        value = (qty * cost).quantize(Decimal("0.01"))
-        total_qty += qty
-        total_value += value
-        out.append({
-            "product_id": r.product_id,
-            "name": r.name,
-            "sku": r.sku,
-            "barcode": r.barcode,
-            "image_path": r.image_path,
-            "qty": qty,
-            "cost": cost,
-            "value": value,
-        })
+        total_qty, total_value = valuation.location_totals(
+            db.session, company_id=company_id, location_id=branch_id or None
+        )
 
     return render_template(
         "inventory_valuation.html",
         branches=branches,
         selected_branch_id=branch_id,
-        rows=out,
+        snapshots=snapshots,
+        selected_snapshot=snapshot,
+        rows=rows,
         total_qty=total_qty,
         total_value=total_value,
     )
+
+
+@inventory_admin_bp.post("/valuation/snapshot")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def valuation_snapshot_post():
+    """Toma una foto del inventario valorizado (ej: cierre de mes)."""
+    company_id = current_context().company_id
+    label = _clean_str(request.form.get("label")) or datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+
+    snap = valuation.take_snapshot(
+        db.session,
+        company_id=company_id,
+        label=label[:60],
+        user_id=getattr(current_user, "id", None),
+    )
+    db.session.commit()
+    flash(f"Foto de valorización guardada ({snap.label}).", "message")
+    return redirect(url_for("inventory_admin.valuation_get", snapshot_id=snap.id))
+
+
+# -------------------------
+# Analítica ABC / stock muerto (lee la foto del job batch)
+# -------------------------
+@inventory_admin_bp.get("/analytics")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def analytics_get():
+    """
+    Muestra la última foto de `flask inventory-analytics`.
+    No calcula nada en el request: solo lee inventory_analytics_snapshots.
+    """
+    company_id = current_context().company_id
+
+    branch_id = _to_int(request.args.get("branch_id"), 0)
+    abc = _clean_str(request.args.get("abc")).upper()
+    only_dead = _clean_str(request.args.get("dead")) == "1"
+
+    branches = company_meta.branches(db.session, company_id=company_id)
+
+    S = InventoryAnalyticsSnapshot
+    base = db.session.query(S).filter(S.company_id == company_id)
+    if branch_id > 0:
+        base = base.filter(S.location_id == branch_id)
+
+    # Resumen por clase (sobre la ubicación elegida)
+    summary = {
+        cls: {"count": int(cnt or 0), "revenue": Decimal(str(rev or 0)), "dead": int(dead or 0)}
+        for cls, cnt, rev, dead in (
+            base.with_entities(
+                S.abc_class,
+                func.count(S.id),
+                func.coalesce(func.sum(S.revenue), 0),
+                func.coalesce(func.sum(case((S.is_dead_stock == True, 1), else_=0)), 0),
+            )
+            .group_by(S.abc_class)
+            .all()
+        )
+    }
+    computed_at = base.with_entities(func.max(S.computed_at)).scalar()
+
+    if abc in AbcClass.ALL:
+        base = base.filter(S.abc_class == abc)
+    if only_dead:
+        base = base.filter(S.is_dead_stock == True)
+
+    rows = (
+        base.join(Product, Product.id == S.product_id)
+        .with_entities(
+            S.location_id, S.product_id, S.abc_class, S.revenue, S.qty_sold, S.qty_on_hand,
+            S.avg_daily_sales, S.coverage_days, S.last_sale_at, S.is_dead_stock,
+            Product.name.label("name"), Product.sku.label("sku"),
+        )
+        .order_by(S.is_dead_stock.desc(), S.abc_class.asc(), S.revenue.desc())
+        .limit(500)
+        .all()
+    )
+
+    return render_template(
+        "inventory_analytics.html",
+        branches=branches,
+        location_map={b.id: b for b in branches},
+        selected_branch_id=branch_id,
+        selected_abc=abc,
+        only_dead=only_dead,
+        summary=summary,
+        computed_at=computed_at,
+        rows=rows,
+    )
@@ -1,20 +1,22 @@
 from datetime import datetime, timedelta
 
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
+from sqlalchemy import and_, or_, select, union
 
 from models import db
-from models.kardex import KardexMovement, KardexMoveType
+from models.kardex import KardexMovement, KardexMovementArchive, KardexMoveType
 from models.product import Product
-from models.branch import Branch
 from models.membership import Role
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
+from routes.pagination import decode_cursor, encode_cursor
+from services import company_meta, kardex_archive
+from services.stock import stock_as_of
 
 kardex_bp = Blueprint("kardex", __name__, url_prefix="/kardex")
 
-
-def _company_id() -> int:
-    return int(session["company_id"])
+KARDEX_PAGE_SIZE = 100
+KARDEX_MAX_PAGE_SIZE = 500
 
 
 def _parse_date(s: str | None, default: datetime) -> datetime:
@@ -26,129 +28,221 @@ def _parse_date(s: str | None, default: datetime) -> datetime:
         return default
 
 
-@kardex_bp.get("/")
-@login_required
-@require_context()
-@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
-def list_kardex():
-    company_id = _company_id()
+def _to_int(v: str | None) -> int | None:
+    try:
+        return int((v or "").strip())
+    except ValueError:
+        return None
 
-    # Defaults: últimos 7 días
-    today = datetime.now()
-    default_from = today - timedelta(days=6)
-    default_to = today
 
-    date_from = _parse_date(request.args.get("from"), default_from)
-    date_to = _parse_date(request.args.get("to"), default_to)
-    date_to_end = date_to + timedelta(days=1)
+def _resolve_product_id(company_id: int, product_id_raw: str, product_q: str) -> int | None:
+    """product_id explícito, o búsqueda por barcode/sku exacto y luego por nombre."""
+    product_id = _to_int(product_id_raw)
+    if product_id or not product_q:
+        return product_id
 
-    product_q = (request.args.get("product_q") or "").strip()
-    product_id_raw = (request.args.get("product_id") or "").strip()
-    move_type = (request.args.get("move_type") or "").strip().upper()
-    location_id_raw = (request.args.get("location_id") or "").strip()
-
-    # Productos (para select / helper)
-    products = (
-        db.session.query(Product)
-        .filter(Product.company_id == company_id, Product.is_active == True)
-        .order_by(Product.name.asc())
-        .limit(300)
-        .all()
-    )
-
-    # Ubicaciones (branches + bodega(s))
-    locations = (
-        db.session.query(Branch)
-        .filter(Branch.company_id == company_id, Branch.is_active == True)
-        .order_by(Branch.is_warehouse.desc(), Branch.name.asc())
-        .all()
+    p = (
+        db.session.query(Product.id)
+        .filter(
+            Product.company_id == company_id,
+            Product.is_active == True,
+            (Product.barcode == product_q) | (Product.sku == product_q)
+        )
+        .first()
     )
-
-    # Resolver product_id:
-    product_id = None
-    if product_id_raw:
-        try:
-            product_id = int(product_id_raw)
-        except ValueError:
-            product_id = None
-
-    if not product_id and product_q:
-        # Buscar por barcode o sku exacto
+    if not p:
         p = (
-            db.session.query(Product)
+            db.session.query(Product.id)
             .filter(
                 Product.company_id == company_id,
                 Product.is_active == True,
-                (Product.barcode == product_q) | (Product.sku == product_q)
+                Product.name.ilike(f"%{product_q}%")
             )
+            .order_by(Product.name.asc())
             .first()
         )
-        # Si no, por nombre
-        if not p:
-            p = (
-                db.session.query(Product)
-                .filter(
-                    Product.company_id == company_id,
-                    Product.is_active == True,
-                    Product.name.ilike(f"%{product_q}%")
-                )
-                .order_by(Product.name.asc())
-                .first()
-            )
-        if p:
-            product_id = p.id
-        elif product_q:
-            flash("No se encontró el producto con ese criterio.", "error")
-
-    # Location
-    location_id = None
-    if location_id_raw:
-        try:
-            location_id = int(location_id_raw)
-        except ValueError:
-            location_id = None
-
-    q = (
-        db.session.query(KardexMovement)
-        .filter(
-            KardexMovement.company_id == company_id,
-            KardexMovement.created_at >= date_from,
-            KardexMovement.created_at < date_to_end,
-        )
-        .order_by(KardexMovement.created_at.desc(), KardexMovement.id.desc())
-    )
+    return p.id if p else None
 
-    if product_id:
-        q = q.filter(KardexMovement.product_id == product_id)
 
-    if move_type and move_type in KardexMoveType.ALL:
-        q = q.filter(KardexMovement.move_type == move_type)
+def _read_filters(company_id: int) -> dict:
+    """Filtros comunes (HTML y JSON) desde la querystring."""
+    # Defaults: últimos 7 días
+    today = datetime.now()
+    date_from = _parse_date(request.args.get("from"), today - timedelta(days=6))
+    date_to = _parse_date(request.args.get("to"), today)
 
-    # Filtrar por ubicación: si aparece como origen o destino
-    if location_id:
-        q = q.filter(
-            (KardexMovement.from_location_id == location_id) |
-            (KardexMovement.to_location_id == location_id)
-        )
+    product_q = (request.args.get("product_q") or "").strip()
+    move_type = (request.args.get("move_type") or "").strip().upper()
+
+    size = _to_int(request.args.get("limit")) or KARDEX_PAGE_SIZE
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "date_to_end": date_to + timedelta(days=1),
+        "product_q": product_q,
+        "product_id": _resolve_product_id(company_id, request.args.get("product_id"), product_q),
+        "move_type": move_type if move_type in KardexMoveType.ALL else "",
+        "location_id": _to_int(request.args.get("location_id")),
+        "cursor": decode_cursor(request.args.get("cursor")),
+        "limit": max(1, min(size, KARDEX_MAX_PAGE_SIZE)),
+    }
+
+
+def _page_query(K, company_id: int, f: dict, size: int):
+    """Consulta de una página sobre una tabla de kardex (viva o archivo)."""
+    filters = [
+        K.company_id == company_id,
+        K.created_at >= f["date_from"],
+        K.created_at < f["date_to_end"],
+    ]
+    if f["product_id"]:
+        filters.append(K.product_id == f["product_id"])
+    if f["move_type"]:
+        filters.append(K.move_type == f["move_type"])
+    if f["cursor"]:
+        ts, mid = f["cursor"]
+        filters.append(or_(K.created_at < ts, and_(K.created_at == ts, K.id < mid)))
+
+    order = (K.created_at.desc(), K.id.desc())
+    q = db.session.query(K).order_by(*order)
+
+    # Filtrar por ubicación: si aparece como origen o destino.
+    # En vez de un OR (que no usa índice), una rama por lado sobre
+    # (company, location, created_at), cada una ya limitada, y se unen los ids.
+    if f["location_id"]:
+        legs = [
+            select(K.id)
+            .where(col == f["location_id"], *filters)
+            .order_by(*order)
+            .limit(size)
+            .subquery()
+            for col in (K.from_location_id, K.to_location_id)
+        ]
+        ids = union(select(legs[0].c.id), select(legs[1].c.id))
+        q = q.filter(K.id.in_(ids))
+    else:
+        q = q.filter(*filters)
+
+    return q.limit(size)
+
+
+def _kardex_page(company_id: int, f: dict) -> tuple[list, str | None]:
+    """
+    Una página del kardex, del más nuevo al más viejo, con keyset (created_at, id):
+    el costo por página no depende de cuán atrás esté. Devuelve (movimientos, next_cursor).
+
+    Si el rango cae antes del horizonte de archivo, se consulta también
+    `kardex_movements_archive` y se mezclan ambas páginas (los ids no se repiten).
+    """
+    size = f["limit"]
+    rows = _page_query(KardexMovement, company_id, f, size + 1).all()
+
+    h = kardex_archive.horizon(db.session, company_id=company_id)
+    if h and f["date_from"] < h:
+        archived = _page_query(KardexMovementArchive, company_id, f, size + 1).all()
+        rows = sorted(rows + archived, key=lambda m: (m.created_at, m.id), reverse=True)[:size + 1]
+
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def _names_for_page(company_id: int, movements: list[KardexMovement]) -> dict:
+    """Nombre/sku/barcode solo de los productos de la página (un IN por página)."""
+    product_ids = {m.product_id for m in movements}
+    if not product_ids:
+        return {}
+    rows = db.session.query(Product.id, Product.name, Product.sku, Product.barcode).filter(
+        Product.company_id == company_id, Product.id.in_(product_ids)
+    )
+    return {r.id: r for r in rows}
 
-    movements = q.limit(300).all()
 
-    # Mapas para mostrar nombres sin joins pesados
-    product_map = {p.id: p for p in products}
-    location_map = {b.id: b for b in locations}
+@kardex_bp.get("/")
+@login_required
+@require_context()
+@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
+def list_kardex():
+    company_id = current_context().company_id
+    f = _read_filters(company_id)
+
+    if f["product_q"] and not f["product_id"]:
+        flash("No se encontró el producto con ese criterio.", "error")
+
+    # Ubicaciones (branches + bodega(s)); el mapa incluye inactivas para nombres históricos
+    all_locations = company_meta.branches(db.session, company_id=company_id, include_inactive=True)
+    locations = [b for b in all_locations if b.is_active]
+
+    movements, next_cursor = _kardex_page(company_id, f)
+
+    # Stock al cierre del rango (producto + ubicación): lectura del saldo en kardex
+    balance_as_of = None
+    if f["product_id"] and f["location_id"]:
+        balance_as_of = stock_as_of(
+            db.session,
+            company_id=company_id,
+            product_id=f["product_id"],
+            location_id=f["location_id"],
+            ts=f["date_to_end"] - timedelta(microseconds=1),
+        )
+
+    # Querystring sin cursor para armar "siguiente" / "primera página"
+    page_args = {k: v for k, v in request.args.items() if k != "cursor"}
 
     return render_template(
         "kardex_list.html",
         movements=movements,
-        products=products,
         locations=locations,
-        product_map=product_map,
-        location_map=location_map,
+        product_map=_names_for_page(company_id, movements),
+        location_map={b.id: b for b in all_locations},
         move_types=sorted(list(KardexMoveType.ALL)),
-        selected_move_type=move_type,
-        selected_product_id=product_id,
-        selected_location_id=location_id,
-        product_q=product_q,
-        date_from=date_from.strftime("%Y-%m-%d"),
-        date_to=date_to.strftime("%Y-%m-%d"),
+        selected_move_type=f["move_type"],
+        selected_product_id=f["product_id"],
+        selected_location_id=f["location_id"],
+        balance_as_of=balance_as_of,
+        product_q=f["product_q"],
+        date_from=f["date_from"].strftime("%Y-%m-%d"),
+        date_to=f["date_to"].strftime("%Y-%m-%d"),
+        page_args=page_args,
+        is_first_page=f["cursor"] is None,
+        next_cursor=next_cursor,
     )
+
+
+@kardex_bp.get("/api/movements")
+@login_required
+@require_context()
+@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
+def api_movements():
+    """
+    Kardex en JSON con paginación por cursor.
+    Mismos filtros que la vista; pasar `cursor=<next_cursor>` para la página siguiente.
+    """
+    company_id = current_context().company_id
+    f = _read_filters(company_id)
+    movements, next_cursor = _kardex_page(company_id, f)
+    names = _names_for_page(company_id, movements)
+
+    def _num(v):
+        return str(v) if v is not None else None
+
+    return jsonify({
+        "items": [
+            {
+                "id": m.id,
+                "created_at": m.created_at.isoformat(),
+                "move_type": m.move_type,
+                "product_id": m.product_id,
+                "product_name": names[m.product_id].name if m.product_id in names else None,
+                "qty": _num(m.qty),
+                "unit_cost": _num(m.unit_cost),
+                "from_location_id": m.from_location_id,
+                "to_location_id": m.to_location_id,
+                "from_balance_after": _num(m.from_balance_after),
+                "to_balance_after": _num(m.to_balance_after),
+                "note": m.note,
+            }
+            for m in movements
+        ],
+        "next_cursor": next_cursor,
+    })
@@ -6,15 +6,14 @@ from flask_login import current_user, login_required
 from sqlalchemy import func
 
 from models import db
-from models.branch import Branch
-from models.company import Company
 from models.expense import Expense
 from models.inventory import Inventory, LocationType
 from models.product import Product
 from models.sale import Sale, SaleItem
 from routes import main_bp
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
 from models.membership import Role
+from services import rankings
 
 
 def _money(v) -> float:
@@ -119,23 +118,15 @@ def _dashboard_payload(company_id: int, branch_id: int):
     from flask import current_app
     threshold = int(getattr(current_app.config, "STOCK_LOW_THRESHOLD", 5))
 
-    top_products_rows = (
-        db.session.query(
-            Product.id,
-            Product.name,
-            Product.image_path,
-            Product.image_updated_at,
-            func.coalesce(func.sum(SaleItem.qty), 0).label("qty_sold"),
-            func.coalesce(func.sum(SaleItem.subtotal), 0).label("amount"),
-        )
-        .join(SaleItem, SaleItem.product_id == Product.id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(Product.company_id == company_id, *base_sales_filters, Sale.created_at >= start_month, Sale.created_at < end_month)
-        .group_by(Product.id)
-        .order_by(func.sum(SaleItem.qty).desc())
-        .limit(5)
-        .all()
-    )
+    # Ranking cacheado (rollup diario, se invalida al vender)
+    top_products_rows = rankings.top_products(
+        db.session,
+        company_id=company_id,
+        branch_ids=[branch_id],
+        date_from=start_month.date(),
+        date_to=(end_month - timedelta(days=1)).date(),
+        limit=5,
+    )["top_by_qty"]
 
     low_stock_rows = (
         db.session.query(Product.id, Product.name, Inventory.qty, Product.image_path, Product.image_updated_at)
@@ -173,11 +164,11 @@ def _dashboard_payload(company_id: int, branch_id: int):
         },
         "top_products": [
             {
-                "id": int(r.id),
-                "name": r.name,
-                "qty_sold": float(r.qty_sold),
-                "amount": _money(r.amount),
-                "image_url": _img_url(r.image_path, r.image_updated_at),
+                "id": int(r["product_id"]),
+                "name": r["product_name"],
+                "qty_sold": float(r["qty_sum"]),
+                "amount": _money(r["amount_sum"]),
+                "image_url": _img_url(r["image_path"], r["image_updated_at"]),
             }
             for r in top_products_rows
         ],
@@ -207,11 +198,10 @@ def home():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def dashboard():
-    company_id = int(session["company_id"])
-    branch_id = int(session["branch_id"])
+    ctx = current_context()
+    company_id, branch_id = ctx.company_id, ctx.branch_id
 
-    company = db.session.get(Company, company_id)
-    branch = db.session.get(Branch, branch_id)
+    company, branch = ctx.company, ctx.branch
     if not company or not branch:
         flash("Contexto inválido. Vuelve a seleccionar.", "error")
         return redirect(url_for("context.select_context"))
@@ -241,7 +231,6 @@ def dashboard():
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def dashboard_stats():
-    company_id = int(session["company_id"])
-    branch_id = int(session["branch_id"])
-    payload = _dashboard_payload(company_id, branch_id)
+    ctx = current_context()
+    payload = _dashboard_payload(ctx.company_id, ctx.branch_id)
     return jsonify(payload)
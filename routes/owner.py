@@ -1,9 +1,12 @@
+from datetime import date, datetime
+
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 
-from models import db
+from models import db, tenancy
 from models.company import Company
 from routes.guards import require_system_owner
+from services import authz, company_meta, consolidated
 
 owner_bp = Blueprint("owner", __name__, url_prefix="/owner")
 
@@ -12,6 +15,36 @@ def _clean_str(v: str | None) -> str:
     return (v or "").strip()
 
 
+def _parse_day(s: str | None, default: date) -> date:
+    try:
+        return datetime.strptime((s or "").strip(), "%Y-%m-%d").date()
+    except ValueError:
+        return default
+
+
+@owner_bp.get("/dashboard")
+@login_required
+@require_system_owner()
+def dashboard():
+    """
+    Consolidado de todas las empresas (ventas, ganancia, gastos, valor de stock)
+    por empresa y sucursal, sin cambiar de contexto. Default: mes en curso.
+    """
+    today = date.today()
+    date_from = _parse_day(request.args.get("from"), today.replace(day=1))
+    date_to = _parse_day(request.args.get("to"), today)
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+
+    data = consolidated.overview(db.session, date_from=date_from, date_to=date_to)
+    return render_template(
+        "owner_dashboard.html",
+        data=data,
+        date_from=date_from.strftime("%Y-%m-%d"),
+        date_to=date_to.strftime("%Y-%m-%d"),
+    )
+
+
 @owner_bp.get("/companies")
 @login_required
 @require_system_owner()
@@ -49,6 +82,10 @@ def companies_new_post():
     db.session.add(c)
     db.session.commit()
 
+    if tenancy.enabled():
+        # Base propia de la empresa (TENANT_DB_MODE=per_company)
+        tenancy.migrate_tenant(c.id)
+
     flash("Empresa creada.", "message")
     return redirect(url_for("owner.companies_list"))
 
@@ -89,6 +126,7 @@ def companies_edit_post(company_id: int):
 
     company.name = name
     db.session.commit()
+    company_meta.invalidate(company.id)
 
     flash("Empresa actualizada.", "message")
     return redirect(url_for("owner.companies_list"))
@@ -105,6 +143,8 @@ def companies_toggle_active(company_id: int):
 
     company.is_active = not bool(company.is_active)
     db.session.commit()
+    authz.invalidate(company.id)
+    company_meta.invalidate(company.id)
 
     flash("Empresa actualizada (activa/inactiva).", "message")
     return redirect(url_for("owner.companies_list"))
@@ -0,0 +1,25 @@
+"""Cursor opaco para paginación keyset sobre (created_at, id).
+
+Lo usan el kardex y el historial de transferencias: la página siguiente filtra
+`(created_at, id) < cursor` en el mismo orden desc, sin OFFSET.
+"""
+import base64
+from datetime import datetime
+
+
+def encode_cursor(row) -> str:
+    """Cursor de la última fila de la página (cualquier objeto con created_at e id)."""
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """(created_at, id) del cursor; None si falta o está mal formado."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
@@ -3,32 +3,23 @@ from decimal import Decimal
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import login_required
-from sqlalchemy import func
 
 from models import db
 from models.product import Product
-from models.company import Company
-from models.branch import Branch
 from models.client import Client
 from models.membership import Role
 from models.sale import Sale, SaleItem
 from models.inventory import LocationType
 from models.kardex import KardexMoveType
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
 
 from services.stock import remove_stock
+from services.rollups import bump_sale
+from services import company_meta, rankings
 
 pos_bp = Blueprint("pos", __name__, url_prefix="/pos")
 
 
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
-def _branch_id() -> int:
-    return int(session["branch_id"])
-
-
 def _get_cart() -> dict:
     cart = session.get("pos_cart")
     if not cart or not isinstance(cart, dict):
@@ -71,7 +62,7 @@ def _recalc(cart: dict) -> None:
 
 
 def _apply_price_mode_to_items(cart: dict) -> None:
-    company_id = _company_id()
+    company_id = current_context().company_id
     mode = cart.get("price_mode", "minorista")
 
     for it in cart["items"]:
@@ -84,30 +75,32 @@ def _apply_price_mode_to_items(cart: dict) -> None:
 
 def _get_quick_products(company_id: int, branch_id: int, limit: int = 10):
     """
-    Top productos más vendidos por sucursal (últimos 30 días).
+    Top productos más vendidos por sucursal (últimos 30 días), desde el ranking cacheado.
     Fallback: últimos productos creados si no hay ventas.
     """
-    since = datetime.utcnow() - timedelta(days=30)
-
-    rows = (
-        db.session.query(Product)
-        .join(SaleItem, SaleItem.product_id == Product.id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Product.company_id == company_id,
-            Product.is_active == True,
-            Sale.company_id == company_id,
-            Sale.branch_id == branch_id,
-            Sale.created_at >= since
-        )
-        .group_by(Product.id)
-        .order_by(func.sum(SaleItem.qty).desc())
-        .limit(limit)
-        .all()
-    )
-
-    if rows:
-        return rows
+    today = datetime.now().date()
+    ranked = rankings.top_products(
+        db.session,
+        company_id=company_id,
+        branch_ids=[branch_id],
+        date_from=today - timedelta(days=30),
+        date_to=today,
+        limit=limit * 2,
+    )["top_by_qty"]
+    ids = [r["product_id"] for r in ranked if r["is_active"]][:limit]
+
+    if ids:
+        by_id = {
+            p.id: p
+            for p in db.session.query(Product).filter(
+                Product.company_id == company_id,
+                Product.is_active == True,
+                Product.id.in_(ids),
+            )
+        }
+        rows = [by_id[i] for i in ids if i in by_id]
+        if rows:
+            return rows
 
     # Fallback: si aún no hay ventas
     return (
@@ -124,8 +117,8 @@ def _get_quick_products(company_id: int, branch_id: int, limit: int = 10):
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def sale():
-    company_id = _company_id()
-    branch_id = _branch_id()
+    company_id = current_context().company_id
+    branch_id = current_context().branch_id
 
     cart = _get_cart()
     _recalc(cart)
@@ -151,7 +144,7 @@ def cart_clear():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def cart_set_client():
-    company_id = _company_id()
+    company_id = current_context().company_id
     cart = _get_cart()
 
     client_id_raw = (request.form.get("client_id") or "").strip()
@@ -222,7 +215,7 @@ def cart_set_price_mode():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def cart_add():
-    company_id = _company_id()
+    company_id = current_context().company_id
     cart = _get_cart()
 
     product_id = request.form.get("product_id")
@@ -342,8 +335,8 @@ def cart_remove():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def checkout():
-    company_id = _company_id()
-    branch_id = _branch_id()
+    company_id = current_context().company_id
+    branch_id = current_context().branch_id
     cart = _get_cart()
     _recalc(cart)
 
@@ -389,6 +382,7 @@ def checkout():
         db.session.add(sale)
         db.session.flush()
 
+        sale_items = []
         for it in items:
             product_id = int(it["product_id"])
             qty = Decimal(str(it["qty"])).quantize(Decimal("0.001"))
@@ -399,7 +393,7 @@ def checkout():
             if not p or p.company_id != company_id or not p.is_active:
                 raise ValueError(f"Producto inválido en carrito (id={product_id}).")
 
-            remove_stock(
+            _, km = remove_stock(
                 db.session,
                 company_id=company_id,
                 product_id=product_id,
@@ -410,17 +404,23 @@ def checkout():
                 note=f"Venta #{sale.id}",
             )
 
-            db.session.add(SaleItem(
+            si = SaleItem(
                 sale_id=sale.id,
                 product_id=product_id,
                 qty=qty,
                 unit_price=unit_price,
-                unit_cost=Decimal(str(getattr(p, "cost_price", 0) or 0)).quantize(Decimal("0.01")),
+                unit_cost=Decimal(str(km.unit_cost or 0)).quantize(Decimal("0.01")),  # costo promedio de salida
                 discount=Decimal("0.00"),
                 subtotal=subtotal,
-            ))
+            )
+            db.session.add(si)
+            sale_items.append(si)
+
+        # Rollup diario para reportes de ranking
+        bump_sale(db.session, sale, items=sale_items)
 
         db.session.commit()
+        rankings.invalidate(company_id)
         session.pop("pos_cart", None)
         flash(f"✅ Venta #{sale.id} registrada.", "message")
         return redirect(url_for("pos.ticket", sale_id=sale.id))
@@ -436,7 +436,7 @@ def checkout():
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def ticket(sale_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     sale = (
         db.session.query(Sale)
@@ -447,8 +447,10 @@ def ticket(sale_id: int):
         flash("Venta no encontrada.", "error")
         return redirect(url_for("pos.sale"))
 
-    company = db.session.get(Company, int(sale.company_id))
-    branch = db.session.get(Branch, int(sale.branch_id))
+    company = company_meta.company(db.session, company_id=int(sale.company_id))
+    branch = company_meta.get_branch(
+        db.session, company_id=int(sale.company_id), branch_id=int(sale.branch_id), active_only=False
+    )
 
     client = None
     if sale.client_id:
@@ -476,7 +478,7 @@ def ticket(sale_id: int):
 @require_context()
 @require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
 def search():
-    company_id = _company_id()
+    company_id = current_context().company_id
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
@@ -1,28 +1,20 @@
 from datetime import datetime, timedelta
 from decimal import Decimal
 
-from flask import Blueprint, render_template, request, session, flash
-from flask_login import login_required, current_user
+from flask import Blueprint, render_template, request, flash
+from flask_login import login_required
 from sqlalchemy import func, case
 
 from models import db
 from models.sale import Sale, SaleItem
 from models.expense import Expense
-from models.branch import Branch
-from models.membership import CompanyUser, Role
-from routes.guards import require_context, require_roles
+from models.membership import Role
+from routes.guards import current_context, require_context, require_roles
+from services import company_meta
 
 reports_bp = Blueprint("reports", __name__, url_prefix="/reports")
 
 
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
-def _branch_id() -> int:
-    return int(session["branch_id"])
-
-
 def _parse_date(s: str | None, default: datetime) -> datetime:
     """Acepta YYYY-MM-DD. Devuelve datetime a las 00:00:00."""
     if not s:
@@ -33,54 +25,57 @@ def _parse_date(s: str | None, default: datetime) -> datetime:
         return default
 
 
-def _get_role_in_context(company_id: int, branch_id: int) -> str:
+def _scoped_branches(company_id: int) -> list:
+    """Sucursales (no bodega) dentro del alcance del usuario, para el select."""
+    scope = current_context().branch_scope
+    branches = company_meta.branches(db.session, company_id=company_id, warehouse=False)
+    return branches if scope is None else [b for b in branches if b.id in scope]
+
+
+def _selected_branch(branches: list) -> int | None:
     """
-    Rol efectivo del usuario en el contexto actual.
-    - Si tiene ADMIN/OWNER a nivel empresa (branch_id=None), eso manda.
-    - Si no, busca rol por sucursal.
+    branch_id pedido, validado contra las sucursales visibles (sin consulta).
+    None = todas las del alcance. Con una sola sucursal en el alcance (SELLER) queda fija.
     """
-    # 1) rol empresa (branch_id is NULL)
-    m_company = (
-        db.session.query(CompanyUser)
-        .filter(
-            CompanyUser.company_id == company_id,
-            CompanyUser.user_id == current_user.id,
-            CompanyUser.branch_id.is_(None),
-            CompanyUser.is_active == True,
-        )
-        .first()
-    )
-    if m_company:
-        return m_company.role
+    scope = current_context().branch_scope
+    if scope is not None and len(scope) == 1:
+        return next(iter(scope))
 
-    # 2) rol por sucursal
-    m_branch = (
-        db.session.query(CompanyUser)
-        .filter(
-            CompanyUser.company_id == company_id,
-            CompanyUser.user_id == current_user.id,
-            CompanyUser.branch_id == branch_id,
-            CompanyUser.is_active == True,
-        )
-        .first()
-    )
-    return m_branch.role if m_branch else Role.SELLER
+    raw = (request.args.get("branch_id") or "").strip().lower()
+    if raw in ("", "all", "0"):
+        return None
+    try:
+        branch_id = int(raw)
+    except ValueError:
+        branch_id = None
+    if branch_id not in {b.id for b in branches}:
+        flash("Sucursal inválida para filtrar. Mostrando todas.", "error")
+        return None
+    return branch_id
+
+
+def _branch_ids(selected_branch_id: int | None) -> list[int] | None:
+    """Filtro IN de sucursales: la elegida o todo el alcance (None = toda la empresa)."""
+    if selected_branch_id is not None:
+        return [selected_branch_id]
+    scope = current_context().branch_scope
+    return None if scope is None else sorted(scope)
 
 
 @reports_bp.get("/sales")
 @login_required
 @require_context()
-@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
+@require_roles(Role.SELLER, Role.SUPERVISOR, Role.ADMIN, Role.OWNER)
 def sales_list():
     """
-    Reporte: Ventas por rango de fechas.
+    Reporte: Ventas por rango de fechas, dentro del alcance del usuario
+    (RequestContext.branch_scope).
     - SELLER: solo su sucursal.
+    - SUPERVISOR: sus sucursales; filtra una o ve "todas" las suyas.
     - ADMIN/OWNER: puede filtrar por sucursal o ver "todas".
     """
-    company_id = _company_id()
-    current_branch_id = _branch_id()
-
-    role = _get_role_in_context(company_id, current_branch_id)
+    company_id = current_context().company_id
+    role = current_context().role
 
     # Defaults: últimos 7 días
     today = datetime.now()
@@ -93,50 +88,10 @@ def sales_list():
     # date_to inclusive -> fin de día (sumamos 1 día y usamos <)
     date_to_end = date_to + timedelta(days=1)
 
-    # Branch filter:
-    # - SELLER: fijo a su sucursal
-    # - ADMIN/OWNER: puede elegir branch_id o ALL
-    branch_param = (request.args.get("branch_id") or "").strip()
-    selected_branch_id: int | None
-
-    if role == Role.SELLER:
-        selected_branch_id = current_branch_id
-    else:
-        if branch_param.lower() in ("", "all", "0"):
-            selected_branch_id = None  # todas
-        else:
-            try:
-                selected_branch_id = int(branch_param)
-            except ValueError:
-                selected_branch_id = None
-
-            # Validar que la sucursal pertenezca a la empresa y esté activa (y no sea bodega)
-            if selected_branch_id is not None:
-                ok = (
-                    db.session.query(Branch)
-                    .filter(
-                        Branch.id == selected_branch_id,
-                        Branch.company_id == company_id,
-                        Branch.is_active == True,
-                        Branch.is_warehouse == False,
-                    )
-                    .first()
-                )
-                if not ok:
-                    flash("Sucursal inválida para filtrar. Mostrando todas.", "error")
-                    selected_branch_id = None
-
-    # Lista de sucursales para el select (solo no-bodega)
-    branches = (
-        db.session.query(Branch)
-        .filter(
-            Branch.company_id == company_id,
-            Branch.is_active == True,
-            Branch.is_warehouse == False,
-        )
-        .order_by(Branch.name.asc())
-        .all()
-    )
+    # Sucursales visibles (select) + filtro IN según el alcance
+    branches = _scoped_branches(company_id)
+    selected_branch_id = _selected_branch(branches)
+    branch_ids = _branch_ids(selected_branch_id)
 
     # Query base
     base = (
@@ -148,8 +103,8 @@ def sales_list():
         )
     )
 
-    if selected_branch_id is not None:
-        base = base.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        base = base.filter(Sale.branch_id.in_(branch_ids))
 
     # Listado (limit 200)
     sales = base.order_by(Sale.created_at.desc()).limit(200).all()
@@ -164,8 +119,8 @@ def sales_list():
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        agg_sales = agg_sales.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        agg_sales = agg_sales.filter(Sale.branch_id.in_(branch_ids))
 
     total_count, total_sum = agg_sales.first()
     total_amount = Decimal(str(total_sum or 0)).quantize(Decimal("0.01"))
@@ -179,8 +134,8 @@ def sales_list():
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        agg_pay = agg_pay.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        agg_pay = agg_pay.filter(Sale.branch_id.in_(branch_ids))
 
     cash_sum, transfer_sum = agg_pay.first()
     total_cash = Decimal(str(cash_sum or 0)).quantize(Decimal("0.01"))
@@ -195,8 +150,8 @@ def sales_list():
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        agg_profit = agg_profit.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        agg_profit = agg_profit.filter(Sale.branch_id.in_(branch_ids))
 
     total_cost_sum, total_profit_sum = agg_profit.first()
     total_cost = Decimal(str(total_cost_sum or 0)).quantize(Decimal("0.01"))
@@ -222,12 +177,11 @@ def sales_list():
 @reports_bp.get("/financial")
 @login_required
 @require_context()
-@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
+@require_roles(Role.SELLER, Role.SUPERVISOR, Role.ADMIN, Role.OWNER)
 def financial_report():
-    """Reporte financiero unificado (ventas + costos + gastos + balance)."""
-    company_id = _company_id()
-    current_branch_id = _branch_id()
-    role = _get_role_in_context(company_id, current_branch_id)
+    """Reporte financiero unificado (ventas + costos + gastos + balance), dentro del alcance del usuario."""
+    company_id = current_context().company_id
+    role = current_context().role
 
     today = datetime.now()
     default_from = (today - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
@@ -237,58 +191,24 @@ def financial_report():
     date_to = _parse_date(request.args.get("to"), default_to)
     date_to_end = date_to + timedelta(days=1)
 
-    # Filtro sucursal
-    branch_param = (request.args.get("branch_id") or "").strip()
-    selected_branch_id: int | None
-    if role == Role.SELLER:
-        selected_branch_id = current_branch_id
-    else:
-        if branch_param.lower() in ("", "all", "0"):
-            selected_branch_id = None
-        else:
-            try:
-                selected_branch_id = int(branch_param)
-            except ValueError:
-                selected_branch_id = None
-
-            if selected_branch_id is not None:
-                ok = (
-                    db.session.query(Branch)
-                    .filter(
-                        Branch.id == selected_branch_id,
-                        Branch.company_id == company_id,
-                        Branch.is_active == True,
-                    )
-                    .first()
-                )
-                if not ok:
-                    flash("Sucursal inválida para filtrar. Mostrando todas.", "error")
-                    selected_branch_id = None
+    # Filtro sucursal (alcance del usuario)
+    branches = _scoped_branches(company_id)
+    selected_branch_id = _selected_branch(branches)
+    branch_ids = _branch_ids(selected_branch_id)
 
     # Filtro método pago
     pm = (request.args.get("payment_method") or "all").strip().lower()
     if pm not in ("all", "cash", "transfer"):
         pm = "all"
 
-    branches = (
-        db.session.query(Branch)
-        .filter(
-            Branch.company_id == company_id,
-            Branch.is_active == True,
-            Branch.is_warehouse == False,
-        )
-        .order_by(Branch.name.asc())
-        .all()
-    )
-
     # Base ventas
     q_sales = db.session.query(Sale).filter(
         Sale.company_id == company_id,
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        q_sales = q_sales.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        q_sales = q_sales.filter(Sale.branch_id.in_(branch_ids))
     if pm != "all":
         q_sales = q_sales.filter(Sale.payment_method == pm)
 
@@ -305,8 +225,8 @@ def financial_report():
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        agg_sales = agg_sales.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        agg_sales = agg_sales.filter(Sale.branch_id.in_(branch_ids))
     if pm != "all":
         agg_sales = agg_sales.filter(Sale.payment_method == pm)
 
@@ -322,8 +242,8 @@ def financial_report():
         Sale.created_at >= date_from,
         Sale.created_at < date_to_end,
     )
-    if selected_branch_id is not None:
-        agg_cost_profit = agg_cost_profit.filter(Sale.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        agg_cost_profit = agg_cost_profit.filter(Sale.branch_id.in_(branch_ids))
     if pm != "all":
         agg_cost_profit = agg_cost_profit.filter(Sale.payment_method == pm)
 
@@ -335,8 +255,8 @@ def financial_report():
         Expense.expense_date >= date_from.date(),
         Expense.expense_date <= date_to.date(),
     )
-    if selected_branch_id is not None:
-        exp_q = exp_q.filter(Expense.branch_id == selected_branch_id)
+    if branch_ids is not None:
+        exp_q = exp_q.filter(Expense.branch_id.in_(branch_ids))
 
     total_expenses_sum = exp_q.scalar() or 0
 
@@ -380,6 +300,8 @@ from models.client import Client
 from models.inventory import LocationType
 from models.kardex import KardexMoveType
 from services.stock import add_stock, remove_stock
+from services.rollups import bump_sale
+from services import rankings
 
 
 def _to_decimal(val, q='0.01') -> Decimal:
@@ -405,7 +327,7 @@ def _default_unit_price(p: Product, price_mode: str) -> Decimal:
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def sale_edit_view(sale_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     sale = (
         db.session.query(Sale)
@@ -446,7 +368,7 @@ def sale_edit_view(sale_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def sale_edit_submit(sale_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     sale: Sale | None = (
         db.session.query(Sale)
@@ -473,6 +395,9 @@ def sale_edit_submit(sale_id: int):
         # Snapshot actual
         old_items = {it.id: it for it in sale.items}
 
+        # Rollup: sacar la venta tal como estaba (se vuelve a sumar al final)
+        bump_sale(db.session, sale, sign=-1)
+
         # 1) Actualizar items existentes
         new_item_state: dict[int, dict] = {}
         for it_id, it in old_items.items():
@@ -522,18 +447,8 @@ def sale_edit_submit(sale_id: int):
             else:
                 unit_price = _to_decimal(price_raw, q='0.01')
 
-            db.session.add(SaleItem(
-                sale_id=sale.id,
-                product_id=pid,
-                qty=qty,
-                unit_price=unit_price,
-                unit_cost=_to_decimal(getattr(p, 'cost_price', 0) or 0, q='0.01'),
-                discount=Decimal('0.00'),
-                subtotal=(qty * unit_price).quantize(Decimal('0.01')),
-            ))
-
             # Ajuste inventario (salió más por edición)
-            remove_stock(
+            _, km = remove_stock(
                 db.session,
                 company_id=company_id,
                 product_id=pid,
@@ -544,6 +459,16 @@ def sale_edit_submit(sale_id: int):
                 note=f'Edición venta #{sale.id}: +{qty} (agregado)',
             )
 
+            db.session.add(SaleItem(
+                sale_id=sale.id,
+                product_id=pid,
+                qty=qty,
+                unit_price=unit_price,
+                unit_cost=_to_decimal(km.unit_cost or 0, q='0.01'),
+                discount=Decimal('0.00'),
+                subtotal=(qty * unit_price).quantize(Decimal('0.01')),
+            ))
+
         db.session.flush()
 
         # 3) Aplicar cambios en items existentes (inventario + valores)
@@ -556,9 +481,10 @@ def sale_edit_submit(sale_id: int):
             delta = (new_qty - old_qty).quantize(Decimal('0.001'))
 
             # Inventario según delta
+            new_cost = st['unit_cost']
             if delta > 0:
                 # se vendió más -> restar stock adicional
-                remove_stock(
+                _, km = remove_stock(
                     db.session,
                     company_id=company_id,
                     product_id=int(it.product_id),
@@ -568,6 +494,11 @@ def sale_edit_submit(sale_id: int):
                     move_type=KardexMoveType.SALE_EDIT,
                     note=f'Edición venta #{sale.id}: +{delta}',
                 )
+                # Costo de la línea: promedio entre lo ya vendido y lo agregado
+                new_cost = _to_decimal(
+                    (old_qty * st['unit_cost'] + delta * _to_decimal(km.unit_cost or 0, q='0.0001')) / new_qty,
+                    q='0.01',
+                )
             elif delta < 0:
                 # se vendió menos -> devolver stock
                 add_stock(
@@ -578,6 +509,7 @@ def sale_edit_submit(sale_id: int):
                     location_id=branch_id,
                     qty=(-delta),
                     move_type=KardexMoveType.SALE_EDIT,
+                    unit_cost=st['unit_cost'],  # vuelve al costo con que salió
                     note=f'Edición venta #{sale.id}: {delta} (devolución)',
                 )
 
@@ -587,6 +519,7 @@ def sale_edit_submit(sale_id: int):
             else:
                 it.qty = new_qty
                 it.unit_price = new_price
+                it.unit_cost = new_cost
                 it.subtotal = (new_qty * new_price).quantize(Decimal('0.01'))
 
         db.session.flush()
@@ -602,12 +535,15 @@ def sale_edit_submit(sale_id: int):
         for it in refreshed_items:
             subtotal += _to_decimal(it.subtotal, q='0.01')
 
+        bump_sale(db.session, sale, items=refreshed_items)
+
         sale.payment_method = payment_method
         sale.subtotal = subtotal.quantize(Decimal('0.01'))
         sale.discount_total = Decimal('0.00')
         sale.total = subtotal.quantize(Decimal('0.01'))
 
         db.session.commit()
+        rankings.invalidate(company_id)
         flash(f'✅ Venta #{sale.id} actualizada y registrada en Kardex.', 'message')
         return redirect(url_for('reports.sales_list'))
 
@@ -622,7 +558,7 @@ def sale_edit_submit(sale_id: int):
 @require_context()
 @require_roles(Role.ADMIN, Role.OWNER)
 def sale_delete(sale_id: int):
-    company_id = _company_id()
+    company_id = current_context().company_id
 
     sale: Sale | None = (
         db.session.query(Sale)
@@ -636,6 +572,8 @@ def sale_delete(sale_id: int):
     branch_id = int(sale.branch_id)
 
     try:
+        bump_sale(db.session, sale, sign=-1)
+
         # Devolver stock de todos los items
         for it in list(sale.items):
             qty = _to_decimal(it.qty, q='0.001')
@@ -648,12 +586,14 @@ def sale_delete(sale_id: int):
                     location_id=branch_id,
                     qty=qty,
                     move_type=KardexMoveType.SALE_VOID,
+                    unit_cost=it.unit_cost,  # vuelve al costo con que salió
                     note=f'Anulación venta #{sale.id}: devolución {qty}',
                 )
 
         # Eliminar venta (cascade elimina items)
         db.session.delete(sale)
         db.session.commit()
+        rankings.invalidate(company_id)
 
         flash('✅ Venta eliminada. Inventario devuelto y Kardex registrado.', 'message')
         return redirect(url_for('reports.sales_list'))
@@ -1,28 +1,16 @@
 from datetime import datetime, timedelta
-from decimal import Decimal
 
-from flask import Blueprint, render_template, request, session, flash
+from flask import Blueprint, render_template, request
 from flask_login import login_required
-from sqlalchemy import func
 
 from models import db
-from models.sale import Sale, SaleItem
-from models.product import Product
-from models.branch import Branch
 from models.membership import Role
-from routes.guards import require_context, require_roles
+from routes.guards import current_context, require_context, require_roles
+from services import company_meta, rankings
 
 reports_top_bp = Blueprint("reports_top", __name__, url_prefix="/reports-top")
 
 
-def _company_id() -> int:
-    return int(session["company_id"])
-
-
-def _branch_id() -> int:
-    return int(session["branch_id"])
-
-
 def _parse_date_start(s: str | None, default: datetime) -> datetime:
     """Acepta YYYY-MM-DD. Devuelve datetime a las 00:00:00."""
     if not s:
@@ -46,112 +34,137 @@ def _clamp_int(val: str | None, default: int, min_v: int, max_v: int) -> int:
     return n
 
 
+def _date_range() -> tuple[datetime, datetime]:
+    """from/to (YYYY-MM-DD) con default: últimos 7 días (incluye hoy)."""
+    now = datetime.now()
+    default_from = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+    default_to = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    date_from = _parse_date_start(request.args.get("from"), default_from)
+    date_to = _parse_date_start(request.args.get("to"), default_to)
+    return date_from, date_to
+
+
+def _report_branches(company_id: int):
+    """Sucursales (no bodega) dentro del alcance del usuario (RequestContext.branch_scope)."""
+    scope = current_context().branch_scope
+    branches = company_meta.branches(db.session, company_id=company_id, warehouse=False)
+    return branches if scope is None else [b for b in branches if b.id in scope]
+
+
+def _selected_branch_ids(branches) -> list[int]:
+    """
+    branch_id (uno o varios) validados contra las sucursales visibles, sin consulta.
+    - Alcance de una sola sucursal (SELLER): esa.
+    - Sin selección válida: sucursal actual.
+    """
+    current_branch_id = current_context().branch_id
+
+    scope = current_context().branch_scope
+    if scope is not None and len(scope) == 1:
+        return [next(iter(scope))]
+
+    valid_ids = {b.id for b in branches}
+    branch_ids = []
+    for raw in request.args.getlist("branch_id"):
+        try:
+            bid = int(raw)
+        except ValueError:
+            continue
+        if bid in valid_ids and bid not in branch_ids:
+            branch_ids.append(bid)
+    return branch_ids or [current_branch_id]
+
+
 @reports_top_bp.get("/top-products")
 @login_required
 @require_context()
-@require_roles(Role.SELLER, Role.ADMIN, Role.OWNER)
+@require_roles(Role.SELLER, Role.SUPERVISOR, Role.ADMIN, Role.OWNER)
 def top_products():
     """
     Top productos por:
     - cantidad vendida (SUM(qty))
     - total vendido (SUM(subtotal))
 
+    Se calcula desde el rollup diario (sale_product_daily), ambos rankings
+    y los totales en una sola consulta agrupada (cacheada por empresa).
+
     Filtros:
     - from, to (YYYY-MM-DD)
-    - branch_id (solo admin/owner pueden cambiar, seller queda en su sucursal)
+    - branch_id (múltiple: admin/owner/supervisor comparan sucursales de su alcance, seller queda en su sucursal)
     - limit (default 20, 5..200)
     """
-    company_id = _company_id()
-    current_branch_id = _branch_id()
+    company_id = current_context().company_id
+    date_from, date_to = _date_range()
+    limit_n = _clamp_int(request.args.get("limit"), default=20, min_v=5, max_v=200)
 
-    # Defaults: últimos 7 días (incluye hoy)
-    now = datetime.now()
-    default_from = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
-    default_to = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    branches = _report_branches(company_id)
+    branch_ids = _selected_branch_ids(branches)
 
-    date_from = _parse_date_start(request.args.get("from"), default_from)
-    date_to = _parse_date_start(request.args.get("to"), default_to)
-    date_to_end = date_to + timedelta(days=1)  # exclusivo
+    report = rankings.top_products(
+        db.session,
+        company_id=company_id,
+        branch_ids=branch_ids,
+        date_from=date_from.date(),
+        date_to=date_to.date(),
+        limit=limit_n,
+    )
 
-    limit_n = _clamp_int(request.args.get("limit"), default=20, min_v=5, max_v=200)
+    compare_branches = [b for b in branches if b.id in branch_ids] if len(branch_ids) > 1 else []
 
-    # Branch filter
-    branch_id = current_branch_id
-    branch_filter = request.args.get("branch_id")
-    if branch_filter:
-        try:
-            branch_id = int(branch_filter)
-        except ValueError:
-            branch_id = current_branch_id
-
-    # Seguridad práctica: si es SELLER, forzar sucursal actual
-    role = (session.get("role") or "").upper()
-    if role == Role.SELLER:
-        branch_id = current_branch_id
-
-    branches = (
-        db.session.query(Branch)
-        .filter(
-            Branch.company_id == company_id,
-            Branch.is_active == True,
-            Branch.is_warehouse == False,
-        )
-        .order_by(Branch.name.asc())
-        .all()
+    return render_template(
+        "reports_top_products.html",
+        branches=branches,
+        selected_branch_ids=branch_ids,
+        compare_branches=compare_branches,
+        branch_totals=report["branch_totals"],
+        date_from=date_from.strftime("%Y-%m-%d"),
+        date_to=date_to.strftime("%Y-%m-%d"),
+        limit_n=limit_n,
+        top_by_qty=report["top_by_qty"],
+        top_by_amount=report["top_by_amount"],
+        total_qty=float(report["total_qty"]),
+        total_amount=float(report["total_amount"]),
     )
 
-    # Query base agregada
-    base_q = (
-        db.session.query(
-            Product.id.label("product_id"),
-            Product.name.label("product_name"),
-            Product.sku.label("sku"),
-            Product.barcode.label("barcode"),
-            func.coalesce(func.sum(SaleItem.qty), 0).label("qty_sum"),
-            func.coalesce(func.sum(SaleItem.subtotal), 0).label("amount_sum"),
-        )
-        .join(SaleItem, SaleItem.product_id == Product.id)
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.company_id == company_id,
-            Sale.branch_id == branch_id,
-            Sale.created_at >= date_from,
-            Sale.created_at < date_to_end,
-        )
-        .group_by(Product.id, Product.name, Product.sku, Product.barcode)
-    )
 
-    top_by_qty = base_q.order_by(func.sum(SaleItem.qty).desc()).limit(limit_n).all()
-    top_by_amount = base_q.order_by(func.sum(SaleItem.subtotal).desc()).limit(limit_n).all()
-
-    # Totales exactos del rango (no dependen del top)
-    totals = (
-        db.session.query(
-            func.coalesce(func.sum(SaleItem.qty), 0),
-            func.coalesce(func.sum(SaleItem.subtotal), 0),
-        )
-        .join(Sale, Sale.id == SaleItem.sale_id)
-        .filter(
-            Sale.company_id == company_id,
-            Sale.branch_id == branch_id,
-            Sale.created_at >= date_from,
-            Sale.created_at < date_to_end,
-        )
-        .first()
+@reports_top_bp.get("/rankings")
+@login_required
+@require_context()
+@require_roles(Role.ADMIN, Role.OWNER)
+def rankings_view():
+    """
+    Panel de rankings (todo derivado de la misma consulta cacheada):
+    - ABC por ingreso
+    - menos vendidos
+    - lentos (con stock y poca venta)
+    - líderes en margen
+    """
+    company_id = current_context().company_id
+    date_from, date_to = _date_range()
+    limit_n = _clamp_int(request.args.get("limit"), default=10, min_v=5, max_v=100)
+
+    branches = _report_branches(company_id)
+    branch_ids = _selected_branch_ids(branches)
+
+    params = dict(
+        company_id=company_id,
+        branch_ids=branch_ids,
+        date_from=date_from.date(),
+        date_to=date_to.date(),
     )
-
-    total_qty = Decimal(str(totals[0] or 0)).quantize(Decimal("0.001"))
-    total_amount = Decimal(str(totals[1] or 0)).quantize(Decimal("0.01"))
+    abc = rankings.abc_analysis(db.session, **params)
 
     return render_template(
-        "reports_top_products.html",
+        "reports_rankings.html",
         branches=branches,
-        selected_branch_id=branch_id,
+        selected_branch_ids=branch_ids,
         date_from=date_from.strftime("%Y-%m-%d"),
         date_to=date_to.strftime("%Y-%m-%d"),
         limit_n=limit_n,
-        top_by_qty=top_by_qty,
-        top_by_amount=top_by_amount,
-        total_qty=float(total_qty),
-        total_amount=float(total_amount),
+        abc_summary=abc["summary"],
+        abc_classes=abc["classes"],
+        bottom=rankings.bottom_products(db.session, limit=limit_n, **params),
+        slow=rankings.slow_movers(db.session, limit=limit_n, **params),
+        margin=rankings.margin_leaders(db.session, limit=limit_n, **params),
     )
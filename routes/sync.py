@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-from flask import Blueprint, jsonify, session
+from flask import Blueprint, jsonify
 from flask_login import login_required
 
 from models import db
 from models.sync_event import SyncEvent, SyncEventStatus
-from routes.guards import require_context
+from routes.guards import current_context, require_context
 
 
 sync_bp = Blueprint("sync", __name__, url_prefix="/sync")
@@ -15,8 +15,8 @@ sync_bp = Blueprint("sync", __name__, url_prefix="/sync")
 @login_required
 @require_context()
 def status():
-    company_id = int(session["company_id"])
-    branch_id = int(session["branch_id"])
+    company_id = current_context().company_id
+    branch_id = current_context().branch_id
 
     counts = {
         s: db.session.query(SyncEvent.id)
@@ -44,8 +44,8 @@ def enqueue_demo():
 
     Más adelante: cada venta/gasto/inventario va a crear eventos automáticamente.
     """
-    company_id = int(session["company_id"])
-    branch_id = int(session["branch_id"])
+    company_id = current_context().company_id
+    branch_id = current_context().branch_id
     e = SyncEvent(company_id=company_id, branch_id=branch_id, entity="DEMO", entity_id=None, action="PING")
     db.session.add(e)
     db.session.commit()
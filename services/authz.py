@@ -0,0 +1,171 @@
+"""Contexto de autorización resuelto y cacheado por (empresa, usuario, sucursal).
+
+Los guards de cada request preguntaban lo mismo a la base: ¿la sucursal es de
+la empresa y está activa? ¿qué rol tiene el usuario ahí? El resultado cambia
+solo cuando se editan usuarios/membresías, sucursales o empresas, así que se
+guarda en services.cache con el version stamp de la empresa y esas rutas
+llaman a `invalidate()`. El TTL acota lo desfasado entre procesos.
+
+`allowed_contexts()` resuelve en una consulta todos los (empresa, sucursal, rol)
+a los que puede entrar un usuario; el selector de contexto la guarda en la
+sesión (solo para mostrarla) junto con `contexts_version()`. Las decisiones de
+acceso usan siempre `resolve()` / `report_branches()`, cacheados aquí.
+"""
+from typing import Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from models.branch import Branch
+from models.company import Company
+from models.membership import CompanyUser, Role
+from services import cache
+
+CACHE_NS = "authz"
+CACHE_TTL = 60
+
+# Stamp global (no por empresa): una lista de contextos puede abarcar varias empresas
+CONTEXTS_NS = "authz_contexts"
+
+# Roles que ven reportes de una sucursal (report_branches)
+REPORT_ROLES = (Role.SUPERVISOR, Role.ADMIN, Role.OWNER)
+
+
+def invalidate(company_id: Optional[int]) -> None:
+    """Llamar después de cambiar membresías, sucursales o la empresa."""
+    cache.invalidate(CACHE_NS, company_id)
+    cache.invalidate(CONTEXTS_NS, None)
+
+
+def contexts_version() -> int:
+    """Sube con cada `invalidate()`; las listas guardadas con otro valor están obsoletas."""
+    return cache.version(CONTEXTS_NS, None)
+
+
+def _pick_role(memberships: list[tuple[Optional[int], str]], branch_id: int) -> Optional[str]:
+    """
+    Regla de acceso (la misma que al elegir contexto):
+    - ADMIN/OWNER en la empresa: cualquier sucursal.
+    - Membresía amarrada a la sucursal seleccionada.
+    - Membresía global legacy (branch_id NULL).
+    """
+    for _, role in memberships:
+        if role in (Role.ADMIN, Role.OWNER):
+            return role
+    for m_branch_id, role in memberships:
+        if m_branch_id == branch_id:
+            return role
+    for m_branch_id, role in memberships:
+        if m_branch_id is None:
+            return role
+    return None
+
+
+def _load(db: Session, company_id: int, branch_id: int, user_id: int) -> dict:
+    branch_ok = (
+        db.query(Branch.id)
+        .filter(Branch.id == branch_id, Branch.company_id == company_id, Branch.is_active.is_(True))
+        .first()
+        is not None
+    )
+    role = None
+    if branch_ok:
+        memberships = [
+            (m_branch_id, m_role)
+            for m_branch_id, m_role in db.query(CompanyUser.branch_id, CompanyUser.role).filter(
+                CompanyUser.user_id == user_id,
+                CompanyUser.company_id == company_id,
+                CompanyUser.is_active.is_(True),
+            )
+        ]
+        role = _pick_role(memberships, branch_id)
+    return {"branch_ok": branch_ok, "role": role}
+
+
+def resolve(db: Session, *, company_id: int, branch_id: int, user_id: int) -> dict:
+    """
+    {branch_ok, role}: sucursal válida y activa para la empresa, y rol efectivo
+    del usuario ahí (None = sin acceso). Cacheado; datos planos.
+    """
+    return cache.get_or_set(
+        CACHE_NS,
+        company_id,
+        (int(user_id), int(branch_id)),
+        lambda: _load(db, company_id, branch_id, user_id),
+        ttl=CACHE_TTL,
+    )
+
+
+def report_branches(db: Session, *, company_id: int, user_id: int) -> frozenset[int]:
+    """
+    Sucursales activas de la empresa donde el rol efectivo del usuario es
+    SUPERVISOR o superior. Cacheado como `resolve()` (mismo TTL e invalidación).
+    """
+    def _load_branches() -> frozenset[int]:
+        return frozenset(
+            c["branch_id"]
+            for c in allowed_contexts(db, user_id=user_id, company_id=company_id)
+            if c["role"] in REPORT_ROLES
+        )
+
+    return cache.get_or_set(
+        CACHE_NS, company_id, ("report_branches", int(user_id)), _load_branches, ttl=CACHE_TTL
+    )
+
+
+def allowed_contexts(db: Session, *, user_id: int, company_id: Optional[int] = None) -> list[dict]:
+    """
+    Todos los contextos a los que puede entrar el usuario, en una sola consulta:
+    cada membresía activa se cruza con las sucursales activas que habilita
+    (ADMIN/OWNER o global: todas las de la empresa; amarrada: solo la suya).
+    El rol por (empresa, sucursal) sale de `_pick_role`, la misma regla de los guards.
+    company_id: solo esa empresa.
+
+    Devuelve [{company_id, company_name, branch_id, branch_name, is_warehouse, role}]
+    ordenado por empresa y luego bodegas primero / nombre. Datos planos (van a la sesión).
+    """
+    m = CompanyUser
+    q = (
+        db.query(
+            m.company_id,
+            Company.name.label("company_name"),
+            Branch.id.label("branch_id"),
+            Branch.name.label("branch_name"),
+            Branch.is_warehouse,
+            m.branch_id.label("m_branch_id"),
+            m.role,
+        )
+        .join(Company, Company.id == m.company_id)
+        .join(
+            Branch,
+            and_(
+                Branch.company_id == m.company_id,
+                Branch.is_active.is_(True),
+                or_(m.branch_id.is_(None), m.branch_id == Branch.id, m.role.in_((Role.ADMIN, Role.OWNER))),
+            ),
+        )
+        .filter(m.user_id == user_id, m.is_active.is_(True))
+    )
+    if company_id is not None:
+        q = q.filter(m.company_id == company_id)
+    rows = q.order_by(Company.name.asc(), Branch.is_warehouse.desc(), Branch.name.asc())
+
+    contexts: dict[tuple[int, int], dict] = {}
+    memberships: dict[tuple[int, int], list[tuple[Optional[int], str]]] = {}
+    for r in rows:
+        key = (int(r.company_id), int(r.branch_id))
+        if key not in contexts:
+            contexts[key] = {
+                "company_id": key[0],
+                "company_name": r.company_name,
+                "branch_id": key[1],
+                "branch_name": r.branch_name,
+                "is_warehouse": bool(r.is_warehouse),
+            }
+        memberships.setdefault(key, []).append((r.m_branch_id, r.role))
+
+    out = []
+    for key, ctx in contexts.items():
+        ctx["role"] = _pick_role(memberships[key], key[1])
+        out.append(ctx)
+    return out
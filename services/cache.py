@@ -0,0 +1,93 @@
+"""Cache en proceso con invalidación por (namespace, empresa).
+
+Cada entrada guarda el "version stamp" de su (namespace, company_id) al
+momento de calcularse. `invalidate()` sube la versión y todas las entradas
+viejas de esa empresa quedan obsoletas sin tener que recorrerlas.
+
+Solo guardar datos planos (dict/list/Decimal), nunca objetos ORM ligados a
+una sesión.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Hashable, Optional
+
+_MAX_ENTRIES = 2048
+
+_lock = threading.RLock()
+_versions: dict[tuple[str, Optional[int]], int] = {}
+_store: "OrderedDict[Hashable, tuple[float, int, Any]]" = OrderedDict()
+
+
+def version(namespace: str, company_id: Optional[int]) -> int:
+    with _lock:
+        return _versions.get((namespace, company_id), 0)
+
+
+def invalidate(namespace: str, company_id: Optional[int]) -> None:
+    """Descarta (lógicamente) todo lo cacheado de esa empresa en ese namespace."""
+    with _lock:
+        k = (namespace, company_id)
+        _versions[k] = _versions.get(k, 0) + 1
+
+
+def clear() -> None:
+    with _lock:
+        _store.clear()
+        _versions.clear()
+
+
+def get_or_set(
+    namespace: str,
+    company_id: Optional[int],
+    key: Hashable,
+    loader: Callable[[], Any],
+    ttl: float = 60,
+) -> Any:
+    full_key = (namespace, company_id, key)
+    now = time.monotonic()
+    ver = version(namespace, company_id)
+
+    with _lock:
+        hit = _store.get(full_key)
+        if hit and hit[0] > now and hit[1] == ver:
+            _store.move_to_end(full_key)
+            return hit[2]
+
+    value = loader()
+
+    with _lock:
+        _store[full_key] = (now + ttl, ver, value)
+        _store.move_to_end(full_key)
+        while len(_store) > _MAX_ENTRIES:
+            _store.popitem(last=False)
+    return value
+
+
+def _freeze(v):
+    if isinstance(v, (list, tuple, set, frozenset)):
+        items = [_freeze(x) for x in v]
+        return tuple(sorted(items)) if isinstance(v, (set, frozenset)) else tuple(items)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    return v
+
+
+def memoized(namespace: str, ttl: float = 60):
+    """
+    Decorador para funciones de consulta con firma (db, *, company_id, ...).
+    La sesión no forma parte de la llave; el resto de kwargs sí.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(db, **kwargs):
+            company_id = kwargs.get("company_id")
+            key = (fn.__qualname__, _freeze(kwargs))
+            return get_or_set(namespace, company_id, key, lambda: fn(db, **kwargs), ttl=ttl)
+
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
@@ -0,0 +1,109 @@
+"""Metadatos de la empresa cacheados: nombre/estado y sus sucursales/bodegas.
+
+Casi todas las páginas arman selects de sucursales, buscan la Bodega Central o
+validan un branch_id con una consulta chica a `branches`. Esos datos cambian
+solo desde admin.branches_* y owner.companies_*, que llaman a `invalidate()`;
+se cargan una vez por empresa (una consulta por tabla) y se sirven desde
+services.cache. El TTL acota lo desfasado entre procesos.
+
+Se devuelven tuplas inmutables (BranchInfo / CompanyInfo) con los mismos
+atributos que usan las plantillas (`b.id`, `b.name`, `b.is_warehouse`...).
+Para editar una fila, cargar el modelo ORM como siempre.
+"""
+from typing import NamedTuple, Optional
+
+from sqlalchemy.orm import Session
+
+from models.branch import Branch
+from models.company import Company
+from services import cache
+
+CACHE_NS = "company_meta"
+CACHE_TTL = 300
+
+
+class CompanyInfo(NamedTuple):
+    id: int
+    name: str
+    is_active: bool
+
+
+class BranchInfo(NamedTuple):
+    id: int
+    company_id: int
+    name: str
+    is_warehouse: bool
+    is_active: bool
+
+
+def invalidate(company_id: Optional[int]) -> None:
+    """Llamar después de crear/editar/activar sucursales o editar la empresa."""
+    cache.invalidate(CACHE_NS, company_id)
+
+
+def _load(db: Session, company_id: int) -> dict:
+    c = db.query(Company.id, Company.name, Company.is_active).filter(Company.id == company_id).first()
+    rows = (
+        db.query(Branch.id, Branch.company_id, Branch.name, Branch.is_warehouse, Branch.is_active)
+        .filter(Branch.company_id == company_id)
+        .order_by(Branch.is_warehouse.desc(), Branch.name.asc())
+        .all()
+    )
+    return {
+        "company": CompanyInfo(c.id, c.name, bool(c.is_active)) if c else None,
+        # Orden de los selects: bodegas primero, luego por nombre
+        "branches": tuple(
+            BranchInfo(r.id, r.company_id, r.name, bool(r.is_warehouse), bool(r.is_active)) for r in rows
+        ),
+    }
+
+
+def _meta(db: Session, company_id: int) -> dict:
+    return cache.get_or_set(CACHE_NS, company_id, "meta", lambda: _load(db, company_id), ttl=CACHE_TTL)
+
+
+def company(db: Session, *, company_id: int) -> Optional[CompanyInfo]:
+    return _meta(db, company_id)["company"]
+
+
+def branches(
+    db: Session,
+    *,
+    company_id: int,
+    include_inactive: bool = False,
+    warehouse: Optional[bool] = None,
+) -> list[BranchInfo]:
+    """
+    Sucursales de la empresa (bodegas primero, luego por nombre).
+    - include_inactive: también las inactivas (mapas de nombres históricos).
+    - warehouse: True solo bodegas, False solo sucursales retail, None todas.
+    """
+    return [
+        b for b in _meta(db, company_id)["branches"]
+        if (include_inactive or b.is_active) and (warehouse is None or b.is_warehouse == warehouse)
+    ]
+
+
+def branch_map(db: Session, *, company_id: int) -> dict[int, BranchInfo]:
+    """{id: BranchInfo} incluyendo inactivas (para nombres en historiales)."""
+    return {b.id: b for b in _meta(db, company_id)["branches"]}
+
+
+def get_branch(
+    db: Session,
+    *,
+    company_id: int,
+    branch_id: Optional[int],
+    active_only: bool = True,
+) -> Optional[BranchInfo]:
+    """La sucursal si pertenece a la empresa (y está activa, salvo active_only=False)."""
+    b = branch_map(db, company_id=company_id).get(branch_id)
+    if b is None or (active_only and not b.is_active):
+        return None
+    return b
+
+
+def warehouse(db: Session, *, company_id: int) -> Optional[BranchInfo]:
+    """Primera Bodega Central activa de la empresa."""
+    found = branches(db, company_id=company_id, warehouse=True)
+    return found[0] if found else None
@@ -0,0 +1,182 @@
+"""Tablero consolidado del owner del sistema: KPIs por empresa y sucursal.
+
+En vez de entrar empresa por empresa al dashboard, cada KPI sale de UNA
+consulta agrupada por (empresa, sucursal) sobre todas las empresas:
+
+- ventas / costo / ganancia bruta: rollup diario (sale_product_daily)
+- tickets: count de sales en el rango
+- gastos: expenses en el rango
+- valor de stock: totales en vivo (inventory_valuations)
+
+El resultado (datos planos) se cachea con TTL corto en services.cache bajo la
+llave global (company_id=None): cambia con cada venta y no vale la pena
+invalidarlo por empresa.
+
+Con TENANT_DB_MODE=per_company las mismas consultas corren en paralelo, una
+tarea por base de empresa (models.tenancy), y se unen los resultados.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import tenancy
+from models.branch import Branch
+from models.company import Company
+from models.expense import Expense
+from models.sale import Sale
+from models.sale_rollup import SaleProductDaily
+from models.valuation import InventoryValuation
+from services import cache
+
+CACHE_NS = "consolidated"
+CACHE_TTL = 60
+MAX_WORKERS = 8
+
+KPIS = ("sales", "cost", "profit", "tickets", "expenses", "net", "stock_value")
+
+
+def _money(val) -> Decimal:
+    return Decimal(str(val or 0)).quantize(Decimal("0.01"))
+
+
+def _blank() -> dict:
+    row = {k: Decimal("0.00") for k in KPIS}
+    row["tickets"] = 0
+    return row
+
+
+def _add(into: dict, row: dict) -> None:
+    for k in KPIS:
+        into[k] += row[k]
+
+
+def _aggregate(
+    db: Session,
+    *,
+    date_from: date,
+    date_to: date,
+    company_ids: Optional[tuple],
+) -> dict[tuple[int, int], dict]:
+    """{(company_id, branch_id): kpis} con una consulta agrupada por KPI."""
+    out: dict[tuple[int, int], dict] = {}
+
+    def _row(cid, bid) -> dict:
+        return out.setdefault((int(cid), int(bid)), _blank())
+
+    def _scoped(q, col):
+        return q.filter(col.in_(list(company_ids))) if company_ids is not None else q
+
+    D = SaleProductDaily
+    q = db.query(D.company_id, D.branch_id, func.sum(D.amount), func.sum(D.cost)).filter(
+        D.day >= date_from, D.day <= date_to
+    )
+    for cid, bid, amount, cost in _scoped(q, D.company_id).group_by(D.company_id, D.branch_id):
+        r = _row(cid, bid)
+        r["sales"] = _money(amount)
+        r["cost"] = _money(cost)
+        r["profit"] = r["sales"] - r["cost"]
+
+    start = datetime.combine(date_from, time.min)
+    end = datetime.combine(date_to + timedelta(days=1), time.min)
+    q = db.query(Sale.company_id, Sale.branch_id, func.count(Sale.id)).filter(
+        Sale.created_at >= start, Sale.created_at < end
+    )
+    for cid, bid, n in _scoped(q, Sale.company_id).group_by(Sale.company_id, Sale.branch_id):
+        _row(cid, bid)["tickets"] = int(n or 0)
+
+    q = db.query(Expense.company_id, Expense.branch_id, func.sum(Expense.amount)).filter(
+        Expense.expense_date >= date_from, Expense.expense_date <= date_to
+    )
+    for cid, bid, amount in _scoped(q, Expense.company_id).group_by(Expense.company_id, Expense.branch_id):
+        _row(cid, bid)["expenses"] = _money(amount)
+
+    V = InventoryValuation
+    q = db.query(V.company_id, V.location_id, func.sum(V.value_total))
+    for cid, bid, value in _scoped(q, V.company_id).group_by(V.company_id, V.location_id):
+        _row(cid, bid)["stock_value"] = _money(value)
+
+    for r in out.values():
+        r["net"] = r["profit"] - r["expenses"]
+    return out
+
+
+def _aggregate_tenants(*, date_from: date, date_to: date, company_ids: list[int]) -> dict[tuple[int, int], dict]:
+    """_aggregate en cada base de empresa, en paralelo; empresas sin base se omiten."""
+    app = current_app._get_current_object()
+
+    def _one(cid: int) -> dict:
+        with app.app_context():
+            try:
+                with tenancy.tenant_session(cid, app) as s:
+                    return _aggregate(s, date_from=date_from, date_to=date_to, company_ids=(cid,))
+            except LookupError:
+                return {}
+
+    out: dict[tuple[int, int], dict] = {}
+    if not company_ids:
+        return out
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(company_ids))) as pool:
+        for part in pool.map(_one, company_ids):
+            out.update(part)
+    return out
+
+
+@cache.memoized(CACHE_NS, ttl=CACHE_TTL)
+def overview(
+    db: Session,
+    *,
+    date_from: date,
+    date_to: date,
+    company_ids: Optional[tuple] = None,
+) -> dict:
+    """
+    KPIs del rango por empresa y sucursal + total general.
+
+    Devuelve {computed_at, totals, companies: [{id, name, is_active, totals,
+    branches: [{id, name, is_warehouse, is_active, **kpis}]}]}; empresas
+    ordenadas por ventas desc. company_ids=None: todas.
+    """
+    cq = db.query(Company.id, Company.name, Company.is_active)
+    bq = db.query(Branch.id, Branch.company_id, Branch.name, Branch.is_warehouse, Branch.is_active)
+    if company_ids is not None:
+        cq = cq.filter(Company.id.in_(list(company_ids)))
+        bq = bq.filter(Branch.company_id.in_(list(company_ids)))
+
+    companies: dict[int, dict] = {
+        c.id: {"id": c.id, "name": c.name, "is_active": bool(c.is_active), "totals": _blank(), "branches": []}
+        for c in cq
+    }
+    if tenancy.enabled():
+        kpis = _aggregate_tenants(date_from=date_from, date_to=date_to, company_ids=list(companies))
+    else:
+        kpis = _aggregate(db, date_from=date_from, date_to=date_to, company_ids=company_ids)
+    for b in bq.order_by(Branch.is_warehouse.desc(), Branch.name.asc()):
+        comp = companies.get(b.company_id)
+        if comp is None:
+            continue
+        row = kpis.get((b.company_id, b.id), _blank())
+        comp["branches"].append({
+            "id": b.id,
+            "name": b.name,
+            "is_warehouse": bool(b.is_warehouse),
+            "is_active": bool(b.is_active),
+            **row,
+        })
+        _add(comp["totals"], row)
+
+    totals = _blank()
+    for comp in companies.values():
+        _add(totals, comp["totals"])
+
+    return {
+        "computed_at": datetime.now(),
+        "totals": totals,
+        "companies": sorted(
+            companies.values(), key=lambda c: (not c["is_active"], -c["totals"]["sales"], c["name"])
+        ),
+    }
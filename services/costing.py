@@ -0,0 +1,166 @@
+"""Costo promedio ponderado móvil por (producto, ubicación).
+
+El estado vive en la propia fila de `Inventory` (qty, stock_value, avg_cost) y
+se actualiza en O(1) por movimiento:
+
+- Entrada: stock_value += qty * costo de entrada; avg_cost = stock_value / qty.
+- Salida: sale al avg_cost vigente; avg_cost no cambia.
+
+Así el costo de venta sale exacto al momento del checkout sin recorrer el
+kardex. `recompute()` reconstruye todo desde el kardex (backfill/reparación).
+"""
+from decimal import Decimal
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from models.inventory import Inventory
+from models.kardex import KardexMovement
+from models.product import Product
+
+COST_Q = Decimal("0.0001")
+MONEY_Q = Decimal("0.01")
+QTY_Q = Decimal("0.001")
+
+
+def _dec(val, q: Decimal) -> Decimal:
+    return Decimal(str(val or 0)).quantize(q)
+
+
+def current_cost(db: Session, inv: Inventory) -> Decimal:
+    """Costo unitario vigente: promedio de la ubicación o, sin stock, el costo del producto."""
+    if inv.avg_cost is not None and _dec(inv.qty, QTY_Q) > 0:
+        return _dec(inv.avg_cost, COST_Q)
+    p = db.get(Product, inv.product_id)
+    return _dec(getattr(p, "cost_price", 0), COST_Q)
+
+
+def receive(db: Session, inv: Inventory, qty: Decimal, unit_cost=None) -> tuple[Decimal, Decimal]:
+    """
+    Entrada de `qty` (> 0) a la ubicación. Sin `unit_cost` entra al costo vigente
+    (no mueve el promedio). Devuelve (costo unitario usado, delta de valor).
+    """
+    cost = _dec(unit_cost, COST_Q) if unit_cost is not None else current_cost(db, inv)
+    old_value = _dec(inv.stock_value, MONEY_Q)
+    new_qty = _dec(inv.qty, QTY_Q) + qty
+
+    new_value = old_value + (qty * cost).quantize(MONEY_Q)
+    inv.qty = new_qty
+    inv.stock_value = new_value
+    inv.avg_cost = (new_value / new_qty).quantize(COST_Q) if new_qty > 0 else cost
+    return cost, new_value - old_value
+
+
+def issue(db: Session, inv: Inventory, qty: Decimal) -> tuple[Decimal, Decimal]:
+    """
+    Salida de `qty` (> 0) al costo promedio vigente. Si la ubicación queda en 0
+    sale todo el valor restante (sin residuos de redondeo).
+    Devuelve (costo unitario, delta de valor negativo).
+    """
+    cost = current_cost(db, inv)
+    old_value = _dec(inv.stock_value, MONEY_Q)
+    new_qty = _dec(inv.qty, QTY_Q) - qty
+
+    if new_qty <= 0:
+        new_value = Decimal("0.00")
+    else:
+        new_value = max(old_value - (qty * cost).quantize(MONEY_Q), Decimal("0.00"))
+
+    inv.qty = new_qty
+    inv.stock_value = new_value
+    inv.avg_cost = cost
+    return cost, new_value - old_value
+
+
+class Replay:
+    """
+    Reproducción en memoria del costo promedio sobre movimientos en orden
+    (created_at, id). Estado por (product_id, location_id): [qty, valor].
+    Lo usan `recompute()` y el archivo del kardex (saldo/costo al corte).
+    """
+
+    def __init__(self, product_cost: dict[int, Decimal]):
+        self.product_cost = product_cost
+        self.state: dict[tuple[int, int], list[Decimal]] = {}
+
+    def avg(self, key: tuple[int, int]) -> Decimal:
+        st = self.state.get(key)
+        if st and st[0] > 0:
+            return (st[1] / st[0]).quantize(COST_Q)
+        return self.product_cost.get(key[0], Decimal("0.0000"))
+
+    def apply(self, product_id: int, from_id, to_id, qty, unit_cost) -> Decimal:
+        """Aplica un movimiento y devuelve el costo unitario con que se movió."""
+        qty = _dec(qty, QTY_Q)
+        cost = None
+
+        if from_id is not None:
+            key = (product_id, int(from_id))
+            cost = self.avg(key)
+            st = self.state.setdefault(key, [Decimal("0.000"), Decimal("0.00")])
+            st[0] -= qty
+            st[1] = Decimal("0.00") if st[0] <= 0 else max(st[1] - (qty * cost).quantize(MONEY_Q), Decimal("0.00"))
+
+        if to_id is not None:
+            key = (product_id, int(to_id))
+            if cost is None:
+                cost = _dec(unit_cost, COST_Q) if unit_cost is not None else self.avg(key)
+            st = self.state.setdefault(key, [Decimal("0.000"), Decimal("0.00")])
+            if st[0] <= 0:
+                st[1] = Decimal("0.00")
+            st[0] += qty
+            st[1] += (qty * cost).quantize(MONEY_Q)
+
+        return cost
+
+
+def product_costs(db: Session, *, company_id: int) -> dict[int, Decimal]:
+    return {
+        int(pid): _dec(cost, COST_Q)
+        for pid, cost in db.query(Product.id, Product.cost_price).filter(Product.company_id == company_id)
+    }
+
+
+def recompute(db: Session, *, company_id: int, batch_size: int = 1000) -> int:
+    """
+    Recalcula el costo promedio reproduciendo el kardex de la empresa en orden.
+
+    - Fija `unit_cost` en cada movimiento (salidas/transferencias al promedio del origen).
+    - Entradas sin costo: al promedio vigente o, si no hay, al costo del producto.
+    - Al final valoriza la qty actual de cada inventario con el promedio resultante
+      (el stock previo al kardex queda al costo del producto).
+
+    Devuelve cuántos movimientos se reprodujeron.
+    """
+    replay = Replay(product_costs(db, company_id=company_id))
+
+    pending: list[dict] = []
+    q = (
+        db.query(
+            KardexMovement.id,
+            KardexMovement.product_id,
+            KardexMovement.from_location_id,
+            KardexMovement.to_location_id,
+            KardexMovement.qty,
+            KardexMovement.unit_cost,
+        )
+        .filter(KardexMovement.company_id == company_id)
+        .order_by(KardexMovement.created_at.asc(), KardexMovement.id.asc())
+        .yield_per(batch_size)
+    )
+    for mid, pid, from_id, to_id, qty, unit_cost in q:
+        cost = replay.apply(int(pid), from_id, to_id, qty, unit_cost)
+        pending.append({"id": mid, "unit_cost": cost})
+
+    # Se escribe al terminar de leer (no mezclar UPDATE con el cursor abierto)
+    for i in range(0, len(pending), batch_size):
+        db.execute(update(KardexMovement), pending[i:i + batch_size])
+
+    for inv in db.query(Inventory).filter(Inventory.company_id == company_id):
+        qty = _dec(inv.qty, QTY_Q)
+        cost = replay.avg((int(inv.product_id), int(inv.location_id)))
+        inv.avg_cost = cost
+        inv.stock_value = (qty * cost).quantize(MONEY_Q) if qty > 0 else Decimal("0.00")
+
+    db.flush()
+    return len(pending)
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from typing import Optional
+
+from sqlalchemy import func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from models.branch import Branch
+from models.inventory import Inventory, LocationType
+from models.inventory_analytics import AbcClass, InventoryAnalyticsSnapshot
+from models.kardex import KardexMovement, KardexMovementArchive, KardexMoveType
+from models.sale_rollup import SaleProductDaily
+from services import kardex_archive
+from services.rankings import ABC_A, ABC_B
+
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_DEAD_DAYS = 60
+
+
+def _classify(revenues: list[Decimal]) -> list[str]:
+    """
+    ABC sobre una columna de ingresos ya ordenada desc.
+    Usa la participación acumulada ANTES de cada producto (el primero siempre es A).
+    """
+    total = sum(revenues, Decimal("0"))
+    if total <= 0:
+        return [AbcClass.C] * len(revenues)
+    before = [Decimal("0")] + list(accumulate(revenues))[:-1]
+    return [
+        AbcClass.A if b / total < ABC_A else (AbcClass.B if b / total < ABC_B else AbcClass.C)
+        for b in before
+    ]
+
+
+def compute_snapshot(
+    db: Session,
+    *,
+    company_id: int,
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    dead_days: int = DEFAULT_DEAD_DAYS,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Job batch (fuera del request): 3 consultas agrupadas + cálculo por columnas en memoria
+    + un INSERT masivo. Reemplaza la foto de la empresa. Devuelve filas escritas.
+
+    - Sucursales: ventas/ingreso de la propia sucursal.
+    - Bodega: no vende, se mide contra la venta total de la empresa.
+    """
+    if window_days < 1:
+        raise ValueError("window_days debe ser >= 1")
+    if dead_days < 1:
+        raise ValueError("dead_days debe ser >= 1")
+
+    now = now or datetime.utcnow()
+    day_from = (now - timedelta(days=window_days - 1)).date()
+    dead_cutoff = now - timedelta(days=dead_days)
+    window = Decimal(window_days)
+
+    warehouse_ids = {
+        b.id for b in db.query(Branch.id).filter(Branch.company_id == company_id, Branch.is_warehouse == True)
+    }
+
+    # 1) Stock por ubicación/producto
+    stock: dict[tuple[int, int], tuple[str, Decimal]] = {}
+    for loc_type, loc_id, pid, qty in (
+        db.query(Inventory.location_type, Inventory.location_id, Inventory.product_id, Inventory.qty)
+        .filter(Inventory.company_id == company_id)
+    ):
+        stock[(int(loc_id), int(pid))] = (loc_type, Decimal(str(qty or 0)))
+
+    # 2) Venta por sucursal/producto en la ventana (rollup diario)
+    sold: dict[tuple[int, int], tuple[Decimal, Decimal]] = {}
+    company_sold: dict[int, tuple[Decimal, Decimal]] = {}
+    for bid, pid, qty, amount in (
+        db.query(
+            SaleProductDaily.branch_id,
+            SaleProductDaily.product_id,
+            func.coalesce(func.sum(SaleProductDaily.qty), 0),
+            func.coalesce(func.sum(SaleProductDaily.amount), 0),
+        )
+        .filter(SaleProductDaily.company_id == company_id, SaleProductDaily.day >= day_from)
+        .group_by(SaleProductDaily.branch_id, SaleProductDaily.product_id)
+    ):
+        q, a = Decimal(str(qty or 0)), Decimal(str(amount or 0))
+        sold[(int(bid), int(pid))] = (q, a)
+        cq, ca = company_sold.get(int(pid), (Decimal("0"), Decimal("0")))
+        company_sold[int(pid)] = (cq + q, ca + a)
+
+    # 3) Última salida por venta (kardex SALE_OUT) por sucursal/producto; con meses
+    #    archivados también se lee el archivo (una venta vieja sigue siendo venta)
+    def _sale_outs(K):
+        return select(
+            K.from_location_id.label("location_id"), K.product_id.label("product_id"), K.created_at.label("ts")
+        ).where(K.company_id == company_id, K.move_type == KardexMoveType.SALE_OUT)
+
+    legs = _sale_outs(KardexMovement)
+    if kardex_archive.horizon(db, company_id=company_id) is not None:
+        legs = union_all(legs, _sale_outs(KardexMovementArchive))
+    legs = legs.subquery()
+
+    last_sale: dict[tuple[int, int], datetime] = {}
+    company_last_sale: dict[int, datetime] = {}
+    for loc_id, pid, ts in db.execute(
+        select(legs.c.location_id, legs.c.product_id, func.max(legs.c.ts))
+        .group_by(legs.c.location_id, legs.c.product_id)
+    ):
+        if loc_id is None or ts is None:
+            continue
+        last_sale[(int(loc_id), int(pid))] = ts
+        prev = company_last_sale.get(int(pid))
+        if prev is None or ts > prev:
+            company_last_sale[int(pid)] = ts
+
+    # Universo por ubicación: lo que tiene stock o vendió
+    by_location: dict[int, set[int]] = {}
+    for loc_id, pid in list(stock.keys()) + list(sold.keys()):
+        by_location.setdefault(loc_id, set()).add(pid)
+
+    rows = []
+    for loc_id, pids in by_location.items():
+        is_wh = loc_id in warehouse_ids
+        loc_type = LocationType.WAREHOUSE if is_wh else LocationType.BRANCH
+
+        # Columnas
+        col_pid = list(pids)
+        col_qty_sold, col_rev, col_last = [], [], []
+        for pid in col_pid:
+            q, a = (company_sold if is_wh else sold).get(pid if is_wh else (loc_id, pid), (Decimal("0"), Decimal("0")))
+            col_qty_sold.append(q)
+            col_rev.append(a)
+            col_last.append(company_last_sale.get(pid) if is_wh else last_sale.get((loc_id, pid)))
+        col_on_hand = [stock.get((loc_id, pid), (loc_type, Decimal("0")))[1] for pid in col_pid]
+
+        order = sorted(range(len(col_pid)), key=lambda i: col_rev[i], reverse=True)
+        classes = _classify([col_rev[i] for i in order])
+
+        for i, cls in zip(order, classes):
+            avg = (col_qty_sold[i] / window).quantize(Decimal("0.0001"))
+            on_hand = col_on_hand[i]
+            coverage = (on_hand / avg).quantize(Decimal("0.1")) if avg > 0 else None
+            last = col_last[i]
+            rows.append({
+                "company_id": company_id,
+                "product_id": col_pid[i],
+                "location_type": loc_type,
+                "location_id": loc_id,
+                "abc_class": cls,
+                "revenue": col_rev[i].quantize(Decimal("0.01")),
+                "qty_sold": col_qty_sold[i].quantize(Decimal("0.001")),
+                "qty_on_hand": on_hand.quantize(Decimal("0.001")),
+                "avg_daily_sales": avg,
+                "coverage_days": coverage,
+                "last_sale_at": last,
+                "is_dead_stock": bool(on_hand > 0 and (last is None or last < dead_cutoff)),
+                "window_days": window_days,
+                "dead_days": dead_days,
+                "computed_at": now,
+            })
+
+    db.query(InventoryAnalyticsSnapshot).filter(
+        InventoryAnalyticsSnapshot.company_id == company_id
+    ).delete(synchronize_session=False)
+    if rows:
+        db.execute(insert(InventoryAnalyticsSnapshot), rows)
+    db.flush()
+    return len(rows)
@@ -0,0 +1,130 @@
+"""Archivo del kardex por período (mes).
+
+Los meses cerrados se mueven a `kardex_movements_archive` y en la tabla viva
+queda un movimiento OPENING por (producto, ubicación) con el saldo y el costo
+promedio al corte. La tabla viva se mantiene chica; las consultas que caen
+antes del horizonte leen también el archivo (ver routes/kardex.py,
+services.stock.stock_as_of y la última venta en services.inventory_analytics).
+"""
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from models.kardex import KardexArchivePeriod, KardexMovement, KardexMovementArchive, KardexMoveType
+from services.costing import Replay, product_costs
+
+_COLUMNS = [
+    "id", "company_id", "product_id", "move_type",
+    "from_location_type", "from_location_id", "to_location_type", "to_location_id",
+    "qty", "unit_cost", "from_balance_after", "to_balance_after", "note", "created_at",
+]
+
+
+def _month_start(d) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+
+def _next_month(d: datetime) -> datetime:
+    return datetime(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def horizon(db: Session, *, company_id: int) -> Optional[datetime]:
+    """Inicio del kardex vivo: todo lo anterior está en el archivo (None = nada archivado)."""
+    last = (
+        db.query(func.max(KardexArchivePeriod.period))
+        .filter(KardexArchivePeriod.company_id == company_id)
+        .scalar()
+    )
+    if not last:
+        return None
+    y, m = (int(x) for x in last.split("-"))
+    return _next_month(datetime(y, m, 1))
+
+
+def archive_before(db: Session, *, company_id: int, cutoff: date, batch_size: int = 1000) -> int:
+    """
+    Archiva los movimientos anteriores al mes de `cutoff` (se redondea al día 1).
+
+    1) Una pasada en orden sobre lo que se va: saldo final y costo promedio por
+       (producto, ubicación).
+    2) INSERT ... SELECT al archivo + DELETE de la tabla viva.
+    3) OPENING por (producto, ubicación) con saldo > 0, fechado en el corte.
+
+    Devuelve cuántos movimientos se archivaron.
+    """
+    cutoff = _month_start(cutoff)
+    current = horizon(db, company_id=company_id)
+    if current and cutoff <= current:
+        return 0
+
+    K = KardexMovement
+    live = [K.company_id == company_id, K.created_at < cutoff]
+
+    replay = Replay(product_costs(db, company_id=company_id))
+    last: dict[tuple[int, int], tuple[str, Decimal]] = {}
+    periods: Counter = Counter()
+    q = (
+        db.query(
+            K.product_id, K.from_location_type, K.from_location_id, K.to_location_type, K.to_location_id,
+            K.qty, K.unit_cost, K.from_balance_after, K.to_balance_after, K.created_at,
+        )
+        .filter(*live)
+        .order_by(K.created_at.asc(), K.id.asc())
+        .yield_per(batch_size)
+    )
+    for pid, f_type, f_id, t_type, t_id, qty, unit_cost, f_bal, t_bal, created_at in q:
+        pid = int(pid)
+        replay.apply(pid, f_id, t_id, qty, unit_cost)
+        if f_id is not None:
+            last[(pid, int(f_id))] = (f_type, Decimal(str(f_bal or 0)))
+        if t_id is not None:
+            last[(pid, int(t_id))] = (t_type, Decimal(str(t_bal or 0)))
+        periods[created_at.strftime("%Y-%m")] += 1
+
+    moved = sum(periods.values())
+    if moved:
+        db.execute(
+            KardexMovementArchive.__table__.insert().from_select(
+                _COLUMNS + ["period"],
+                db.query(*[getattr(K, c) for c in _COLUMNS], func.strftime("%Y-%m", K.created_at))
+                .filter(*live)
+                .statement,
+            )
+        )
+        db.query(K).filter(*live).delete(synchronize_session=False)
+
+    openings = [
+        {
+            "company_id": company_id,
+            "product_id": pid,
+            "move_type": KardexMoveType.OPENING,
+            "to_location_type": loc_type,
+            "to_location_id": loc_id,
+            "qty": bal,
+            "unit_cost": replay.avg((pid, loc_id)),
+            "to_balance_after": bal,
+            "note": f"Saldo inicial {cutoff.strftime('%Y-%m')}",
+            "created_at": cutoff,
+        }
+        for (pid, loc_id), (loc_type, bal) in last.items()
+        if bal > 0
+    ]
+    if openings:
+        db.execute(insert(K), openings)
+
+    # El último mes antes del corte siempre queda registrado (define el horizonte)
+    last_period = datetime(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1).strftime("%Y-%m")
+    periods.setdefault(last_period, 0)
+    existing = {
+        p for (p,) in db.query(KardexArchivePeriod.period).filter(KardexArchivePeriod.company_id == company_id)
+    }
+    for period, count in sorted(periods.items()):
+        if period not in existing:
+            db.add(KardexArchivePeriod(company_id=company_id, period=period, moved_count=count))
+
+    db.flush()
+    return moved
@@ -0,0 +1,41 @@
+from typing import Iterable
+
+from sqlalchemy.orm import Session
+
+from models.product import Product
+from models.product_barcode import ProductBarcode
+
+
+def resolve_codes(db: Session, *, company_id: int, codes: Iterable[str]) -> dict[str, int]:
+    """
+    {código: product_id} para barcodes/SKU escaneados o pegados, en consultas IN
+    (barcode principal, SKU y barcodes adicionales). Solo productos activos.
+    Códigos desconocidos no aparecen en el resultado.
+    """
+    wanted = sorted({(c or "").strip() for c in codes if (c or "").strip()})
+    out: dict[str, int] = {}
+    for i in range(0, len(wanted), 400):
+        chunk = wanted[i:i + 400]
+        for pid, barcode, sku in db.query(Product.id, Product.barcode, Product.sku).filter(
+            Product.company_id == company_id,
+            Product.is_active == True,
+            (Product.barcode.in_(chunk)) | (Product.sku.in_(chunk)),
+        ):
+            if barcode in chunk:
+                out.setdefault(barcode, pid)
+            if sku in chunk:
+                out.setdefault(sku, pid)
+
+        extra = [c for c in chunk if c not in out]
+        if extra:
+            for pid, barcode in (
+                db.query(ProductBarcode.product_id, ProductBarcode.barcode)
+                .join(Product, Product.id == ProductBarcode.product_id)
+                .filter(
+                    ProductBarcode.company_id == company_id,
+                    ProductBarcode.barcode.in_(extra),
+                    Product.is_active == True,
+                )
+            ):
+                out.setdefault(barcode, pid)
+    return out
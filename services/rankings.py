@@ -0,0 +1,304 @@
+import heapq
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.inventory import Inventory
+from models.product import Product
+from models.sale_rollup import SaleProductDaily
+from services import cache
+
+# Namespace de cache: se invalida por empresa al registrar/editar/anular ventas.
+CACHE_NS = "rankings"
+CACHE_TTL = 300
+
+# Cortes de la curva ABC (participación acumulada del ingreso)
+ABC_A = Decimal("0.80")
+ABC_B = Decimal("0.95")
+
+
+def invalidate(company_id: int) -> None:
+    cache.invalidate(CACHE_NS, company_id)
+
+
+def _branch_key(branch_ids: Optional[Iterable[int]]):
+    return None if branch_ids is None else tuple(sorted({int(b) for b in branch_ids}))
+
+
+@cache.memoized(CACHE_NS, ttl=CACHE_TTL)
+def product_stats(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[tuple],
+    date_from: date,
+    date_to: date,
+) -> dict:
+    """
+    Capa de consulta compartida (memoizada): un solo GROUP BY (producto, sucursal)
+    sobre el rollup diario. Todos los rankings se derivan de aquí en memoria.
+
+    Devuelve:
+    - products: {product_id: {qty_sum, amount_sum, cost_sum, margin_sum, by_branch}}
+    - branch_totals, total_qty, total_amount, total_cost
+    """
+    q = (
+        db.query(
+            SaleProductDaily.product_id.label("product_id"),
+            SaleProductDaily.branch_id.label("branch_id"),
+            func.coalesce(func.sum(SaleProductDaily.qty), 0).label("qty_sum"),
+            func.coalesce(func.sum(SaleProductDaily.amount), 0).label("amount_sum"),
+            func.coalesce(func.sum(SaleProductDaily.cost), 0).label("cost_sum"),
+        )
+        .filter(
+            SaleProductDaily.company_id == company_id,
+            SaleProductDaily.day >= date_from,
+            SaleProductDaily.day <= date_to,
+        )
+    )
+    if branch_ids is not None:
+        q = q.filter(SaleProductDaily.branch_id.in_(list(branch_ids)))
+
+    products: dict[int, dict] = {}
+    branch_totals: dict[int, dict] = {}
+    total_qty = Decimal("0.000")
+    total_amount = Decimal("0.00")
+    total_cost = Decimal("0.00")
+
+    for r in q.group_by(SaleProductDaily.product_id, SaleProductDaily.branch_id).all():
+        qty = Decimal(str(r.qty_sum or 0)).quantize(Decimal("0.001"))
+        amount = Decimal(str(r.amount_sum or 0)).quantize(Decimal("0.01"))
+        cost = Decimal(str(r.cost_sum or 0)).quantize(Decimal("0.01"))
+        if qty == 0 and amount == 0:
+            continue
+
+        it = products.setdefault(int(r.product_id), {
+            "product_id": int(r.product_id),
+            "qty_sum": Decimal("0.000"),
+            "amount_sum": Decimal("0.00"),
+            "cost_sum": Decimal("0.00"),
+            "margin_sum": Decimal("0.00"),
+            "by_branch": {},
+        })
+        it["qty_sum"] += qty
+        it["amount_sum"] += amount
+        it["cost_sum"] += cost
+        it["margin_sum"] += amount - cost
+        it["by_branch"][int(r.branch_id)] = {"qty_sum": qty, "amount_sum": amount}
+
+        bt = branch_totals.setdefault(int(r.branch_id), {"qty_sum": Decimal("0.000"), "amount_sum": Decimal("0.00")})
+        bt["qty_sum"] += qty
+        bt["amount_sum"] += amount
+
+        total_qty += qty
+        total_amount += amount
+        total_cost += cost
+
+    return {
+        "products": products,
+        "branch_totals": branch_totals,
+        "total_qty": total_qty,
+        "total_amount": total_amount,
+        "total_cost": total_cost,
+    }
+
+
+@cache.memoized(CACHE_NS, ttl=CACHE_TTL)
+def product_info(db: Session, *, company_id: int, product_ids: tuple) -> dict:
+    """Nombre/sku/barcode/imagen solo de los productos que se van a mostrar."""
+    if not product_ids:
+        return {}
+    rows = db.query(
+        Product.id, Product.name, Product.sku, Product.barcode,
+        Product.image_path, Product.image_updated_at, Product.is_active,
+    ).filter(Product.company_id == company_id, Product.id.in_(list(product_ids)))
+    return {
+        r.id: {
+            "product_name": r.name,
+            "sku": r.sku,
+            "barcode": r.barcode,
+            "image_path": r.image_path,
+            "image_updated_at": r.image_updated_at,
+            "is_active": bool(r.is_active),
+        }
+        for r in rows
+    }
+
+
+def _with_info(db: Session, company_id: int, items: list[dict]) -> list[dict]:
+    """Copia cada item (lo cacheado no se muta) y le agrega datos del producto."""
+    info = product_info(db, company_id=company_id, product_ids=tuple(sorted({it["product_id"] for it in items})))
+    out = []
+    for it in items:
+        p = info.get(it["product_id"])
+        row = dict(it)
+        row.update(p or {
+            "product_name": f"Producto #{it['product_id']}",
+            "sku": None,
+            "barcode": None,
+            "image_path": None,
+            "image_updated_at": None,
+            "is_active": False,
+        })
+        out.append(row)
+    return out
+
+
+def top_products(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[Iterable[int]],
+    date_from: date,
+    date_to: date,
+    limit: int = 20,
+) -> dict:
+    """
+    Top N por cantidad y por monto + totales exactos del rango.
+
+    - branch_ids=None: todas las sucursales de la empresa.
+    - Cada producto trae `by_branch` {branch_id: {qty_sum, amount_sum}} para comparar sucursales.
+    - El ranking usa heapq.nlargest (selección parcial, O(n log N)).
+    """
+    stats = product_stats(db, company_id=company_id, branch_ids=_branch_key(branch_ids), date_from=date_from, date_to=date_to)
+    items = stats["products"].values()
+
+    top_by_qty = heapq.nlargest(limit, items, key=lambda x: (x["qty_sum"], x["amount_sum"]))
+    top_by_amount = heapq.nlargest(limit, items, key=lambda x: (x["amount_sum"], x["qty_sum"]))
+
+    return {
+        "top_by_qty": _with_info(db, company_id, top_by_qty),
+        "top_by_amount": _with_info(db, company_id, top_by_amount),
+        "branch_totals": stats["branch_totals"],
+        "total_qty": stats["total_qty"],
+        "total_amount": stats["total_amount"],
+        "total_cost": stats["total_cost"],
+        "product_count": len(stats["products"]),
+    }
+
+
+def bottom_products(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[Iterable[int]],
+    date_from: date,
+    date_to: date,
+    limit: int = 20,
+) -> list[dict]:
+    """Los N productos con menor monto vendido (entre los que sí vendieron)."""
+    stats = product_stats(db, company_id=company_id, branch_ids=_branch_key(branch_ids), date_from=date_from, date_to=date_to)
+    rows = heapq.nsmallest(limit, stats["products"].values(), key=lambda x: (x["amount_sum"], x["qty_sum"]))
+    return _with_info(db, company_id, rows)
+
+
+def margin_leaders(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[Iterable[int]],
+    date_from: date,
+    date_to: date,
+    limit: int = 20,
+) -> list[dict]:
+    """Los N productos con mayor ganancia bruta (monto - costo) y su % de margen."""
+    stats = product_stats(db, company_id=company_id, branch_ids=_branch_key(branch_ids), date_from=date_from, date_to=date_to)
+    rows = _with_info(
+        db, company_id,
+        heapq.nlargest(limit, stats["products"].values(), key=lambda x: (x["margin_sum"], x["amount_sum"])),
+    )
+    for r in rows:
+        amount = r["amount_sum"]
+        r["margin_pct"] = (r["margin_sum"] * 100 / amount).quantize(Decimal("0.1")) if amount else Decimal("0.0")
+    return rows
+
+
+def abc_analysis(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[Iterable[int]],
+    date_from: date,
+    date_to: date,
+) -> dict:
+    """
+    Clasificación ABC por ingreso (Pareto):
+    - A: hasta 80% acumulado del ingreso
+    - B: hasta 95%
+    - C: resto
+
+    Devuelve {classes: {product_id: "A"|"B"|"C"}, summary: {A: {count, amount, share}, ...}}.
+    """
+    stats = product_stats(db, company_id=company_id, branch_ids=_branch_key(branch_ids), date_from=date_from, date_to=date_to)
+    total = stats["total_amount"]
+
+    classes: dict[int, str] = {}
+    summary = {k: {"count": 0, "amount": Decimal("0.00"), "share": Decimal("0.0")} for k in ("A", "B", "C")}
+
+    cum = Decimal("0.00")
+    ordered = sorted(stats["products"].values(), key=lambda x: (x["amount_sum"], x["qty_sum"]), reverse=True)
+    for it in ordered:
+        share_before = (cum / total) if total else Decimal("1")
+        cls = "A" if share_before < ABC_A else ("B" if share_before < ABC_B else "C")
+        cum += it["amount_sum"]
+        classes[it["product_id"]] = cls
+        summary[cls]["count"] += 1
+        summary[cls]["amount"] += it["amount_sum"]
+
+    for s in summary.values():
+        s["share"] = (s["amount"] * 100 / total).quantize(Decimal("0.1")) if total else Decimal("0.0")
+
+    return {"classes": classes, "summary": summary}
+
+
+def _stock_by_product(db: Session, *, company_id: int, branch_ids: Optional[tuple]) -> dict:
+    q = (
+        db.query(Inventory.product_id, func.coalesce(func.sum(Inventory.qty), 0))
+        .join(Product, Product.id == Inventory.product_id)
+        .filter(
+            Inventory.company_id == company_id,
+            Inventory.qty > 0,
+            Product.is_active == True,
+        )
+    )
+    if branch_ids is not None:
+        q = q.filter(Inventory.location_id.in_(list(branch_ids)))
+    return {
+        int(pid): Decimal(str(qty or 0)).quantize(Decimal("0.001"))
+        for pid, qty in q.group_by(Inventory.product_id).all()
+    }
+
+
+def slow_movers(
+    db: Session,
+    *,
+    company_id: int,
+    branch_ids: Optional[Iterable[int]],
+    date_from: date,
+    date_to: date,
+    limit: int = 20,
+) -> list[dict]:
+    """
+    Productos con stock en las sucursales pero que casi no se venden:
+    menor cantidad vendida en el rango (incluye 0) y, a igualdad, mayor stock.
+    """
+    key = _branch_key(branch_ids)
+    stats = product_stats(db, company_id=company_id, branch_ids=key, date_from=date_from, date_to=date_to)
+    stock = _stock_by_product(db, company_id=company_id, branch_ids=key)
+
+    sold = stats["products"]
+    zero = Decimal("0.000")
+    candidates = (
+        {
+            "product_id": pid,
+            "stock_qty": qty,
+            "qty_sum": sold[pid]["qty_sum"] if pid in sold else zero,
+            "amount_sum": sold[pid]["amount_sum"] if pid in sold else Decimal("0.00"),
+        }
+        for pid, qty in stock.items()
+    )
+    rows = heapq.nsmallest(limit, candidates, key=lambda x: (x["qty_sum"], -x["stock_qty"]))
+    return _with_info(db, company_id, rows)
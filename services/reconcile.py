@@ -0,0 +1,125 @@
+"""Conciliación inventories vs kardex.
+
+Neto del kardex por (producto, ubicación) en una sola pasada SQL agrupada
+(entradas + salidas como "piernas" con signo) y diff en memoria contra
+`inventories`. Pensado para correr de noche (`flask kardex-reconcile`).
+
+Con archivo de kardex, el OPENING del corte ya trae el saldo acumulado, así
+que basta con la tabla viva.
+"""
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, insert, select, union_all
+from sqlalchemy.orm import Session
+
+from models.branch import Branch
+from models.inventory import Inventory, LocationType
+from models.kardex import KardexMovement, KardexMoveType
+
+_QTY_Q = Decimal("0.001")
+
+
+def kardex_net(db: Session, *, company_id: int) -> dict[tuple[int, int], Decimal]:
+    """{(product_id, location_id): entradas - salidas} en un GROUP BY."""
+    K = KardexMovement
+    legs = union_all(
+        select(K.product_id.label("product_id"), K.to_location_id.label("location_id"), K.qty.label("delta"))
+        .where(K.company_id == company_id, K.to_location_id.isnot(None)),
+        select(K.product_id, K.from_location_id, -K.qty)
+        .where(K.company_id == company_id, K.from_location_id.isnot(None)),
+    ).subquery()
+    rows = db.execute(
+        select(legs.c.product_id, legs.c.location_id, func.sum(legs.c.delta))
+        .group_by(legs.c.product_id, legs.c.location_id)
+    )
+    return {
+        (int(pid), int(loc)): Decimal(str(net or 0)).quantize(_QTY_Q)
+        for pid, loc, net in rows
+    }
+
+
+def find_drift(db: Session, *, company_id: int) -> list[dict]:
+    """
+    Diferencias entre inventories.qty y el neto del kardex.
+    Devuelve [{product_id, location_type, location_id, inventory_qty, kardex_qty, diff}],
+    diff = inventario - kardex.
+    """
+    net = kardex_net(db, company_id=company_id)
+
+    # Inventario por (producto, ubicación); location_id ya identifica la ubicación
+    inv: dict[tuple[int, int], dict] = {}
+    for pid, loc_type, loc_id, qty, avg_cost in db.query(
+        Inventory.product_id, Inventory.location_type, Inventory.location_id, Inventory.qty, Inventory.avg_cost,
+    ).filter(Inventory.company_id == company_id):
+        row = inv.setdefault((int(pid), int(loc_id)), {
+            "location_type": loc_type, "qty": Decimal("0.000"), "avg_cost": avg_cost,
+        })
+        row["qty"] += Decimal(str(qty or 0)).quantize(_QTY_Q)
+
+    drift = []
+    for (pid, loc_id), row in inv.items():
+        k_qty = net.get((pid, loc_id), Decimal("0.000"))
+        if row["qty"] != k_qty:
+            drift.append({
+                "product_id": pid,
+                "location_type": row["location_type"],
+                "location_id": loc_id,
+                "inventory_qty": row["qty"],
+                "kardex_qty": k_qty,
+                "diff": row["qty"] - k_qty,
+                "avg_cost": row["avg_cost"],
+            })
+
+    # Movimientos sin fila de inventario (la ubicación nunca se creó / se borró)
+    orphans = [(key, k_qty) for key, k_qty in net.items() if key not in inv and k_qty != 0]
+    if orphans:
+        warehouses = {
+            b.id for b in db.query(Branch.id).filter(Branch.company_id == company_id, Branch.is_warehouse == True)
+        }
+    for (pid, loc_id), k_qty in orphans:
+        drift.append({
+            "product_id": pid,
+            "location_type": LocationType.WAREHOUSE if loc_id in warehouses else LocationType.BRANCH,
+            "location_id": loc_id,
+            "inventory_qty": Decimal("0.000"),
+            "kardex_qty": k_qty,
+            "diff": -k_qty,
+            "avg_cost": None,
+        })
+
+    drift.sort(key=lambda d: (d["location_id"], d["product_id"]))
+    return drift
+
+
+def write_corrections(db: Session, *, company_id: int, drift: list[dict], note: str = "Conciliación kardex") -> int:
+    """
+    Un ADJUST por diferencia para que el kardex explique el inventario actual
+    (el inventario es la verdad operativa; no se toca qty ni valorización).
+    """
+    now = datetime.utcnow()
+    rows = []
+    for d in drift:
+        diff = d["diff"]
+        if diff == 0:
+            continue
+        loc_type = d["location_type"]
+        rows.append({
+            "company_id": company_id,
+            "product_id": d["product_id"],
+            "move_type": KardexMoveType.ADJUST,
+            "from_location_type": None if diff > 0 else loc_type,
+            "from_location_id": None if diff > 0 else d["location_id"],
+            "to_location_type": loc_type if diff > 0 else None,
+            "to_location_id": d["location_id"] if diff > 0 else None,
+            "qty": abs(diff),
+            "unit_cost": d["avg_cost"],
+            "from_balance_after": None if diff > 0 else d["inventory_qty"],
+            "to_balance_after": d["inventory_qty"] if diff > 0 else None,
+            "note": note,
+            "created_at": now,
+        })
+    if rows:
+        db.execute(insert(KardexMovement), rows)
+        db.flush()
+    return len(rows)
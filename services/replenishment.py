@@ -0,0 +1,202 @@
+"""Planificador de reposición bodega → sucursales.
+
+Tres consultas agrupadas (venta por sucursal/producto del rollup diario,
+stock de sucursales y bodega, transferencias DRAFT pendientes) y el resto en
+memoria:
+
+- Objetivo por (sucursal, producto) = venta diaria promedio x días de cobertura,
+  redondeado hacia arriba a unidades enteras.
+- Necesidad = objetivo - (stock actual + lo que ya viene en transferencias
+  DRAFT hacia la sucursal), si es > 0. Lo comprometido en DRAFT que salen de
+  la bodega no cuenta como disponible: volver a planificar antes de confirmar
+  no duplica envíos.
+- Si la bodega no alcanza para un producto, se reparte por prioridad: primero
+  la sucursal con menos días de cobertura (greedy), cada una hasta su necesidad.
+
+`create_drafts` emite un StockTransfer DRAFT por sucursal en bloque; nada
+toca inventario hasta que alguien confirma.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal
+from typing import Optional
+
+from sqlalchemy import func, insert, or_
+from sqlalchemy.orm import Session
+
+from models.inventory import Inventory
+from models.product import Product
+from models.sale_rollup import SaleProductDaily
+from models.stock_transfer import StockTransfer, StockTransferItem
+from services import company_meta
+
+DEFAULT_WINDOW_DAYS = 28
+DEFAULT_COVER_DAYS = 14
+
+_ZERO = Decimal("0.000")
+
+
+def plan(
+    db: Session,
+    *,
+    company_id: int,
+    warehouse_id: int,
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    cover_days: int = DEFAULT_COVER_DAYS,
+    branch_ids: Optional[list[int]] = None,
+    today: Optional[date] = None
+) -> list[dict]:
+    """
+    Propuesta de reposición. Devuelve líneas
+    {branch_id, product_id, avg_daily, on_hand, pending, target, need, qty, coverage_days}
+    solo donde qty > 0, ordenadas por sucursal y prioridad.
+    """
+    today = today or date.today()
+    day_from = today - timedelta(days=window_days - 1)
+    window = Decimal(window_days)
+    cover = Decimal(cover_days)
+
+    branches = {b.id for b in company_meta.branches(db, company_id=company_id, warehouse=False)}
+    if branch_ids is not None:
+        branches &= {int(b) for b in branch_ids}
+    if not branches:
+        return []
+
+    active = Product.is_active == True
+
+    # 1) Venta en la ventana por sucursal/producto
+    avg: dict[tuple[int, int], Decimal] = {}
+    for bid, pid, qty in (
+        db.query(SaleProductDaily.branch_id, SaleProductDaily.product_id, func.sum(SaleProductDaily.qty))
+        .join(Product, Product.id == SaleProductDaily.product_id)
+        .filter(
+            SaleProductDaily.company_id == company_id,
+            SaleProductDaily.day >= day_from,
+            SaleProductDaily.day <= today,
+            SaleProductDaily.branch_id.in_(branches),
+            active,
+        )
+        .group_by(SaleProductDaily.branch_id, SaleProductDaily.product_id)
+    ):
+        q = Decimal(str(qty or 0))
+        if q > 0:
+            avg[(int(bid), int(pid))] = q / window
+
+    if not avg:
+        return []
+
+    # 2) Stock por ubicación (sucursales + bodega) en una consulta
+    on_hand: dict[tuple[int, int], Decimal] = {}
+    for loc_id, pid, qty in db.query(Inventory.location_id, Inventory.product_id, Inventory.qty).filter(
+        Inventory.company_id == company_id,
+        Inventory.location_id.in_(branches | {warehouse_id}),
+    ):
+        on_hand[(int(loc_id), int(pid))] = Decimal(str(qty or 0))
+
+    # 3) Transferencias DRAFT aún sin confirmar (de planes anteriores o manuales):
+    #    lo que sale de la bodega ya está comprometido, lo que llega a cada sucursal ya viene en camino
+    incoming: dict[tuple[int, int], Decimal] = defaultdict(lambda: _ZERO)
+    committed: dict[int, Decimal] = defaultdict(lambda: _ZERO)
+    T, TI = StockTransfer, StockTransferItem
+    for from_id, to_id, pid, qty in (
+        db.query(T.from_branch_id, T.to_branch_id, TI.product_id, func.sum(TI.qty))
+        .join(TI, TI.transfer_id == T.id)
+        .filter(
+            T.company_id == company_id,
+            T.status == "DRAFT",
+            or_(T.from_branch_id == warehouse_id, T.to_branch_id.in_(branches)),
+        )
+        .group_by(T.from_branch_id, T.to_branch_id, TI.product_id)
+    ):
+        q = Decimal(str(qty or 0))
+        if int(from_id) == warehouse_id:
+            committed[int(pid)] += q
+        if int(to_id) in branches:
+            incoming[(int(to_id), int(pid))] += q
+
+    # 4) Necesidades por producto
+    needs: dict[int, list[dict]] = defaultdict(list)
+    for (bid, pid), daily in avg.items():
+        stock = max(on_hand.get((bid, pid), _ZERO), _ZERO)
+        pending = incoming.get((bid, pid), _ZERO)
+        target = (daily * cover).quantize(Decimal("1"), rounding=ROUND_CEILING)
+        need = target - stock - pending
+        if need <= 0:
+            continue
+        needs[pid].append({
+            "branch_id": bid,
+            "product_id": pid,
+            "avg_daily": daily.quantize(Decimal("0.0001")),
+            "on_hand": stock.quantize(Decimal("0.001")),
+            "pending": pending.quantize(Decimal("0.001")),
+            "target": target,
+            "need": need.quantize(Decimal("0.001")),
+            "coverage_days": ((stock + pending) / daily).quantize(Decimal("0.1")),
+            "qty": _ZERO,
+        })
+
+    # 5) Asignación greedy por prioridad (menor cobertura primero)
+    lines = []
+    for pid, rows in needs.items():
+        available = max(on_hand.get((warehouse_id, pid), _ZERO), _ZERO) - committed.get(pid, _ZERO)
+        if available <= 0:
+            continue
+        rows.sort(key=lambda r: (r["coverage_days"], -r["avg_daily"]))
+        for r in rows:
+            if available <= 0:
+                break
+            give = min(r["need"], available)
+            # Sin fraccionar unidades al repartir stock escaso
+            if give < r["need"]:
+                give = give.quantize(Decimal("1"), rounding=ROUND_FLOOR)
+            if give <= 0:
+                continue
+            r["qty"] = give.quantize(Decimal("0.001"))
+            available -= give
+            lines.append(r)
+
+    lines.sort(key=lambda r: (r["branch_id"], r["coverage_days"], r["product_id"]))
+    return lines
+
+
+def create_drafts(
+    db: Session,
+    *,
+    company_id: int,
+    warehouse_id: int,
+    lines: list[dict],
+    user_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> list[int]:
+    """Un StockTransfer DRAFT por sucursal con sus items (INSERT executemany). Devuelve ids."""
+    by_branch: dict[int, list[dict]] = defaultdict(list)
+    for ln in lines:
+        if ln["qty"] > 0:
+            by_branch[int(ln["branch_id"])].append(ln)
+    if not by_branch:
+        return []
+
+    now = datetime.utcnow()
+    note = note or f"Reposición sugerida {now:%Y-%m-%d}"
+    transfers = {
+        bid: StockTransfer(
+            company_id=company_id,
+            from_branch_id=warehouse_id,
+            to_branch_id=bid,
+            note=note[:255],
+            status="DRAFT",
+            created_by_user_id=user_id,
+            created_at=now,
+        )
+        for bid in by_branch
+    }
+    db.add_all(transfers.values())
+    db.flush()
+
+    db.execute(insert(StockTransferItem), [
+        {"transfer_id": transfers[bid].id, "product_id": ln["product_id"], "qty": ln["qty"], "created_at": now}
+        for bid, rows in by_branch.items()
+        for ln in rows
+    ])
+    db.flush()
+    return [t.id for t in transfers.values()]
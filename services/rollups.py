@@ -0,0 +1,116 @@
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.sale import Sale, SaleItem
+from models.sale_rollup import SaleProductDaily
+
+
+def _dec(val, q: str) -> Decimal:
+    return Decimal(str(val or 0)).quantize(Decimal(q))
+
+
+def bump_sale_items(
+    db: Session,
+    *,
+    company_id: int,
+    branch_id: int,
+    day: date,
+    items: Iterable[SaleItem],
+    sign: int = 1,
+) -> None:
+    """
+    Suma (sign=1) o resta (sign=-1) las líneas de una venta en el rollup diario.
+    Agrupa por producto en memoria y hace un get-or-create por producto.
+    """
+    acc: dict[int, list[Decimal]] = {}
+    for it in items:
+        qty = _dec(it.qty, "0.001")
+        row = acc.setdefault(int(it.product_id), [Decimal("0.000"), Decimal("0.00"), Decimal("0.00")])
+        row[0] += qty
+        row[1] += _dec(it.subtotal, "0.01")
+        row[2] += (_dec(it.unit_cost, "0.01") * qty).quantize(Decimal("0.01"))
+
+    if not acc:
+        return
+
+    existing = {
+        r.product_id: r
+        for r in db.query(SaleProductDaily).filter(
+            SaleProductDaily.company_id == company_id,
+            SaleProductDaily.branch_id == branch_id,
+            SaleProductDaily.day == day,
+            SaleProductDaily.product_id.in_(list(acc.keys())),
+        )
+    }
+
+    for product_id, (qty, amount, cost) in acc.items():
+        r = existing.get(product_id)
+        if not r:
+            r = SaleProductDaily(
+                company_id=company_id,
+                branch_id=branch_id,
+                product_id=product_id,
+                day=day,
+                qty=Decimal("0.000"),
+                amount=Decimal("0.00"),
+                cost=Decimal("0.00"),
+            )
+            db.add(r)
+        r.qty = _dec(r.qty, "0.001") + sign * qty
+        r.amount = _dec(r.amount, "0.01") + sign * amount
+        r.cost = _dec(r.cost, "0.01") + sign * cost
+
+    db.flush()
+
+
+def bump_sale(db: Session, sale: Sale, items: Optional[Iterable[SaleItem]] = None, sign: int = 1) -> None:
+    """Atajo: aplica las líneas de una venta (o las indicadas) en su día/sucursal."""
+    bump_sale_items(
+        db,
+        company_id=int(sale.company_id),
+        branch_id=int(sale.branch_id),
+        day=sale.created_at.date(),
+        items=list(sale.items) if items is None else items,
+        sign=sign,
+    )
+
+
+def rebuild_product_daily(db: Session, *, company_id: Optional[int] = None) -> int:
+    """
+    Reconstruye el rollup desde sale_items (backfill / reparación).
+    Un DELETE + un INSERT ... SELECT agrupado. Devuelve filas generadas.
+    """
+    delete_q = db.query(SaleProductDaily)
+    if company_id:
+        delete_q = delete_q.filter(SaleProductDaily.company_id == company_id)
+    delete_q.delete(synchronize_session=False)
+
+    day_expr = func.date(Sale.created_at)
+    sel = (
+        db.query(
+            Sale.company_id,
+            Sale.branch_id,
+            SaleItem.product_id,
+            day_expr,
+            func.coalesce(func.sum(SaleItem.qty), 0),
+            func.coalesce(func.sum(SaleItem.subtotal), 0),
+            func.coalesce(func.sum(SaleItem.unit_cost * SaleItem.qty), 0),
+            func.current_timestamp(),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .group_by(Sale.company_id, Sale.branch_id, SaleItem.product_id, day_expr)
+    )
+    if company_id:
+        sel = sel.filter(Sale.company_id == company_id)
+
+    ins = SaleProductDaily.__table__.insert().from_select(
+        ["company_id", "branch_id", "product_id", "day", "qty", "amount", "cost", "updated_at"],
+        sel.statement,
+    )
+    result = db.execute(ins)
+    db.flush()
+    return int(result.rowcount or 0)
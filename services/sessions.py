@@ -0,0 +1,236 @@
+"""Sesión del lado del servidor (SESSION_BACKEND = "sqlite" | "memory" | "cookie").
+
+Con la cookie firmada de Flask todo el estado (pos_cart, contexto, roles,
+lista de contextos) viaja y se re-firma en cada respuesta, y el carrito la
+hace crecer sin límite. Con estos backends la cookie lleva solo un id
+aleatorio y el contenido queda en:
+
+- "sqlite": tabla `sessions` en un archivo SQLite local propio
+  (SESSION_SQLITE_PATH, default <instance_path>/sessions.db), fuera de la
+  base de la app para no mezclarse con las transacciones de db.session. Sirve con varios procesos en la misma máquina.
+- "memory": dict en proceso; solo para un único proceso (se pierde al reiniciar).
+
+La expiración es deslizante (SESSION_TTL) y se renueva sin reescribir el
+contenido cuando pasó la mitad del plazo. Al iniciar sesión (`regenerate`) o
+tras `session.clear()` el id se rota: el id anónimo previo nunca queda
+autenticado (session fixation). Cada proceso barre las vencidas
+cada SESSION_SWEEP_INTERVAL segundos; `flask sessions-sweep` hace lo mismo a mano.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+_serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """
+    Dict de sesión con id; `modified` se marca al tocar claves de primer nivel.
+    `rotate`: al guardar, borrar la fila actual y emitir un id nuevo.
+    """
+
+    def __init__(self, initial: Optional[dict] = None, sid: Optional[str] = None, expires: float = 0):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = sid is None
+        self.expires = expires
+        self.modified = False
+        self.rotate = False
+
+    def clear(self) -> None:
+        super().clear()
+        self.rotate = True
+
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict[str, tuple[float, str]] = {}
+
+    def load(self, sid: str, now: float) -> Optional[tuple[float, str]]:
+        with self._lock:
+            hit = self._data.get(sid)
+        if hit and hit[0] > now:
+            return hit
+        return None
+
+    def save(self, sid: str, payload: str, expires: float) -> None:
+        with self._lock:
+            self._data[sid] = (expires, payload)
+
+    def touch(self, sid: str, expires: float) -> None:
+        with self._lock:
+            hit = self._data.get(sid)
+            if hit:
+                self._data[sid] = (expires, hit[1])
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, now: float) -> int:
+        with self._lock:
+            dead = [sid for sid, (exp, _) in self._data.items() if exp <= now]
+            for sid in dead:
+                del self._data[sid]
+        return len(dead)
+
+
+class SqliteStore:
+    """Una conexión por hilo al archivo de sesiones (WAL: lectores no bloquean al escritor)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " sid TEXT PRIMARY KEY,"
+            " expires REAL NOT NULL,"
+            " payload TEXT NOT NULL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid: str, now: float) -> Optional[tuple[float, str]]:
+        row = self._conn().execute(
+            "SELECT expires, payload FROM sessions WHERE sid = ? AND expires > ?", (sid, now)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save(self, sid: str, payload: str, expires: float) -> None:
+        self._conn().execute(
+            "INSERT INTO sessions (sid, expires, payload) VALUES (?, ?, ?)"
+            " ON CONFLICT(sid) DO UPDATE SET expires = excluded.expires, payload = excluded.payload",
+            (sid, expires, payload),
+        )
+
+    def touch(self, sid: str, expires: float) -> None:
+        self._conn().execute("UPDATE sessions SET expires = ? WHERE sid = ?", (expires, sid))
+
+    def delete(self, sid: str) -> None:
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self, now: float) -> int:
+        return self._conn().execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store, ttl: float, sweep_interval: float):
+        self.store = store
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def open_session(self, app, request) -> ServerSession:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            hit = self.store.load(sid, time.time())
+            if hit:
+                try:
+                    return ServerSession(_serializer.loads(hit[1]), sid=sid, expires=hit[0])
+                except ValueError:
+                    pass
+        return ServerSession()
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.store.sweep(now)
+
+    def save_session(self, app, session: ServerSession, response) -> None:
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+        self._maybe_sweep(now)
+
+        if not session:
+            # Vaciada (logout / session.clear()): borrar fila y cookie
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        expires = now + self.ttl
+        if session.rotate and session.sid:
+            self.store.delete(session.sid)
+            session.sid = None
+            session.new = True
+        if session.modified or session.new:
+            if session.new:
+                session.sid = secrets.token_urlsafe(32)
+            self.store.save(session.sid, _serializer.dumps(dict(session)), expires)
+        elif session.expires - now < self.ttl / 2:
+            self.store.touch(session.sid, expires)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app) -> None:
+    """Instala el backend elegido en SESSION_BACKEND ("cookie" deja el de Flask)."""
+    backend = (app.config.get("SESSION_BACKEND") or "cookie").lower()
+    if backend == "cookie":
+        return
+    if backend == "memory":
+        store = MemoryStore()
+    elif backend == "sqlite":
+        path = app.config.get("SESSION_SQLITE_PATH")
+        if not path:
+            os.makedirs(app.instance_path, exist_ok=True)
+            path = os.path.join(app.instance_path, "sessions.db")
+        store = SqliteStore(path)
+    else:
+        raise ValueError(f"SESSION_BACKEND desconocido: {backend!r} (cookie | sqlite | memory)")
+
+    app.session_interface = ServerSideSessionInterface(
+        store,
+        ttl=app.config.get("SESSION_TTL", 86400),
+        sweep_interval=app.config.get("SESSION_SWEEP_INTERVAL", 600),
+    )
+
+
+def regenerate(session) -> None:
+    """
+    Rota el id de la sesión al guardarla (mismo contenido, fila nueva). Llamar
+    al autenticar. Con el backend "cookie" no hace nada: no hay id que fijar.
+    """
+    if isinstance(session, ServerSession):
+        session.rotate = True
+        session.modified = True
+
+
+def sweep(app) -> int:
+    """Borra las sesiones vencidas del backend actual. Devuelve cuántas."""
+    iface = app.session_interface
+    if not isinstance(iface, ServerSideSessionInterface):
+        return 0
+    return iface.store.sweep(time.time())
@@ -0,0 +1,193 @@
+"""Benchmark de perfiles de SQLite (models.sqlite_pragmas) con varias cajas a la vez.
+
+Cada perfil corre sobre un archivo nuevo con el esquema completo y el mismo
+escenario: `tills` hilos cobrando ventas en su propia sucursal (venta +
+salida de stock con kardex, valorización y rollup, igual que pos.checkout)
+mientras `readers` hilos consultan ventas por sucursal como los reportes.
+Se mide ventas/s, latencia por venta, lecturas completadas y cuántas ventas
+fallaron por "database is locked".
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from models import db, sqlite_pragmas
+from models.branch import Branch
+from models.company import Company
+from models.inventory import LocationType
+from models.kardex import KardexMoveType
+from models.product import Product
+from models.sale import Sale, SaleItem
+from services.rollups import bump_sale
+from services.stock import add_stock, remove_stock
+
+ITEMS_PER_SALE = 3
+
+
+def _seed(engine: sa.Engine, *, tills: int, products: int, sales_per_till: int) -> tuple[int, list[int], list[int]]:
+    """Empresa con una sucursal por caja y stock suficiente en cada una."""
+    with Session(engine) as s:
+        c = Company(name="Bench")
+        s.add(c)
+        s.flush()
+        branches = [Branch(company_id=c.id, name=f"Caja {i + 1}") for i in range(tills)]
+        s.add_all(branches)
+        ps = [
+            Product(company_id=c.id, name=f"P{i}", sku=f"B{i}", price_minorista=Decimal("10.00"), cost_price=Decimal("6.00"))
+            for i in range(products)
+        ]
+        s.add_all(ps)
+        s.flush()
+        qty = sales_per_till * ITEMS_PER_SALE + 1
+        for b in branches:
+            for p in ps:
+                add_stock(
+                    s,
+                    company_id=c.id,
+                    product_id=p.id,
+                    location_type=LocationType.BRANCH,
+                    location_id=b.id,
+                    qty=qty,
+                    move_type=KardexMoveType.PURCHASE_IN,
+                    unit_cost=p.cost_price,
+                )
+        s.commit()
+        return c.id, [b.id for b in branches], [p.id for p in ps]
+
+
+def _sell(s: Session, *, company_id: int, branch_id: int, product_ids: list[int]) -> None:
+    sale = Sale(company_id=company_id, branch_id=branch_id, price_mode="minorista")
+    s.add(sale)
+    s.flush()
+    items = []
+    for pid in product_ids:
+        _, km = remove_stock(
+            s,
+            company_id=company_id,
+            product_id=pid,
+            location_type=LocationType.BRANCH,
+            location_id=branch_id,
+            qty=1,
+            move_type=KardexMoveType.SALE_OUT,
+            note=f"Venta #{sale.id}",
+        )
+        si = SaleItem(
+            sale_id=sale.id,
+            product_id=pid,
+            qty=Decimal("1.000"),
+            unit_price=Decimal("10.00"),
+            unit_cost=Decimal(str(km.unit_cost or 0)).quantize(Decimal("0.01")),
+            subtotal=Decimal("10.00"),
+        )
+        s.add(si)
+        items.append(si)
+    total = Decimal("10.00") * len(items)
+    sale.subtotal = sale.total = total
+    bump_sale(s, sale, items=items)
+    s.commit()
+
+
+def run_profile(
+    profile: str,
+    *,
+    tills: int = 4,
+    sales_per_till: int = 100,
+    readers: int = 1,
+    products: int = 20,
+    directory: Optional[str] = None,
+) -> dict:
+    """Corre el escenario con un perfil y devuelve las métricas."""
+    pragmas = sqlite_pragmas.resolve(profile)
+    fd, path = tempfile.mkstemp(prefix=f"bench_{profile}_", suffix=".db", dir=directory)
+    os.close(fd)
+    engine = sa.create_engine(f"sqlite:///{path}")
+    sqlite_pragmas.install(engine, pragmas)
+    try:
+        db.metadata.create_all(engine)
+        company_id, branch_ids, product_ids = _seed(
+            engine, tills=tills, products=products, sales_per_till=sales_per_till
+        )
+
+        latencies: list[float] = []
+        locked = [0]
+        reads = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+        start = threading.Barrier(tills + readers)
+
+        def till(branch_id: int) -> None:
+            rnd = random.Random(branch_id)
+            with Session(engine) as s:
+                start.wait()
+                for _ in range(sales_per_till):
+                    t0 = time.perf_counter()
+                    try:
+                        _sell(s, company_id=company_id, branch_id=branch_id,
+                              product_ids=rnd.sample(product_ids, ITEMS_PER_SALE))
+                    except OperationalError:
+                        s.rollback()
+                        with lock:
+                            locked[0] += 1
+                        continue
+                    with lock:
+                        latencies.append(time.perf_counter() - t0)
+
+        def reader() -> None:
+            with Session(engine) as s:
+                start.wait()
+                while not done.is_set():
+                    try:
+                        s.query(Sale.branch_id, func.count(Sale.id), func.sum(Sale.total)).filter(
+                            Sale.company_id == company_id
+                        ).group_by(Sale.branch_id).all()
+                        s.rollback()
+                    except OperationalError:
+                        s.rollback()
+                        continue
+                    with lock:
+                        reads[0] += 1
+
+        till_threads = [threading.Thread(target=till, args=(bid,)) for bid in branch_ids]
+        reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+        t0 = time.perf_counter()
+        for t in till_threads + reader_threads:
+            t.start()
+        for t in till_threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        done.set()
+        for t in reader_threads:
+            t.join()
+
+        latencies.sort()
+
+        def _pct(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            "profile": profile,
+            "pragmas": pragmas,
+            "sales": len(latencies),
+            "locked": locked[0],
+            "reads": reads[0],
+            "seconds": elapsed,
+            "sales_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": _pct(0.50),
+            "p95_ms": _pct(0.95),
+        }
+    finally:
+        engine.dispose()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
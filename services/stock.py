@@ -1,9 +1,14 @@
+from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from typing import Optional
+
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
 
 from models.inventory import Inventory, LocationType
-from models.kardex import KardexMovement, KardexMoveType
+from models.kardex import KardexMovement, KardexMovementArchive, KardexMoveType
+from models.product import Product
+from services import costing, kardex_archive, valuation
 
 
 def _to_qty(val) -> Decimal:
@@ -22,6 +27,19 @@ def _to_qty(val) -> Decimal:
     return d.quantize(Decimal("0.001"))
 
 
+def _to_cost(val) -> Optional[Decimal]:
+    """Costo unitario (coma/punto) >= 0 con 4 decimales; None si no viene o es inválido."""
+    if val is None or str(val).strip() == "":
+        return None
+    try:
+        d = Decimal(str(val).strip().replace(",", "."))
+    except (InvalidOperation, ValueError):
+        return None
+    if d < 0:
+        return None
+    return d.quantize(Decimal("0.0001"))
+
+
 def get_or_create_inventory(
     db: Session,
     *,
@@ -47,12 +65,48 @@ def get_or_create_inventory(
             location_type=location_type,
             location_id=location_id,
             qty=Decimal("0.000"),
+            avg_cost=Decimal("0.0000"),
+            stock_value=Decimal("0.00"),
         )
         db.add(inv)
         db.flush()
     return inv
 
 
+def _kardex_in(inv: Inventory, q: Decimal, cost: Decimal, move_type: str, note: Optional[str]) -> KardexMovement:
+    """Kardex de entrada (from_=None -> to_=ubicación) con el saldo ya actualizado."""
+    return KardexMovement(
+        company_id=inv.company_id,
+        product_id=inv.product_id,
+        move_type=move_type,
+        from_location_type=None,
+        from_location_id=None,
+        to_location_type=inv.location_type,
+        to_location_id=inv.location_id,
+        qty=q,
+        unit_cost=cost,
+        to_balance_after=inv.qty,
+        note=note,
+    )
+
+
+def _kardex_out(inv: Inventory, q: Decimal, cost: Decimal, move_type: str, note: Optional[str]) -> KardexMovement:
+    """Kardex de salida (from_=ubicación -> to_=None) con el saldo ya actualizado."""
+    return KardexMovement(
+        company_id=inv.company_id,
+        product_id=inv.product_id,
+        move_type=move_type,
+        from_location_type=inv.location_type,
+        from_location_id=inv.location_id,
+        to_location_type=None,
+        to_location_id=None,
+        qty=q,
+        unit_cost=cost,
+        from_balance_after=inv.qty,
+        note=note,
+    )
+
+
 def add_stock(
     db: Session,
     *,
@@ -68,6 +122,9 @@ def add_stock(
     """
     Suma stock en una ubicación (entrada/ajuste+).
     Registra kardex: from_=None -> to_=ubicación
+
+    unit_cost: costo de la entrada (compra). Sin él entra al costo promedio
+    vigente de la ubicación (devoluciones, ajustes).
     """
     if location_type not in LocationType.ALL:
         raise ValueError("location_type inválido")
@@ -87,20 +144,18 @@ def add_stock(
         location_id=location_id,
     )
 
-    inv.qty = _to_qty(inv.qty) + q
+    cost, value_delta = costing.receive(db, inv, q, _to_cost(unit_cost))
 
-    km = KardexMovement(
+    valuation.apply_delta(
+        db,
         company_id=company_id,
-        product_id=product_id,
-        move_type=move_type,
-        from_location_type=None,
-        from_location_id=None,
-        to_location_type=location_type,
-        to_location_id=location_id,
-        qty=q,
-        unit_cost=_to_qty(unit_cost).quantize(Decimal("0.0001")) if unit_cost is not None else None,
-        note=note,
+        location_type=location_type,
+        location_id=location_id,
+        qty_delta=q,
+        value_delta=value_delta,
     )
+
+    km = _kardex_in(inv, q, cost, move_type, note)
     db.add(km)
     db.flush()
     return inv, km
@@ -119,7 +174,8 @@ def remove_stock(
 ):
     """
     Resta stock en una ubicación (venta/ajuste-/transferencia salida).
-    Registra kardex: from_=ubicación -> to_=None
+    Registra kardex: from_=ubicación -> to_=None, con unit_cost = costo promedio
+    de salida (el costo de venta exacto para SaleItem.unit_cost).
     """
     if location_type not in LocationType.ALL:
         raise ValueError("location_type inválido")
@@ -143,19 +199,18 @@ def remove_stock(
     if current < q:
         raise ValueError(f"Stock insuficiente. Disponible={current} requerido={q}")
 
-    inv.qty = current - q
+    cost, value_delta = costing.issue(db, inv, q)
 
-    km = KardexMovement(
+    valuation.apply_delta(
+        db,
         company_id=company_id,
-        product_id=product_id,
-        move_type=move_type,
-        from_location_type=location_type,
-        from_location_id=location_id,
-        to_location_type=None,
-        to_location_id=None,
-        qty=q,
-        note=note,
+        location_type=location_type,
+        location_id=location_id,
+        qty_delta=-q,
+        value_delta=value_delta,
     )
+
+    km = _kardex_out(inv, q, cost, move_type, note)
     db.add(km)
     db.flush()
     return inv, km
@@ -176,6 +231,7 @@ def transfer_stock(
     """
     Transferencia: resta en origen y suma en destino.
     Registra un SOLO kardex con from_ y to_.
+    El destino recibe al costo promedio del origen.
     """
     if from_location_type not in LocationType.ALL or to_location_type not in LocationType.ALL:
         raise ValueError("location_type inválido")
@@ -203,8 +259,25 @@ def transfer_stock(
         location_id=to_location_id,
     )
 
-    inv_from.qty = current - q
-    inv_to.qty = _to_qty(inv_to.qty) + q
+    cost, out_delta = costing.issue(db, inv_from, q)
+    _, in_delta = costing.receive(db, inv_to, q, cost)
+
+    valuation.apply_delta(
+        db,
+        company_id=company_id,
+        location_type=from_location_type,
+        location_id=from_location_id,
+        qty_delta=-q,
+        value_delta=out_delta,
+    )
+    valuation.apply_delta(
+        db,
+        company_id=company_id,
+        location_type=to_location_type,
+        location_id=to_location_id,
+        qty_delta=q,
+        value_delta=in_delta,
+    )
 
     km = KardexMovement(
         company_id=company_id,
@@ -215,8 +288,379 @@ def transfer_stock(
         to_location_type=to_location_type,
         to_location_id=to_location_id,
         qty=q,
+        unit_cost=cost,
+        from_balance_after=inv_from.qty,
+        to_balance_after=inv_to.qty,
         note=note,
     )
     db.add(km)
     db.flush()
     return inv_from, inv_to, km
+
+
+def _load_inventories(
+    db: Session,
+    *,
+    company_id: int,
+    location_type: str,
+    location_id: int,
+    product_ids: list[int],
+    lock: bool = False
+) -> dict[int, Inventory]:
+    """Filas de inventario de una ubicación para varios productos (IN por bloques de 500)."""
+    out: dict[int, Inventory] = {}
+    for i in range(0, len(product_ids), 500):
+        q = db.query(Inventory).filter(
+            Inventory.company_id == company_id,
+            Inventory.location_type == location_type,
+            Inventory.location_id == location_id,
+            Inventory.product_id.in_(product_ids[i:i + 500]),
+        )
+        if lock:
+            q = q.with_for_update()
+        for inv in q:
+            out[int(inv.product_id)] = inv
+    return out
+
+
+def transfer_lines(
+    db: Session,
+    *,
+    company_id: int,
+    from_location_type: str,
+    from_location_id: int,
+    to_location_type: str,
+    to_location_id: int,
+    lines: dict,
+    note: Optional[str] = None
+) -> int:
+    """
+    Transferencia de un documento completo: {product_id: qty}.
+
+    Misma lógica que transfer_stock (costo promedio de origen, un kardex TRANSFER
+    por línea con ambos saldos), pero por conjuntos: las filas de origen y destino
+    se leen (y bloquean) con un IN por ubicación, el stock se valida para todas
+    las líneas antes de mover nada, los UPDATE de inventario salen agrupados en
+    un flush y los destinos nuevos y el kardex se insertan en bloque
+    (executemany). Un apply_delta por ubicación. Devuelve líneas movidas.
+    """
+    if from_location_type not in LocationType.ALL or to_location_type not in LocationType.ALL:
+        raise ValueError("location_type inválido")
+    if from_location_id == to_location_id:
+        raise ValueError("Origen y destino no pueden ser iguales")
+
+    wanted: dict[int, Decimal] = {}
+    for pid, qty in lines.items():
+        q = _to_qty(qty)
+        if q <= 0:
+            raise ValueError("qty debe ser > 0")
+        wanted[int(pid)] = q
+    if not wanted:
+        return 0
+
+    pids = sorted(wanted)
+    src = _load_inventories(
+        db, company_id=company_id, location_type=from_location_type,
+        location_id=from_location_id, product_ids=pids, lock=True,
+    )
+    short = [
+        f"#{pid} disponible={_to_qty(src[pid].qty) if pid in src else Decimal('0.000')} requerido={q}"
+        for pid, q in wanted.items()
+        if pid not in src or _to_qty(src[pid].qty) < q
+    ]
+    if short:
+        raise ValueError("Stock insuficiente en origen: " + "; ".join(short[:10]))
+
+    dst = _load_inventories(
+        db, company_id=company_id, location_type=to_location_type,
+        location_id=to_location_id, product_ids=pids, lock=True,
+    )
+    # Destinos nuevos: se calculan fuera de la sesión y se insertan en bloque al final
+    new_dst = [pid for pid in pids if pid not in dst]
+    for pid in new_dst:
+        dst[pid] = Inventory(
+            company_id=company_id,
+            product_id=pid,
+            location_type=to_location_type,
+            location_id=to_location_id,
+            qty=Decimal("0.000"),
+            avg_cost=Decimal("0.0000"),
+            stock_value=Decimal("0.00"),
+        )
+
+    now = datetime.utcnow()
+    moves = []
+    qty_total = Decimal("0.000")
+    out_total = Decimal("0.00")
+    in_total = Decimal("0.00")
+    for pid in pids:
+        q = wanted[pid]
+        inv_from, inv_to = src[pid], dst[pid]
+        cost, out_delta = costing.issue(db, inv_from, q)
+        _, in_delta = costing.receive(db, inv_to, q, cost)
+        qty_total += q
+        out_total += out_delta
+        in_total += in_delta
+        moves.append({
+            "company_id": company_id,
+            "product_id": pid,
+            "move_type": KardexMoveType.TRANSFER,
+            "from_location_type": from_location_type,
+            "from_location_id": from_location_id,
+            "to_location_type": to_location_type,
+            "to_location_id": to_location_id,
+            "qty": q,
+            "unit_cost": cost,
+            "from_balance_after": inv_from.qty,
+            "to_balance_after": inv_to.qty,
+            "note": note,
+            "created_at": now,
+        })
+
+    # UPDATE agrupados de las filas existentes (origen y destino)
+    db.flush()
+    if new_dst:
+        db.execute(insert(Inventory), [
+            {
+                "company_id": company_id,
+                "product_id": pid,
+                "location_type": to_location_type,
+                "location_id": to_location_id,
+                "qty": dst[pid].qty,
+                "avg_cost": dst[pid].avg_cost,
+                "stock_value": dst[pid].stock_value,
+                "updated_at": now,
+            }
+            for pid in new_dst
+        ])
+    db.execute(insert(KardexMovement), moves)
+
+    valuation.apply_delta(
+        db,
+        company_id=company_id,
+        location_type=from_location_type,
+        location_id=from_location_id,
+        qty_delta=-qty_total,
+        value_delta=out_total,
+    )
+    valuation.apply_delta(
+        db,
+        company_id=company_id,
+        location_type=to_location_type,
+        location_id=to_location_id,
+        qty_delta=qty_total,
+        value_delta=in_total,
+    )
+    db.flush()
+    return len(moves)
+
+
+ADJUST_OUT_TYPES = {KardexMoveType.ADJUST, KardexMoveType.SHRINKAGE, KardexMoveType.DAMAGE}
+
+
+def apply_counts(
+    db: Session,
+    *,
+    company_id: int,
+    location_type: str,
+    location_id: int,
+    counts: dict,
+    out_move_type: str = KardexMoveType.ADJUST,
+    note: Optional[str] = None
+) -> list[dict]:
+    """
+    Hoja de conteo: {product_id: cantidad contada} para una ubicación.
+
+    - Lee el inventario actual de todos los productos en una consulta (IN por bloques).
+    - Diferencia > 0: ADJUST de entrada; < 0: salida como `out_move_type`
+      (ADJUST / SHRINKAGE / DAMAGE).
+    - Costo promedio, kardex y valorización igual que add_stock/remove_stock, pero
+      con un solo apply_delta de valorización y un solo flush (todo en la transacción
+      del llamador).
+
+    Devuelve [{product_id, before, counted, delta}] solo de las líneas con diferencia.
+    """
+    if location_type not in LocationType.ALL:
+        raise ValueError("location_type inválido")
+    if out_move_type not in ADJUST_OUT_TYPES:
+        raise ValueError("move_type inválido")
+
+    wanted = {int(pid): _to_qty(qty) for pid, qty in counts.items()}
+    if not wanted:
+        return []
+
+    invs: dict[int, Inventory] = {}
+    pids = list(wanted.keys())
+    for i in range(0, len(pids), 500):
+        chunk = pids[i:i + 500]
+        # Productos al identity map (costing.current_cost los usa para ubicaciones vacías)
+        db.query(Product).filter(Product.company_id == company_id, Product.id.in_(chunk)).all()
+        for inv in db.query(Inventory).filter(
+            Inventory.company_id == company_id,
+            Inventory.location_type == location_type,
+            Inventory.location_id == location_id,
+            Inventory.product_id.in_(chunk),
+        ):
+            invs[int(inv.product_id)] = inv
+
+    missing = [pid for pid, qty in wanted.items() if pid not in invs and qty > 0]
+    for pid in missing:
+        invs[pid] = Inventory(
+            company_id=company_id,
+            product_id=pid,
+            location_type=location_type,
+            location_id=location_id,
+            qty=Decimal("0.000"),
+            avg_cost=Decimal("0.0000"),
+            stock_value=Decimal("0.00"),
+        )
+        db.add(invs[pid])
+
+    lines = []
+    qty_total = Decimal("0.000")
+    value_total = Decimal("0.00")
+    for pid, counted in wanted.items():
+        inv = invs.get(pid)
+        before = _to_qty(inv.qty) if inv else Decimal("0.000")
+        delta = counted - before
+        if delta == 0:
+            continue
+
+        if delta > 0:
+            cost, value_delta = costing.receive(db, inv, delta)
+            db.add(_kardex_in(inv, delta, cost, KardexMoveType.ADJUST, note))
+        else:
+            cost, value_delta = costing.issue(db, inv, -delta)
+            db.add(_kardex_out(inv, -delta, cost, out_move_type, note))
+
+        qty_total += delta
+        value_total += value_delta
+        lines.append({"product_id": pid, "before": before, "counted": counted, "delta": delta})
+
+    if lines:
+        valuation.apply_delta(
+            db,
+            company_id=company_id,
+            location_type=location_type,
+            location_id=location_id,
+            qty_delta=qty_total,
+            value_delta=value_total,
+        )
+    db.flush()
+    return lines
+
+
+def _balance_at(db: Session, K, *, company_id: int, product_id: int, location_id: int, ts: datetime) -> Optional[Decimal]:
+    """Saldo en `ts` según una tabla de kardex (viva o archivo). None si no hay movimientos."""
+    base = db.query(K).filter(K.company_id == company_id, K.product_id == product_id)
+
+    # Último movimiento <= ts (como origen o como destino)
+    last = []
+    for col, bal in ((K.from_location_id, K.from_balance_after), (K.to_location_id, K.to_balance_after)):
+        r = (
+            base.with_entities(K.created_at, K.id, bal)
+            .filter(col == location_id, K.created_at <= ts)
+            .order_by(K.created_at.desc(), K.id.desc())
+            .first()
+        )
+        if r:
+            last.append(r)
+    if last:
+        _, _, bal = max(last, key=lambda r: (r[0], r[1]))
+        return Decimal(str(bal or 0)).quantize(Decimal("0.001"))
+
+    # Sin movimientos previos: saldo antes del primer movimiento posterior
+    # (un OPENING de archivo ya es el saldo de antes del corte)
+    first = []
+    for col, bal, sign in (
+        (K.from_location_id, K.from_balance_after, -1),
+        (K.to_location_id, K.to_balance_after, 1),
+    ):
+        r = (
+            base.with_entities(K.created_at, K.id, bal, K.qty, K.move_type)
+            .filter(col == location_id, K.created_at > ts)
+            .order_by(K.created_at.asc(), K.id.asc())
+            .first()
+        )
+        if r:
+            after = Decimal(str(r[2] or 0))
+            before = after if r[4] == KardexMoveType.OPENING else after - sign * Decimal(str(r[3] or 0))
+            first.append((r[0], r[1], before))
+    if first:
+        _, _, bal = min(first, key=lambda r: (r[0], r[1]))
+        return bal.quantize(Decimal("0.001"))
+    return None
+
+
+def stock_as_of(
+    db: Session,
+    *,
+    company_id: int,
+    product_id: int,
+    location_id: int,
+    ts: datetime
+) -> Decimal:
+    """
+    Stock de (producto, ubicación) al momento `ts` (incluye movimientos en `ts`).
+    Lee el saldo guardado en el último movimiento anterior: búsquedas indexadas,
+    sin sumar la historia. Antes del horizonte de archivo consulta el archivo.
+    """
+    key = dict(company_id=company_id, product_id=product_id, location_id=location_id, ts=ts)
+
+    h = kardex_archive.horizon(db, company_id=company_id)
+    if h and ts < h:
+        bal = _balance_at(db, KardexMovementArchive, **key)
+        if bal is not None:
+            return bal
+
+    bal = _balance_at(db, KardexMovement, **key)
+    if bal is not None:
+        return bal
+
+    # Nunca se movió: el stock actual es el de siempre
+    inv = (
+        db.query(Inventory.qty)
+        .filter_by(company_id=company_id, product_id=product_id, location_id=location_id)
+        .first()
+    )
+    return _to_qty(inv[0] if inv else 0)
+
+
+def rebuild_balances(db: Session, *, company_id: int, batch_size: int = 1000) -> int:
+    """
+    Recalcula from_/to_balance_after de todo el kardex de la empresa (backfill/reparación).
+    Recorre del más nuevo al más viejo partiendo del stock actual de cada ubicación,
+    así el saldo queda consistente con inventories aunque haya stock anterior al kardex.
+    Devuelve movimientos actualizados.
+    """
+    balance: dict[tuple[int, int], Decimal] = {
+        (int(pid), int(loc)): Decimal(str(qty or 0))
+        for pid, loc, qty in db.query(Inventory.product_id, Inventory.location_id, Inventory.qty)
+        .filter(Inventory.company_id == company_id)
+    }
+
+    K = KardexMovement
+    pending: list[dict] = []
+    q = (
+        db.query(K.id, K.product_id, K.from_location_id, K.to_location_id, K.qty)
+        .filter(K.company_id == company_id)
+        .order_by(K.created_at.desc(), K.id.desc())
+        .yield_per(batch_size)
+    )
+    for mid, pid, from_id, to_id, qty in q:
+        qty = Decimal(str(qty or 0))
+        row = {"id": mid, "from_balance_after": None, "to_balance_after": None}
+        if to_id is not None:
+            key = (int(pid), int(to_id))
+            row["to_balance_after"] = balance.get(key, Decimal("0"))
+            balance[key] = row["to_balance_after"] - qty
+        if from_id is not None:
+            key = (int(pid), int(from_id))
+            row["from_balance_after"] = balance.get(key, Decimal("0"))
+            balance[key] = row["from_balance_after"] + qty
+        pending.append(row)
+
+    for i in range(0, len(pending), batch_size):
+        db.execute(update(K), pending[i:i + batch_size])
+    db.flush()
+    return len(pending)
@@ -0,0 +1,245 @@
+"""Sesiones de conteo físico con ingesta de escaneos por lotes.
+
+- open_count: foto del stock esperado de la ubicación (INSERT ... SELECT).
+- ingest_scans: lotes JSON de handhelds; se agregan en memoria por código,
+  se resuelven en un IN y se suman a las líneas con UPDATE atómicos
+  (varios equipos pueden escanear a la vez).
+- close_count: diferencias (contado - esperado) aplicadas sobre el stock actual
+  en un solo lote vía services.stock.apply_counts.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Optional
+
+from sqlalchemy import bindparam, func, literal, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.inventory import Inventory, LocationType
+from models.kardex import KardexMoveType
+from models.stock_count import StockCount, StockCountLine, StockCountStatus
+from services.products import resolve_codes
+from services.stock import apply_counts
+
+_QTY_Q = Decimal("0.001")
+
+
+def open_count(
+    db: Session,
+    *,
+    company_id: int,
+    location_type: str,
+    location_id: int,
+    user_id: Optional[int] = None,
+    note: Optional[str] = None
+) -> StockCount:
+    """Abre una sesión y fotografía el esperado de cada producto con fila de inventario."""
+    if location_type not in LocationType.ALL:
+        raise ValueError("location_type inválido")
+
+    busy = (
+        db.query(StockCount.id)
+        .filter(
+            StockCount.company_id == company_id,
+            StockCount.location_id == location_id,
+            StockCount.status == StockCountStatus.OPEN,
+        )
+        .first()
+    )
+    if busy:
+        raise ValueError(f"Ya hay un conteo abierto en esta ubicación (#{busy.id}).")
+
+    sc = StockCount(
+        company_id=company_id,
+        location_type=location_type,
+        location_id=location_id,
+        status=StockCountStatus.OPEN,
+        note=note,
+        scan_count=0,
+        opened_by_user_id=user_id,
+    )
+    db.add(sc)
+    db.flush()
+
+    sel = db.query(
+        literal(sc.id), Inventory.product_id, Inventory.qty, func.current_timestamp(),
+    ).filter(
+        Inventory.company_id == company_id,
+        Inventory.location_type == location_type,
+        Inventory.location_id == location_id,
+    )
+    db.execute(
+        StockCountLine.__table__.insert().from_select(
+            ["count_id", "product_id", "expected_qty", "updated_at"], sel.statement
+        )
+    )
+    db.flush()
+    return sc
+
+
+def _parse_scans(scans: Iterable) -> tuple[dict[str, Decimal], dict[str, int], list]:
+    """
+    Acepta ["código", ...] o [{"code": ..., "qty": ...}, ...] (qty default 1).
+    Devuelve ({código: qty total}, {código: n° de escaneos}, rechazados).
+    """
+    totals: dict[str, Decimal] = defaultdict(lambda: Decimal("0.000"))
+    hits: dict[str, int] = defaultdict(int)
+    rejected = []
+    for s in scans or []:
+        if isinstance(s, dict):
+            code, raw_qty = s.get("code"), s.get("qty", 1)
+        else:
+            code, raw_qty = s, 1
+        code = str(code or "").strip()
+        try:
+            qty = Decimal(str(raw_qty).replace(",", ".")).quantize(_QTY_Q)
+        except (InvalidOperation, ValueError):
+            qty = Decimal("-1")
+        if not code or qty <= 0:
+            rejected.append(s)
+            continue
+        totals[code] += qty
+        hits[code] += 1
+    return dict(totals), dict(hits), rejected
+
+
+def ingest_scans(db: Session, *, count: StockCount, scans: Iterable) -> dict:
+    """
+    Suma un lote de escaneos a la sesión. Pocas sentencias por lote sin importar
+    cuántos escaneos traiga: un IN para resolver códigos, uno para las líneas,
+    un UPDATE executemany para sumar y un INSERT para productos nuevos.
+    """
+    if count.status != StockCountStatus.OPEN:
+        raise ValueError("El conteo no está abierto.")
+
+    totals, hits, rejected = _parse_scans(scans)
+    codes = resolve_codes(db, company_id=count.company_id, codes=totals.keys())
+
+    by_product: dict[int, Decimal] = defaultdict(lambda: Decimal("0.000"))
+    unknown = []
+    for code, qty in totals.items():
+        pid = codes.get(code)
+        if pid is None:
+            unknown.append(code)
+        else:
+            by_product[pid] += qty
+
+    if by_product:
+        _add_to_lines(db, count, by_product)
+
+    accepted = sum(n for code, n in hits.items() if code not in unknown)
+    if accepted:
+        db.query(StockCount).filter(StockCount.id == count.id).update(
+            {StockCount.scan_count: StockCount.scan_count + accepted},
+            synchronize_session=False,
+        )
+    db.flush()
+    return {
+        "accepted": accepted,
+        "products": len(by_product),
+        "unknown": unknown,
+        "rejected": len(rejected),
+    }
+
+
+def _add_to_lines(db: Session, count: StockCount, by_product: dict[int, Decimal]) -> None:
+    T = StockCountLine.__table__
+    now = datetime.utcnow()
+    pids = list(by_product.keys())
+
+    existing = set()
+    for i in range(0, len(pids), 500):
+        existing.update(
+            pid for (pid,) in db.query(StockCountLine.product_id).filter(
+                StockCountLine.count_id == count.id, StockCountLine.product_id.in_(pids[i:i + 500])
+            )
+        )
+
+    # Productos sin foto (no tenían inventario al abrir): esperado 0
+    new_rows = [
+        {"count_id": count.id, "product_id": pid, "expected_qty": Decimal("0.000"),
+         "counted_qty": Decimal("0.000"), "updated_at": now}
+        for pid in pids if pid not in existing
+    ]
+    if new_rows:
+        try:
+            with db.begin_nested():
+                db.execute(T.insert(), new_rows)
+        except IntegrityError:
+            # Otro equipo creó la línea al mismo tiempo: se suma abajo como existente
+            pass
+
+    db.execute(
+        update(T)
+        .where(T.c.count_id == count.id, T.c.product_id == bindparam("pid"))
+        .values(counted_qty=func.coalesce(T.c.counted_qty, 0) + bindparam("add"), updated_at=now),
+        [{"pid": pid, "add": qty} for pid, qty in by_product.items()],
+    )
+
+
+def close_count(
+    db: Session,
+    *,
+    count: StockCount,
+    user_id: Optional[int] = None,
+    out_move_type: str = KardexMoveType.ADJUST,
+    zero_missing: bool = False
+) -> int:
+    """
+    Cierra la sesión y aplica las diferencias en un solo lote de kardex.
+    Objetivo por producto = stock actual + (contado - esperado), así las ventas
+    hechas durante el conteo no se pierden. zero_missing: lo no contado cuenta 0
+    (toma completa); si no, se ignora (conteo cíclico).
+    Devuelve cuántas líneas generaron movimiento.
+    """
+    if count.status != StockCountStatus.OPEN:
+        raise ValueError("El conteo no está abierto.")
+
+    q = db.query(StockCountLine.product_id, StockCountLine.expected_qty, StockCountLine.counted_qty).filter(
+        StockCountLine.count_id == count.id
+    )
+    if not zero_missing:
+        q = q.filter(StockCountLine.counted_qty.isnot(None))
+    lines = q.all()
+
+    current = {
+        int(pid): Decimal(str(qty or 0))
+        for pid, qty in db.query(Inventory.product_id, Inventory.qty).filter(
+            Inventory.company_id == count.company_id,
+            Inventory.location_type == count.location_type,
+            Inventory.location_id == count.location_id,
+        )
+    }
+
+    targets = {}
+    for pid, expected, counted in lines:
+        variance = Decimal(str(counted or 0)) - Decimal(str(expected or 0))
+        if variance != 0:
+            targets[int(pid)] = max(current.get(int(pid), Decimal("0")) + variance, Decimal("0"))
+
+    applied = apply_counts(
+        db,
+        company_id=count.company_id,
+        location_type=count.location_type,
+        location_id=count.location_id,
+        counts=targets,
+        out_move_type=out_move_type,
+        note=f"Conteo físico #{count.id}",
+    ) if targets else []
+
+    count.status = StockCountStatus.CLOSED
+    count.closed_at = datetime.utcnow()
+    count.closed_by_user_id = user_id
+    count.lines_adjusted = len(applied)
+    db.flush()
+    return len(applied)
+
+
+def cancel_count(db: Session, *, count: StockCount, user_id: Optional[int] = None) -> None:
+    if count.status != StockCountStatus.OPEN:
+        raise ValueError("El conteo no está abierto.")
+    count.status = StockCountStatus.CANCELLED
+    count.closed_at = datetime.utcnow()
+    count.closed_by_user_id = user_id
+    db.flush()
@@ -0,0 +1,178 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+
+from models.inventory import Inventory
+from models.valuation import (
+    InventoryValuation,
+    InventoryValuationSnapshot,
+    InventoryValuationSnapshotLine,
+)
+from services.costing import MONEY_Q, QTY_Q
+
+
+# Mismos cuantos que Inventory.stock_value / qty (services.costing): los totales
+# son la suma exacta de las filas de inventario, sin deriva por redondeo
+def _money(val) -> Decimal:
+    return Decimal(str(val or 0)).quantize(MONEY_Q)
+
+
+def _qty(val) -> Decimal:
+    return Decimal(str(val or 0)).quantize(QTY_Q)
+
+
+def get_or_create_valuation(
+    db: Session,
+    *,
+    company_id: int,
+    location_type: str,
+    location_id: int
+) -> InventoryValuation:
+    v = (
+        db.query(InventoryValuation)
+        .filter_by(company_id=company_id, location_type=location_type, location_id=location_id)
+        .first()
+    )
+    if not v:
+        v = InventoryValuation(
+            company_id=company_id,
+            location_type=location_type,
+            location_id=location_id,
+            qty_total=Decimal("0.000"),
+            value_total=Decimal("0.00"),
+        )
+        db.add(v)
+        db.flush()
+    return v
+
+
+def apply_delta(
+    db: Session,
+    *,
+    company_id: int,
+    location_type: str,
+    location_id: int,
+    qty_delta,
+    value_delta
+) -> InventoryValuation:
+    """Suma (o resta, con deltas negativos) al total valorizado de la ubicación."""
+    v = get_or_create_valuation(
+        db,
+        company_id=company_id,
+        location_type=location_type,
+        location_id=location_id,
+    )
+    v.qty_total = _qty(v.qty_total) + _qty(qty_delta)
+    v.value_total = _money(v.value_total) + _money(value_delta)
+    return v
+
+
+def _valued_inventory(db: Session, company_id: int):
+    """SELECT de (ubicación, producto, qty, costo promedio, valor) por inventario."""
+    return (
+        db.query(
+            Inventory.location_type,
+            Inventory.location_id,
+            Inventory.product_id,
+            Inventory.qty,
+            Inventory.avg_cost,
+            Inventory.stock_value,
+        )
+        .filter(Inventory.company_id == company_id, Inventory.qty != 0)
+    )
+
+
+def rebuild(db: Session, *, company_id: int) -> int:
+    """Recalcula los totales en vivo desde inventories (backfill / reparación)."""
+    db.query(InventoryValuation).filter(
+        InventoryValuation.company_id == company_id
+    ).delete(synchronize_session=False)
+
+    rows = (
+        db.query(
+            Inventory.location_type,
+            Inventory.location_id,
+            func.coalesce(func.sum(Inventory.qty), 0),
+            func.coalesce(func.sum(Inventory.stock_value), 0),
+        )
+        .filter(Inventory.company_id == company_id)
+        .group_by(Inventory.location_type, Inventory.location_id)
+        .all()
+    )
+    for loc_type, loc_id, qty, value in rows:
+        db.add(InventoryValuation(
+            company_id=company_id,
+            location_type=loc_type,
+            location_id=loc_id,
+            qty_total=_qty(qty),
+            value_total=_money(value),
+        ))
+    db.flush()
+    return len(rows)
+
+
+def location_totals(db: Session, *, company_id: int, location_id: Optional[int] = None) -> tuple[Decimal, Decimal]:
+    """(qty, valor) en vivo: lectura directa de los totales mantenidos."""
+    q = db.query(
+        func.coalesce(func.sum(InventoryValuation.qty_total), 0),
+        func.coalesce(func.sum(InventoryValuation.value_total), 0),
+    ).filter(InventoryValuation.company_id == company_id)
+    if location_id:
+        q = q.filter(InventoryValuation.location_id == location_id)
+    qty, value = q.first()
+    return _qty(qty), _money(value)
+
+
+def take_snapshot(
+    db: Session,
+    *,
+    company_id: int,
+    label: Optional[str] = None,
+    user_id: Optional[int] = None,
+    taken_at: Optional[datetime] = None
+) -> InventoryValuationSnapshot:
+    """
+    Foto del inventario valorizado: un INSERT ... SELECT de las líneas
+    (ubicación, producto) + totales. Las consultas históricas leen solo la foto,
+    sin reconstruir desde kardex.
+    """
+    snap = InventoryValuationSnapshot(
+        company_id=company_id,
+        label=label,
+        taken_at=taken_at or datetime.utcnow(),
+        created_by_user_id=user_id,
+    )
+    db.add(snap)
+    db.flush()
+
+    sel = _valued_inventory(db, company_id).with_entities(
+        literal(snap.id),
+        Inventory.location_type,
+        Inventory.location_id,
+        Inventory.product_id,
+        Inventory.qty,
+        Inventory.avg_cost,
+        Inventory.stock_value,
+    )
+    db.execute(
+        InventoryValuationSnapshotLine.__table__.insert().from_select(
+            ["snapshot_id", "location_type", "location_id", "product_id", "qty", "unit_cost", "value"],
+            sel.statement,
+        )
+    )
+
+    qty, value = (
+        db.query(
+            func.coalesce(func.sum(InventoryValuationSnapshotLine.qty), 0),
+            func.coalesce(func.sum(InventoryValuationSnapshotLine.value), 0),
+        )
+        .filter(InventoryValuationSnapshotLine.snapshot_id == snap.id)
+        .first()
+    )
+    snap.qty_total = _qty(qty)
+    snap.value_total = _money(value)
+    db.flush()
+    return snap